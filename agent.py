@@ -1,10 +1,34 @@
 # agent.py (Modified for Structured List Output)
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, Annotated, Optional
 from langgraph.graph import StateGraph, END
-from tool import search_questions_for_concept, generate_similar_question
-import math
-import json
+from tool import search_questions_for_concepts, get_template, generate_similar_question, generate_similar_questions
+from concept_weight import concepts_for_paper
+from question_pool import get_question_pool
+from question_schema import normalize_question, SchemaError
+from dedup import get_question_history
+from checkpoints import get_generation_journal
+from concurrent.futures import ThreadPoolExecutor
+import os
 import re
+import uuid
+
+# --- Concurrent generation engine ---
+# One pool shared by every subject so the total number of in-flight provider calls stays
+# bounded; the token bucket in tool.py decides how fast they are actually released.
+MAX_GENERATION_WORKERS = int(os.getenv("MAX_GENERATION_WORKERS", "8"))
+_generation_pool = ThreadPoolExecutor(max_workers=MAX_GENERATION_WORKERS, thread_name_prefix="question-gen")
+# Templates sent to the provider per request; 1 restores one prompt per question
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "5"))
+
+# Papers are assembled from the pre-generated question pool first; only the shortfall is
+# generated live. Set QUESTION_POOL_ENABLED=0 to always generate from scratch.
+QUESTION_POOL_ENABLED = os.getenv("QUESTION_POOL_ENABLED", "1") == "1"
+
+# Near-duplicate questions (within the paper and against the user's earlier papers) are
+# regenerated up to DEDUP_MAX_REGENERATIONS times; after that the last candidate is kept (and
+# logged) so the paper still matches its blueprint. DEDUP_ENABLED=0 turns it off.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_MAX_REGENERATIONS = int(os.getenv("DEDUP_MAX_REGENERATIONS", "2"))
 
 # This TypedDict represents the structure of the final output, but it's no longer used for single questions.
 class PaperData(TypedDict):
@@ -18,13 +42,31 @@ class PaperData(TypedDict):
     correct_answer: List[str]
     explanation: List[str]
 
+def _merge_subject_questions(left: Dict[str, List[Dict[str, Any]]],
+                             right: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Reducer that lets parallel subject branches each contribute their own key."""
+    merged = dict(left or {})
+    merged.update(right or {})
+    return merged
+
 class PaperGenerationState(TypedDict):
     # Input
     paper_structure: Dict[str, Any]
     weak_concepts : Dict[str, Any]
+    # Who the paper is for; pooled questions are never served twice to the same user
+    user_id: Optional[str]
+    # Key of the near-duplicate index for this paper (the user id, or a per-run key)
+    dedup_key: str
     
     # State for processing
-    subjects_to_process: List[str]           
+    subjects_to_process: List[str]
+    # subject -> concept -> number of questions / template row ids, filled in by plan_paper
+    question_allocation: Dict[str, Dict[str, int]]
+    template_ids: Dict[str, Dict[str, List[int]]]
+    # subject -> concept -> questions taken from the pool, generated live only for the rest
+    pooled_questions: Dict[str, Dict[str, List[Dict[str, Any]]]]
+    # Questions per subject, written concurrently by the subject branches
+    subject_questions: Annotated[Dict[str, List[Dict[str, Any]]], _merge_subject_questions]
     
     # Final Output - A dictionary of lists containing all question data.
     final_paper: PaperData
@@ -32,17 +74,171 @@ class PaperGenerationState(TypedDict):
 
     
 # --- Nodes for the Workflow ---
-def plan_paper(state: PaperGenerationState):
-    """Initializes the subject-by-subject processing plan and the final output structure."""
+# Callers can observe generation by passing config={"configurable": {"on_event": fn}} to
+# invoke; fn receives {"type": "plan", ...} once and {"type": "question", ...} per question.
+def _emit(config: Optional[Dict[str, Any]], event: Dict[str, Any]) -> None:
+    on_event = ((config or {}).get("configurable") or {}).get("on_event")
+    if on_event is None:
+        return
+    try:
+        on_event(event)
+    except Exception as e:
+        print(f"Warning: progress callback failed: {e}")
+
+PAPER_KEYS = ["question_number", "subject", "concept", "weightage", "question_text",
+              "options", "difficulty", "correct_answer", "explanation"]
+
+def plan_paper(state: PaperGenerationState, config: Optional[Dict[str, Any]] = None):
+    """
+    Initializes the subject-by-subject processing plan: allocates questions to
+    concepts, takes what it can from the question pool and retrieves templates
+    for the remainder of the paper in one batched search.
+    """
     print("---PLANNING THE PAPER BY SUBJECT---")
     subjects = list(state['paper_structure'].keys())
-    # Initialize final_paper with empty lists for each key
-    initial_paper_structure: PaperData = {
-        "question_number": [], "subject": [], "concept": [], "weightage": [],
-        "question_text": [], "options": [], "difficulty": [],
-        "correct_answer": [], "explanation": []
+    weak = state.get("weak_concepts") or []
+    user_id = state.get("user_id")
+    dedup_key = user_id or f"run:{uuid.uuid4()}"
+    _load_history(dedup_key, user_id)
+
+    question_allocation = {}
+    pooled_questions = {}
+    shortfall: Dict[str, Dict[str, int]] = {}
+    concept_totals: Dict[str, int] = {}
+    for subject in subjects:
+        subject_details = state['paper_structure'][subject]
+        allocation = _distribute_questions(subject_details['concepts'], subject_details['total_questions'], weak)
+        question_allocation[subject] = allocation
+        print(f"  - [{subject}] Calculated Question Allocation (Target): {allocation}")
+        pooled_questions[subject] = {}
+        shortfall[subject] = {}
+        for concept, n in allocation.items():
+            if n <= 0:
+                continue
+            pooled = _take_from_pool(user_id, dedup_key, subject, concept, int(n))
+            if pooled:
+                pooled_questions[subject][concept] = pooled
+            missing = int(n) - len(pooled)
+            shortfall[subject][concept] = missing
+            if missing > 0:
+                concept_totals[concept] = concept_totals.get(concept, 0) + missing
+
+    pooled_count = sum(len(qs) for by_concept in pooled_questions.values() for qs in by_concept.values())
+    print(f"  - Served {pooled_count} questions from the pool; generating the rest live.")
+
+    try:
+        found = search_questions_for_concepts(concept_totals) if concept_totals else {}
+    except Exception as e:
+        print(f"Template retrieval failed: {e}")
+        found = {}
+
+    # Hand each subject its share of the retrieved rows (a concept may appear in several subjects)
+    offsets = {c: 0 for c in concept_totals}
+    template_ids = {}
+    for subject in subjects:
+        template_ids[subject] = {}
+        for concept, n in shortfall[subject].items():
+            if n <= 0:
+                continue
+            row_ids = [int(i) for i in found.get(concept, [])]
+            template_ids[subject][concept] = row_ids[offsets[concept]:offsets[concept] + n]
+            offsets[concept] += n
+
+    _emit(config, plan_event({"template_ids": template_ids, "pooled_questions": pooled_questions}))
+
+    return {
+        "subjects_to_process": subjects,
+        "weak_concepts": weak,
+        "question_allocation": question_allocation,
+        "template_ids": template_ids,
+        "pooled_questions": pooled_questions,
+        "dedup_key": dedup_key,
+    }
+
+def plan_event(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The "plan" progress event for a planned state: questions expected per subject."""
+    pooled_questions = state.get("pooled_questions") or {}
+    return {
+        "type": "plan",
+        "totals": {
+            subject: sum(len(ids) for ids in by_concept.values())
+                     + sum(len(qs) for qs in pooled_questions.get(subject, {}).values())
+            for subject, by_concept in (state.get("template_ids") or {}).items()
+        },
     }
-    return {"subjects_to_process": subjects, "weak_concepts": state["weak_concepts"],"final_paper": initial_paper_structure}
+
+def _take_from_pool(user_id: Optional[str], dedup_key: Optional[str],
+                    subject: str, concept: str, n: int) -> List[Dict[str, Any]]:
+    """
+    Up to `n` pooled questions that pass the duplicate check. Only accepted
+    questions are recorded as served, so a rejected one stays available.
+    """
+    if not QUESTION_POOL_ENABLED:
+        return []
+    try:
+        pool = get_question_pool()
+        # A few spare candidates stand in for the ones the duplicate check rejects
+        accepted = []
+        for question_id, question in pool.candidates(user_id, subject, concept, 2 * n):
+            if len(accepted) == n:
+                break
+            if _claim(dedup_key, user_id, question):
+                accepted.append((question_id, question))
+        pool.mark_served(user_id, [question_id for question_id, _ in accepted])
+        return [question for _, question in accepted]
+    except Exception as e:
+        print(f"Question pool lookup failed for {concept}: {e}")
+        return []
+
+def _load_history(dedup_key: str, user_id: Optional[str]) -> None:
+    if not DEDUP_ENABLED:
+        return
+    try:
+        get_question_history().index_for(dedup_key, user_id)
+    except Exception as e:
+        print(f"Could not load question history: {e}")
+
+def _claim(dedup_key: Optional[str], user_id: Optional[str], question: Dict[str, Any]) -> bool:
+    """False if the question near-duplicates one already in this paper or the user's history."""
+    if not DEDUP_ENABLED or not dedup_key:
+        return True
+    try:
+        return get_question_history().claim(dedup_key, user_id, question["question_text"])
+    except Exception as e:
+        print(f"Duplicate check failed, keeping the question: {e}")
+        return True
+
+# Runs invoked with a thread_id journal each generated question, so a resumed run
+# (same thread_id) regenerates only the questions that were still missing.
+def _thread_id(config: Optional[Dict[str, Any]]) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+def _journaled(config: Optional[Dict[str, Any]], subject: str) -> Dict[int, Dict[str, Any]]:
+    thread_id = _thread_id(config)
+    if not thread_id:
+        return {}
+    try:
+        return get_generation_journal().completed(thread_id, subject)
+    except Exception as e:
+        print(f"Could not read the generation journal: {e}")
+        return {}
+
+def _journal(config: Optional[Dict[str, Any]], subject: str, position: int, question: Dict[str, Any]) -> None:
+    thread_id = _thread_id(config)
+    if not thread_id:
+        return
+    try:
+        get_generation_journal().record(thread_id, subject, position, question)
+    except Exception as e:
+        print(f"Could not journal a generated question: {e}")
+
+def _add_to_pool(question: Dict[str, Any], user_id: Optional[str] = None) -> None:
+    if not QUESTION_POOL_ENABLED:
+        return
+    try:
+        get_question_pool().add(question["subject"], question["concept"], question, served_to=user_id)
+    except Exception as e:
+        print(f"Could not add question to the pool: {e}")
 
 # The format_single_question_with_gemini function has been removed.
 def _distribute_questions(concepts: Dict[str, float],
@@ -50,9 +246,11 @@ def _distribute_questions(concepts: Dict[str, float],
                           weak: Dict[str, Any],
                           boost: float = 2.0) -> Dict[str, int]:
     # ↑ extra args: weak concepts & boost factor
-    # bump weight for weak concepts
+    # `weak` maps concepts to continuous focus multipliers (mastery.focus_weights);
+    # a plain list of weak concepts bumps each of them by `boost`
+    multipliers = weak if isinstance(weak, dict) else {c: boost for c in weak}
     adj_weights = {
-        c: w * boost if c in weak else w
+        c: w * float(multipliers.get(c, 1.0))
         for c, w in concepts.items()
     }
 
@@ -69,191 +267,258 @@ def _distribute_questions(concepts: Dict[str, float],
         counts[c] += 1
     return counts
 
-def _extract_json_object(s: str) -> str:
+def _generate_parts(concept: str, row, avoid: Optional[str] = None) -> Dict[str, Any] | None:
     """
-    Try to extract the first top-level JSON object from a string.
-    Handles code fences and extra prose. Returns the JSON substring or raises.
+    Generates and validates a single question from a template row, different
+    from `avoid` if given. Answers that fail the schema are regenerated inside
+    generate_similar_question; returns None when the question still has to be
+    skipped.
     """
-    if not isinstance(s, str):
-        raise ValueError("Expected string for JSON extraction")
+    try:
+        raw_parts = generate_similar_question(
+            original_question_text=row.get('question', ''),
+            difficulty=row.get('difficulty', ''),
+            concept=concept,
+            avoid=avoid,
+        )
+
+        # Show a short preview for debugging
+        preview = str(raw_parts)
+        preview = preview[:200].replace("\n", " ")
+        print("    Provider output preview:", preview)
+
+        return normalize_question(raw_parts)
+
+    except SchemaError as se:
+        print(f"Skipping question that failed validation: {se}")
+    except Exception as e:
+        print(f"Skipping a single question generation due to error: {e}")
+    return None
+
+def _build_question(subject: str, concept: str, row, weightage: float,
+                    generated_parts: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "subject": subject,
+        "concept": concept,
+        "weightage": weightage,
+        "difficulty": row.get('difficulty', ''),
+        "question_text": generated_parts.get("question_text", "Error: Not generated"),
+        "options": generated_parts.get("options", {}),
+        "correct_answer": generated_parts.get("correct_answer", "N/A"),
+        "explanation": generated_parts.get("explanation", "N/A"),
+    }
 
-    # Remove common Markdown code fences
-    s_clean = re.sub(r"^\s*``````\s*$", "", s.strip())
+def _generate_batch_parts(items: List[tuple]) -> List[Dict[str, Any] | None]:
+    """
+    Generates parts for several (concept, row) items with one batched request.
+    Only the items that are missing from the response or fail validation are
+    regenerated, each with a single-question prompt; returns None for items
+    that still fail, so broken questions never reach the paper.
+    """
+    if len(items) == 1:
+        concept, row = items[0]
+        return [_generate_parts(concept, row)]
 
-    # If the whole thing is a JSON object already, try directly
     try:
-        obj = json.loads(s_clean)
-        return s_clean
-    except Exception:
-        pass
-
-    # Otherwise, scan for a top-level {...} block
-    depth = 0
-    start = -1
-    for i, ch in enumerate(s_clean):
-        if ch == '{':
-            if depth == 0:
-                start = i
-            depth += 1
-        elif ch == '}':
-            depth -= 1
-            if depth == 0 and start != -1:
-                candidate = s_clean[start:i+1]
-                # validate
-                json.loads(candidate)
-                return candidate
-    raise ValueError("No valid top-level JSON object found")
-
-def _coerce_to_parts(raw):
+        raw_items = generate_similar_questions([
+            {"question": row.get('question', ''), "difficulty": row.get('difficulty', ''), "concept": concept}
+            for concept, row in items
+        ])
+    except Exception as e:
+        print(f"Batched generation failed: {e}. Falling back to single prompts.")
+        raw_items = []
+
+    raw_items = list(raw_items)[:len(items)]
+    raw_items += [None] * (len(items) - len(raw_items))
+    results = []
+    for (concept, row), raw in zip(items, raw_items):
+        try:
+            parts = normalize_question(raw)
+        except SchemaError as se:
+            print(f"    Regenerating one {concept} question on its own ({se}).")
+            parts = _generate_parts(concept, row)
+        results.append(parts)
+    return results
+
+def _generate_batch(subject: str, items: List[tuple], config: Optional[Dict[str, Any]] = None,
+                    user_id: Optional[str] = None, dedup_key: Optional[str] = None) -> List[Dict[str, Any] | None]:
     """
-    Accepts various provider outputs and returns a dict with:
-    question_text, options, correct_answer, explanation.
-    Handles dict, list, and raw string (JSON inside).
+    Generation job for a batch of (concept, row, weightage, position) items: builds
+    the question entries, regenerates near-duplicates (keeping the last one if
+    they all are), adds them to the pool as already served to `user_id`, and
+    emits each one as soon as its batch is ready. `position` is the question's
+    place within its subject.
     """
-    # Already dict (ideal)
-    if isinstance(raw, dict):
-        return {
-            "question_text": raw.get("question_text") or raw.get("text") or "",
-            "options": raw.get("options") or {},
-            "correct_answer": raw.get("correct_answer") or raw.get("answer") or "",
-            "explanation": raw.get("explanation") or raw.get("rationale") or ""
-        }
-
-    # List cases
-    if isinstance(raw, list):
-        if raw and isinstance(raw[0], dict):
-            cand = raw[0]
-            return {
-                "question_text": cand.get("question_text") or cand.get("text") or "",
-                "options": cand.get("options") or {},
-                "correct_answer": cand.get("correct_answer") or cand.get("answer") or "",
-                "explanation": cand.get("explanation") or cand.get("rationale") or ""
-            }
-        q = raw[0] if len(raw) > 0 else ""
-        opts = raw[1] if len(raw) > 1 and isinstance(raw[1], dict) else {}
-        ans = raw[2] if len(raw) > 2 else ""
-        exp = raw[3] if len(raw) > 3 else ""
-        return {"question_text": q, "options": opts, "correct_answer": ans, "explanation": exp}
-
-    # Raw string: try to extract JSON; if not, treat as question text
-    if isinstance(raw, str):
-        try:
-            json_str = _extract_json_object(raw)
-            obj = json.loads(json_str)
-            return _coerce_to_parts(obj)
-        except Exception as e:
-            # Fallback: use the raw string as question_text
-            preview = raw[:120].replace("\n", " ")
-            print(f"Warning: could not parse JSON from model output; using raw text. Preview: {preview}")
-            return {"question_text": raw, "options": {}, "correct_answer": "", "explanation": ""}
-
-    # Unknown type
-    return {"question_text": "", "options": {}, "correct_answer": "", "explanation": ""}
-
-def process_subject(state: PaperGenerationState):
+    all_parts = _generate_batch_parts([(concept, row) for concept, row, _, _ in items])
+    questions = []
+    for (concept, row, weightage, position), generated_parts in zip(items, all_parts):
+        question = candidate = None
+        for attempt in range(DEDUP_MAX_REGENERATIONS + 1):
+            if attempt:
+                print(f"    Near-duplicate {concept} question; regenerating (attempt {attempt}).")
+                generated_parts = _generate_parts(concept, row, avoid=candidate["question_text"]) or generated_parts
+            if generated_parts is None:
+                break
+            candidate = _build_question(subject, concept, row, weightage, generated_parts)
+            if _claim(dedup_key, user_id, candidate):
+                question = candidate
+                break
+        if question is None and candidate is not None:
+            print(f"    Keeping a near-duplicate {concept} question after {DEDUP_MAX_REGENERATIONS} regenerations.")
+            question = candidate
+        if question is None:
+            questions.append(None)
+            continue
+        _journal(config, subject, position, question)
+        _add_to_pool(question, user_id)
+        _emit(config, {"type": "question", "subject": subject, "position": position, "question": question})
+        questions.append(question)
+    return questions
+
+def _submit_batches(subject: str, items: List[tuple], config: Optional[Dict[str, Any]] = None,
+                    user_id: Optional[str] = None, dedup_key: Optional[str] = None) -> List[Dict[str, Any] | None]:
+    """Splits items into GENERATION_BATCH_SIZE requests on the shared pool; results keep item order."""
+    size = max(1, GENERATION_BATCH_SIZE)
+    futures = [
+        _generation_pool.submit(_generate_batch, subject, items[i:i + size], config, user_id, dedup_key)
+        for i in range(0, len(items), size)
+    ]
+    return [question for future in futures for question in future.result()]
+
+def process_subject(state: PaperGenerationState, subject: str, config: Optional[Dict[str, Any]] = None):
     """
-    Processes a subject by generating structured question data and appending it
-    to the final_paper dictionary of lists. Robust to bad JSON and varied shapes.
+    Generates structured question data for one subject. Each subject runs as its
+    own graph branch; pooled questions are used as they are, the templates for
+    the rest are generated in batched requests running concurrently on the
+    shared pool, and everything is returned in allocation order. Robust to bad
+    JSON and varied shapes.
     """
-    print("---PROCESSING A SUBJECT---")
-
-    subjects_remaining = state['subjects_to_process']
-    current_subject_name = subjects_remaining[0]
-    next_subjects = subjects_remaining[1:]
+    print(f"---PROCESSING SUBJECT: {subject}---")
 
-    print(f"Current Subject: {current_subject_name}")
+    subject_details = state['paper_structure'].get(subject)
+    if not subject_details:
+        return {"subject_questions": {subject: []}}
 
-    subject_details = state['paper_structure'][current_subject_name]
-    subject_total_questions = subject_details['total_questions']
     subject_concepts = subject_details['concepts']
-
-    question_number = len(state['final_paper']['question_number']) + 1
-
-    weak = state["weak_concepts"]
-    question_allocation = _distribute_questions(
-        subject_concepts,
-        subject_total_questions,
-        weak
-    )
-    print(f"  - Calculated Question Allocation (Target): {question_allocation}")
-
+    question_allocation = state['question_allocation'].get(subject, {})
+    subject_templates = state['template_ids'].get(subject, {})
+    subject_pooled = (state.get('pooled_questions') or {}).get(subject, {})
+    user_id = state.get('user_id')
+    journaled = _journaled(config, subject)
+    if journaled:
+        print(f"  - [{subject}] Resuming: {len(journaled)} questions already generated.")
+
+    # Pooled and journaled questions are ready immediately; every remaining (concept,
+    # template row) becomes an item for the batched generation jobs. `slots` keeps
+    # allocation order: a ready question, or the index of the item that will produce it.
+    slots = []
+    items = []
     for concept, num_questions_to_generate in question_allocation.items():
         if num_questions_to_generate == 0:
             continue
 
-        print(f"  - Concept: {concept} -> Generating {num_questions_to_generate} new questions.")
+        weightage = subject_concepts.get(concept, 0) if isinstance(subject_concepts, dict) else 0
+        pooled = subject_pooled.get(concept, [])
+        for question in pooled:
+            question = {**question, "subject": subject, "concept": concept, "weightage": weightage}
+            _emit(config, {"type": "question", "subject": subject, "position": len(slots), "question": question})
+            slots.append(question)
 
-        retrieved_templates_df = search_questions_for_concept(concept, int(num_questions_to_generate))
-        if retrieved_templates_df.empty:
+        row_ids = subject_templates.get(concept, [])
+        print(f"  - [{subject}] Concept: {concept} -> {len(pooled)} from the pool, generating {len(row_ids)} new questions.")
+        if not row_ids and len(pooled) < num_questions_to_generate:
             print(f"    No template questions retrieved for concept: {concept}. Skipping.")
             continue
 
-        for _, row in retrieved_templates_df.iterrows():
-            try:
-                raw_parts = generate_similar_question(
-                    original_question_text=row.get('question', ''),
-                    difficulty=row.get('difficulty', ''),
-                    concept=concept
-                )
-
-                # Show a short preview for debugging
-                preview = str(raw_parts)
-                preview = preview[:200].replace("\n", " ")
-                print("    Provider output preview:", preview)
-
-                # Normalize robustly (handles JSON-in-string)
-                generated_parts = _coerce_to_parts(raw_parts)
-
-                weightage = subject_concepts.get(concept, 0) if isinstance(subject_concepts, dict) else 0
-
-                full_question_data = {
-                    "question_number": question_number,
-                    "subject": current_subject_name,
-                    "concept": concept,
-                    "weightage": weightage,
-                    "difficulty": row.get('difficulty', ''),
-                    "question_text": generated_parts.get("question_text", "Error: Not generated"),
-                    "options": generated_parts.get("options", {}),
-                    "correct_answer": generated_parts.get("correct_answer", "N/A"),
-                    "explanation": generated_parts.get("explanation", "N/A"),
-                }
-
-                for key, value in full_question_data.items():
-                    if key in state['final_paper']:
-                        state['final_paper'][key].append(value)
-
-                question_number += 1
-
-            except json.JSONDecodeError as je:
-                print(f"Skipping question due to JSON parse error: {je}")
-            except Exception as e:
-                print(f"Skipping a single question generation due to error: {e}")
+        for row_id in row_ids:
+            if len(slots) in journaled:
+                question = journaled[len(slots)]
+                _emit(config, {"type": "question", "subject": subject, "position": len(slots), "question": question})
+                slots.append(question)
+                continue
+            slots.append(len(items))
+            items.append((concept, get_template(row_id), weightage, len(slots) - 1))
 
-    return {
-        "final_paper": state["final_paper"],
-        "subjects_to_process": next_subjects,
-        "weak_concepts": weak
-    }
+    generated = _submit_batches(subject, items, config, user_id, state.get('dedup_key'))
+    results = (slot if isinstance(slot, dict) else generated[slot] for slot in slots)
+    questions = [q for q in results if q is not None]
 
-def should_continue_subjects(state: PaperGenerationState):
-    """Determines if there are more subjects to process."""
-    if not state['subjects_to_process']:
-        print("---DECISION: ALL SUBJECTS PROCESSED. FINISHING UP.---")
-        return "end"
-    else:
-        print(f"---DECISION: MORE SUBJECTS REMAIN. CONTINUING...---")
-        return "continue"
+    print(f"---FINISHED SUBJECT: {subject} ({len(questions)} questions)---")
+    return {"subject_questions": {subject: questions}}
+
+def generate_questions_for_concept(subject: str, concept: str, n: int) -> List[Dict[str, Any]]:
+    """
+    Runs the retrieval + generation pipeline for one concept outside of a paper.
+    Used by the pool replenisher; generated questions are returned, not pooled.
+    """
+    row_ids = search_questions_for_concepts({concept: n}).get(concept, [])
+    subject_concepts = concepts_for_paper.get(subject, {}).get("concepts", {})
+    weightage = subject_concepts.get(concept, 0)
+    rows = [get_template(int(row_id)) for row_id in row_ids]
+    all_parts = _generate_batch_parts([(concept, row) for row in rows]) if rows else []
+    return [
+        _build_question(subject, concept, row, weightage, generated_parts)
+        for row, generated_parts in zip(rows, all_parts)
+        if generated_parts is not None
+    ]
+
+def merge_paper(state: PaperGenerationState):
+    """
+    Joins the subject branches: lays subjects out in paper_structure order and
+    assigns global question numbers.
+    """
+    print("---MERGING SUBJECTS INTO THE FINAL PAPER---")
+    subject_questions = state.get("subject_questions") or {}
+    if DEDUP_ENABLED and not state.get("user_id") and state.get("dedup_key"):
+        get_question_history().release(state["dedup_key"])
+    final_paper: PaperData = {key: [] for key in PAPER_KEYS}
+
+    question_number = 1
+    for subject in state['paper_structure']:
+        if subject not in subject_questions:
+            print(f"Warning: no branch produced questions for subject: {subject}")
+            continue
+        for question in subject_questions[subject]:
+            final_paper["question_number"].append(question_number)
+            for key in PAPER_KEYS[1:]:
+                final_paper[key].append(question[key])
+            question_number += 1
+
+    return {"final_paper": final_paper}
+
+def _subject_node_name(subject: str) -> str:
+    return "process_" + re.sub(r"\W+", "_", subject).strip("_").lower()
+
+def _make_subject_node(subject: str):
+    def subject_node(state: PaperGenerationState, config: Optional[Dict[str, Any]] = None):
+        return process_subject(state, subject, config)
+    subject_node.__name__ = _subject_node_name(subject)
+    return subject_node
+
+def get_agent_graph(subjects: Optional[List[str]] = None, checkpointer=None):
+    """
+    Builds the paper workflow: plan_paper fans out to one branch per subject,
+    the branches run concurrently and merge_paper joins them. `subjects` defaults
+    to the subjects in concept_weight.concepts_for_paper. With a `checkpointer`,
+    runs invoked with config={"configurable": {"thread_id": ...}} can be resumed
+    by invoking the same thread_id again with None as input.
+    """
+    subjects = list(subjects or concepts_for_paper.keys())
 
-def get_agent_graph():
     workflow = StateGraph(PaperGenerationState)
     workflow.add_node("plan_paper", plan_paper)
-    workflow.add_node("process_subject", process_subject)
+    workflow.add_node("merge_paper", merge_paper)
     workflow.set_entry_point("plan_paper")
-    workflow.add_edge("plan_paper", "process_subject")
-    workflow.add_conditional_edges(
-        "process_subject",
-        should_continue_subjects,
-        {"continue": "process_subject", "end": END}
-    )
-    app = workflow.compile()
-    return app
\ No newline at end of file
+
+    branch_nodes = []
+    for subject in subjects:
+        node_name = _subject_node_name(subject)
+        workflow.add_node(node_name, _make_subject_node(subject))
+        workflow.add_edge("plan_paper", node_name)
+        branch_nodes.append(node_name)
+
+    # merge_paper waits for every subject branch before running
+    workflow.add_edge(branch_nodes, "merge_paper")
+    workflow.add_edge("merge_paper", END)
+    app = workflow.compile(checkpointer=checkpointer)
+    return app
@@ -0,0 +1,161 @@
+# analytics.py
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from data_access import DataAccess
+
+# Per-user rolling aggregates, kept at users/<uid>/analytics and updated with server-side
+# increments on every submitted test, so reading a summary costs the same for 1 or 500 tests.
+# The score series lives at users/<uid>/score_series under time-ordered keys.
+ANALYTICS_VERSION = 1
+ANALYTICS_SERIES_LENGTH = int(os.environ.get("ANALYTICS_SERIES_LENGTH", "50"))
+TIME_HISTOGRAM_BUCKET_SECONDS = int(os.environ.get("TIME_HISTOGRAM_BUCKET_SECONDS", "900"))
+
+_FORBIDDEN_KEY_CHARS = re.compile(r"[.$#\[\]/]")
+
+
+def _db_key(name: Any) -> str:
+    """Realtime Database keys cannot contain . $ # [ ] or /."""
+    return _FORBIDDEN_KEY_CHARS.sub("_", str(name)) or "_"
+
+
+def grade_answers(paper: Dict[str, Any], answers: Dict[str, Any]) -> List[bool]:
+    """
+    Whether each question was answered correctly. Answers hold the chosen
+    option's text, so they are compared with the value of the correct key.
+    """
+    correct_answer_keys = paper.get('correct_answer') or []
+    options_data = paper.get('options') or []
+    answers = answers or {}
+    graded = []
+    for index, correct_key in enumerate(correct_answer_keys):
+        options = options_data[index] if index < len(options_data) else None
+        correct_value = options.get(correct_key) if options and correct_key else None
+        user_answer = answers.get(str(index))
+        graded.append(correct_value is not None and user_answer == correct_value)
+    return graded
+
+
+def _series_key(result_id: str) -> str:
+    # Millisecond prefix keeps keys in submission order for order_by_key + limit_to_last
+    return f"{int(time.time() * 1000):013d}_{_db_key(result_id)[:8]}"
+
+
+def result_increments(paper: Dict[str, Any], graded: List[bool], time_spent: float) -> Dict[str, int]:
+    """The counter changes one graded test contributes, as relative paths -> amounts."""
+    counts: Counter = Counter()
+    counts["tests"] += 1
+    counts["questions"] += len(graded)
+    counts["correct"] += sum(graded)
+    counts["time_spent"] += int(time_spent or 0)
+    bucket = int(time_spent or 0) // TIME_HISTOGRAM_BUCKET_SECONDS * TIME_HISTOGRAM_BUCKET_SECONDS
+    # Prefixed: Firebase turns objects with mostly integer keys into arrays
+    counts[f"time_histogram/t{bucket}"] += 1
+    for group, field in (("subjects", "subject"), ("concepts", "concept"), ("difficulties", "difficulty")):
+        values = paper.get(field) or []
+        for index, correct in enumerate(graded):
+            if index < len(values) and values[index]:
+                key = _db_key(values[index])
+                counts[f"{group}/{key}/attempts"] += 1
+                counts[f"{group}/{key}/correct"] += int(correct)
+    return dict(counts)
+
+
+class AnalyticsAggregates:
+    """Maintains and serves the per-user aggregates."""
+
+    def __init__(self, database: Callable[[], Any], data_access: Optional[DataAccess] = None):
+        self._database = database
+        self._data_access = data_access or DataAccess(database)
+
+    def _ref(self, uid: str, *path: str):
+        return self._database().child("users").child(uid).child(*path)
+
+    def record(self, uid: str, result_id: str, paper: Dict[str, Any], graded: List[bool],
+               percentage: float, time_spent: float, completed_at: Optional[str]) -> None:
+        """
+        Folds one submitted test into the user's aggregates with a single
+        multi-path increment. Users whose aggregates predate this test (or do
+        not exist yet) are rebuilt from their stored results instead.
+        """
+        if self._ref(uid, "analytics", "version").get().val() != ANALYTICS_VERSION:
+            self.rebuild(uid)
+            return
+        increments = result_increments(paper, graded, time_spent)
+        self._ref(uid, "analytics").update({
+            path: {".sv": {"increment": amount}} for path, amount in increments.items()
+        })
+        self._ref(uid, "score_series", _series_key(result_id)).set({
+            "percentage": percentage,
+            "completed_at": completed_at,
+            "time_spent": time_spent,
+        })
+
+    def rebuild(self, uid: str) -> Dict[str, Any]:
+        """Recomputes the aggregates from every stored result (one-off, for existing users)."""
+        results = self._data_access.test_results_for_user(uid)
+        results.sort(key=lambda r: r.get('created_at') or '')
+        # Slim copies hold every field needed to grade a test and attribute each answer
+        papers = self._data_access.get_slim_papers(r.get('paper_id') for r in results)
+        totals: Counter = Counter()
+        series = {}
+        for index, result in enumerate(results):
+            paper = papers.get(result.get('paper_id')) or {}
+            graded = grade_answers(paper, result.get('answers'))
+            totals.update(result_increments(paper, graded, result.get('time_spent') or 0))
+            key = f"{index:013d}_{_db_key(result.get('result_id', index))[:8]}"
+            series[key] = {
+                "percentage": result.get('percentage', 0),
+                "completed_at": result.get('completed_at'),
+                "time_spent": result.get('time_spent') or 0,
+            }
+
+        aggregates: Dict[str, Any] = {"version": ANALYTICS_VERSION}
+        for path, amount in totals.items():
+            node = aggregates
+            *parents, leaf = path.split("/")
+            for part in parents:
+                node = node.setdefault(part, {})
+            node[leaf] = amount
+        self._ref(uid, "analytics").set(aggregates)
+        self._ref(uid, "score_series").set(dict(list(series.items())[-ANALYTICS_SERIES_LENGTH:]) or None)
+        return aggregates
+
+    def summary(self, uid: str) -> Dict[str, Any]:
+        """Compact analytics for one user: totals, per-group accuracy, time histogram and recent scores."""
+        aggregates = self._ref(uid, "analytics").get().val()
+        if not aggregates or aggregates.get("version") != ANALYTICS_VERSION:
+            aggregates = self.rebuild(uid)
+        series = self._ref(uid, "score_series").order_by_key().limit_to_last(ANALYTICS_SERIES_LENGTH).get().val() or {}
+
+        def accuracy(group):
+            return {
+                name: {
+                    "attempts": stats.get("attempts", 0),
+                    "correct": stats.get("correct", 0),
+                    "percentage": round(stats.get("correct", 0) / stats["attempts"] * 100, 2) if stats.get("attempts") else 0,
+                }
+                for name, stats in (aggregates.get(group) or {}).items()
+            }
+
+        tests = aggregates.get("tests", 0)
+        questions = aggregates.get("questions", 0)
+        return {
+            "total_tests": tests,
+            "total_questions": questions,
+            "total_correct": aggregates.get("correct", 0),
+            "average_percentage": round(aggregates.get("correct", 0) / questions * 100, 2) if questions else 0,
+            "average_time_spent": round(aggregates.get("time_spent", 0) / tests, 2) if tests else 0,
+            "subjects": accuracy("subjects"),
+            "concepts": accuracy("concepts"),
+            "difficulties": accuracy("difficulties"),
+            "time_histogram": {
+                "bucket_seconds": TIME_HISTOGRAM_BUCKET_SECONDS,
+                "counts": {int(k[1:]): v for k, v in sorted((aggregates.get("time_histogram") or {}).items(),
+                                                            key=lambda kv: int(kv[0][1:]))},
+            },
+            "score_series": [series[key] for key in sorted(series)],
+        }
@@ -0,0 +1,161 @@
+# checkpoints.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from resources import lazy_resource
+
+# Graph checkpoints and the per-question journal of paper runs, keyed by thread id
+# (<user>:<idempotency key>). A retried request with the same key resumes the run.
+CHECKPOINT_DB = os.environ.get("CHECKPOINT_DB", "paper_checkpoints.sqlite3")
+CHECKPOINT_RETENTION_SECONDS = float(os.environ.get("CHECKPOINT_RETENTION_SECONDS", str(24 * 3600)))
+PAPER_CHECKPOINTS = os.environ.get("PAPER_CHECKPOINTS", "1") == "1"
+# Expired runs are pruned when the journal loads and then at most this often as runs start
+CHECKPOINT_PRUNE_INTERVAL_SECONDS = float(os.environ.get("CHECKPOINT_PRUNE_INTERVAL_SECONDS", "3600"))
+# SqliteSaver tables keyed by thread_id (`writes` only exists in newer langgraph releases)
+SAVER_TABLES = ("checkpoints", "writes")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paper_threads (
+    thread_id TEXT PRIMARY KEY,
+    paper_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generation_journal (
+    thread_id TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    PRIMARY KEY (thread_id, subject, position)
+);
+"""
+
+
+class LockedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver on one shared connection. The graph writes checkpoints from its
+    executor threads, so reads take the saver's lock as well as writes.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        super().__init__(conn)
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_path(cls, path: str) -> "LockedSqliteSaver":
+        return cls(sqlite3.connect(path, timeout=30, check_same_thread=False))
+
+    @contextmanager
+    def cursor(self, transaction: bool = True):
+        with self.lock, super().cursor(transaction) as cur:
+            yield cur
+
+
+class GenerationJournal:
+    """
+    Every question generated for a paper run, stored as soon as it is accepted,
+    so a resumed run only generates what is still missing. Also remembers the
+    paper id a finished run was saved under.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB, prune_interval: float = CHECKPOINT_PRUNE_INTERVAL_SECONDS):
+        self.path = path
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._last_prune = time.time()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def start(self, thread_id: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO paper_threads (thread_id, created_at) VALUES (?, ?)",
+                (thread_id, now),
+            )
+        if now - self._last_prune >= self.prune_interval:
+            self._last_prune = now
+            try:
+                self.prune()
+            except Exception as e:
+                print(f"Could not prune expired paper runs: {e}")
+
+    def record(self, thread_id: str, subject: str, position: int, question: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO generation_journal (thread_id, subject, position, question) "
+                "VALUES (?, ?, ?, ?)",
+                (thread_id, subject, position, json.dumps(question)),
+            )
+
+    def completed(self, thread_id: str, subject: str) -> Dict[int, Dict[str, Any]]:
+        """Questions already generated for `subject` in this run, by position."""
+        rows = self._connect().execute(
+            "SELECT position, question FROM generation_journal WHERE thread_id = ? AND subject = ?",
+            (thread_id, subject),
+        ).fetchall()
+        return {position: json.loads(question) for position, question in rows}
+
+    def record_paper(self, thread_id: str, paper_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO paper_threads (thread_id, paper_id, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET paper_id = excluded.paper_id",
+                (thread_id, paper_id, time.time()),
+            )
+
+    def saved_paper(self, thread_id: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT paper_id FROM paper_threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def prune(self, max_age: float = CHECKPOINT_RETENTION_SECONDS) -> int:
+        """
+        Drops runs (journal, graph checkpoints and pending writes) older than
+        `max_age` seconds, and journal rows of runs that were never started.
+        Returns the number of runs dropped.
+        """
+        cutoff = time.time() - max_age
+        with self._connect() as conn:
+            old = "SELECT thread_id FROM paper_threads WHERE created_at < ?"
+            conn.execute(f"DELETE FROM generation_journal WHERE thread_id IN ({old})", (cutoff,))
+            conn.execute("DELETE FROM generation_journal WHERE thread_id NOT IN (SELECT thread_id FROM paper_threads)")
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table in SAVER_TABLES:
+                if table in tables:
+                    conn.execute(f"DELETE FROM {table} WHERE thread_id IN ({old})", (cutoff,))
+            return conn.execute("DELETE FROM paper_threads WHERE created_at < ?", (cutoff,)).rowcount
+
+
+def open_checkpointer() -> Optional[LockedSqliteSaver]:
+    """The graph checkpointer, or None when PAPER_CHECKPOINTS=0."""
+    if not PAPER_CHECKPOINTS:
+        return None
+    return LockedSqliteSaver.from_path(os.environ.get("CHECKPOINT_DB", CHECKPOINT_DB))
+
+
+def _load_generation_journal():
+    journal = GenerationJournal(os.environ.get("CHECKPOINT_DB", CHECKPOINT_DB))
+    pruned = journal.prune()
+    if pruned:
+        print(f"Pruned {pruned} expired paper runs.")
+    return journal
+
+_generation_journal = lazy_resource("generation_journal", _load_generation_journal)
+
+def get_generation_journal() -> GenerationJournal:
+    return _generation_journal.get()
@@ -0,0 +1,110 @@
+# concept_index.py
+import os
+from typing import List, Optional
+
+import numpy as np
+
+CANDIDATES_PER_CONCEPT = 20
+CONCEPT_INDEX_PATH = "concept_candidates.npz"
+
+
+class ConceptCandidateIndex:
+    """
+    Precomputed FAISS top-N template rows for every known concept, stored as two
+    compact arrays (ids int32 [C, N], distances float32 [C, N]) plus the concept
+    names. Lookups are a dict access; `sample` draws a different subset of the
+    candidates on each call, favouring the closest ones.
+    """
+
+    def __init__(self, concepts: List[str], ids: np.ndarray, distances: np.ndarray, index_ntotal: int = -1):
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.index_ntotal = int(index_ntotal)
+        self._rows = {c: i for i, c in enumerate(concepts)}
+        self._rng = np.random.default_rng()
+
+    @classmethod
+    def load(cls, path: str = CONCEPT_INDEX_PATH) -> Optional["ConceptCandidateIndex"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            data = np.load(path, allow_pickle=False)
+            table = cls([str(c) for c in data["concepts"]], data["ids"], data["distances"],
+                        int(data["index_ntotal"]))
+        except Exception as e:
+            print(f"Warning: could not load concept candidate index {path}: {e}")
+            return None
+        print(f"Loaded candidate templates for {len(table)} concepts from {path}")
+        return table
+
+    def save(self, path: str = CONCEPT_INDEX_PATH) -> None:
+        concepts = sorted(self._rows, key=self._rows.get)
+        np.savez(path, concepts=np.array(concepts), ids=self.ids, distances=self.distances,
+                 index_ntotal=np.array(self.index_ntotal))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, concept: str):
+        return concept in self._rows
+
+    def candidates(self, concept: str):
+        """Returns (ids, distances) for a known concept, closest first, or None."""
+        row = self._rows.get(concept)
+        if row is None:
+            return None
+        ids, distances = self.ids[row], self.distances[row]
+        valid = ids >= 0
+        return ids[valid], distances[valid]
+
+    def sample(self, concept: str, k: int, temperature: float = 1.0) -> Optional[np.ndarray]:
+        """
+        Draws `k` distinct candidate row ids for `concept`, weighted towards the
+        nearest templates. Returns None if the concept is unknown or has too few
+        candidates to satisfy the request.
+        """
+        found = self.candidates(concept)
+        if found is None:
+            return None
+        ids, distances = found
+        if k > len(ids):
+            return None
+        # Softmax over negative distance, relative to the best match
+        scale = max(float(np.std(distances)), 1e-6) * temperature
+        weights = np.exp(-(distances - distances.min()) / scale)
+        weights /= weights.sum()
+        return self._rng.choice(ids, size=k, replace=False, p=weights)
+
+
+def build_concept_index(concepts: List[str], top_n: int = CANDIDATES_PER_CONCEPT,
+                        path: str = CONCEPT_INDEX_PATH) -> ConceptCandidateIndex:
+    """
+    Offline build step: embeds every concept in one batched call, runs a single
+    batched FAISS search and stores the top-N candidates per concept.
+    """
+    from tool import get_embeddings, get_index
+
+    index = get_index()
+
+    concepts = list(dict.fromkeys(concepts))
+    embeddings = get_embeddings(concepts)
+    known = [(c, e) for c, e in zip(concepts, embeddings) if e is not None]
+    if not known:
+        raise RuntimeError("Could not embed any concept; candidate index not built.")
+    for c, e in zip(concepts, embeddings):
+        if e is None:
+            print(f"Warning: no embedding for concept {c}; it will use live search.")
+
+    queries = np.array([e for _, e in known], dtype=np.float32)
+    distances, ids = index.search(queries, min(top_n, index.ntotal))
+
+    table = ConceptCandidateIndex([c for c, _ in known], ids, distances, index.ntotal)
+    table.save(path)
+    print(f"Saved top-{ids.shape[1]} candidates for {len(table)} concepts to {path}")
+    return table
+
+
+if __name__ == '__main__':
+    from concept_weight import concepts_for_paper
+
+    build_concept_index([c for details in concepts_for_paper.values() for c in details['concepts']])
@@ -0,0 +1,294 @@
+# data_access.py
+import copy
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Indexes the per-user queries rely on; add them to the Realtime Database rules:
+#   "papers":       {".indexOn": ["created_by_uid", "created_by"]},
+#   "test_results": {".indexOn": ["user_uid", "user_name"]},
+#   "users":        {".indexOn": ["name", "email"]}
+# Without them Firebase rejects the queries; reads then fall back to the
+# users/<uid>/papers and users/<uid>/test_results reference nodes where a uid is known.
+INDEXED_FIELDS = {
+    "papers": ("created_by_uid", "created_by"),
+    "test_results": ("user_uid", "user_name"),
+    "users": ("name", "email"),
+}
+
+# Per-question fields that grading, analytics and mastery need. A copy of each paper with only
+# these is kept at papers_slim/<paper_id>, so those reads cost one small request per paper
+# (the REST API cannot project fields out of a record).
+SLIM_PAPERS = "papers_slim"
+SLIM_PAPER_FIELDS = ("question_number", "subject", "concept", "difficulty", "correct_answer", "options")
+
+# Concurrent reads for multi-record loads (the Realtime Database REST API has no multi-get)
+DATA_ACCESS_WORKERS = int(os.environ.get("DATA_ACCESS_WORKERS", "8"))
+_read_pool = ThreadPoolExecutor(max_workers=DATA_ACCESS_WORKERS, thread_name_prefix="db-read")
+
+
+def slim_paper(paper: Dict[str, Any]) -> Dict[str, Any]:
+    """The SLIM_PAPER_FIELDS of a paper."""
+    return {field: paper[field] for field in SLIM_PAPER_FIELDS if paper.get(field) is not None}
+
+
+class DataAccess:
+    """
+    Reads scoped to one user, so their cost follows the caller's own data
+    instead of the size of the papers/test_results collections. `database`
+    returns a fresh query builder (pyrebase's `firebase.database`): pyrebase
+    keeps the path being built on the builder, so one shared instance is not
+    safe across threads.
+    """
+
+    def __init__(self, database: Callable[[], Any]):
+        self._database = database
+
+    def _query(self, collection: str, field: str, value: Any) -> List[Tuple[str, Dict[str, Any]]]:
+        response = self._database().child(collection).order_by_child(field).equal_to(value).get()
+        return [(item.key(), item.val()) for item in (response.each() or []) if item.val()]
+
+    def _referenced(self, uid: str, collection: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Records listed under users/<uid>/<collection>, fetched by key."""
+        keys = self._database().child("users").child(uid).child(collection).shallow().get().val() or []
+        records = []
+        for key in keys:
+            record = self.get(collection, key)
+            if record:
+                records.append((key, record))
+        return records
+
+    def _scan(self, collection: str, field: str, value: Any) -> List[Tuple[str, Dict[str, Any]]]:
+        response = self._database().child(collection).get()
+        return [(item.key(), item.val()) for item in (response.each() or [])
+                if isinstance(item.val(), dict) and item.val().get(field) == value]
+
+    def _find(self, collection: str, field: str, value: Any,
+              uid: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        try:
+            return self._query(collection, field, value)
+        except Exception as e:
+            print(f"Indexed query on {collection}/{field} failed ({e}); add the .indexOn rule.")
+        if uid:
+            return self._referenced(uid, collection)
+        return self._scan(collection, field, value)
+
+    def get(self, collection: str, key: str) -> Optional[Dict[str, Any]]:
+        return self._database().child(collection).child(key).get().val()
+
+    def get_many(self, collection: str, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Loads several records concurrently, one request per key however often
+        it is repeated. Missing records are left out of the result.
+        """
+        unique = list(dict.fromkeys(k for k in keys if k))
+        futures = {key: _read_pool.submit(self.get, collection, key) for key in unique}
+        records = {key: future.result() for key, future in futures.items()}
+        return {key: record for key, record in records.items() if record}
+
+    def save_slim_paper(self, paper_id: str, paper: Dict[str, Any]) -> None:
+        self._database().child(SLIM_PAPERS).child(paper_id).set(slim_paper(paper))
+
+    def _slim_or_full(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        slim = self.get(SLIM_PAPERS, paper_id)
+        if slim:
+            return slim
+        # Papers saved before the slim copies existed: read the full paper once and backfill
+        paper = self.get("papers", paper_id)
+        if not paper:
+            return None
+        slim = slim_paper(paper)
+        try:
+            self.save_slim_paper(paper_id, paper)
+        except Exception as e:
+            print(f"Could not backfill {SLIM_PAPERS}/{paper_id}: {e}")
+        return slim
+
+    def get_slim_papers(self, paper_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        The SLIM_PAPER_FIELDS of several papers, loaded concurrently with one
+        request per paper. Missing papers are left out of the result.
+        """
+        unique = list(dict.fromkeys(k for k in paper_ids if k))
+        futures = {key: _read_pool.submit(self._slim_or_full, key) for key in unique}
+        records = {key: future.result() for key, future in futures.items()}
+        return {key: record for key, record in records.items() if record}
+
+    def papers_for_user(self, uid: Optional[str] = None, user_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Papers created by `uid` or (for papers saved without a uid) by `user_name`."""
+        found: Dict[str, Dict[str, Any]] = {}
+        if uid:
+            found.update(self._find("papers", "created_by_uid", uid, uid=uid))
+        if user_name:
+            for key, paper in self._find("papers", "created_by", user_name, uid=uid):
+                found.setdefault(key, paper)
+        return list(found.values())
+
+    def test_results_for_user(self, uid: Optional[str] = None, user_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        if uid:
+            return [result for _, result in self._find("test_results", "user_uid", uid, uid=uid)]
+        if user_name:
+            return [result for _, result in self._find("test_results", "user_name", user_name)]
+        return []
+
+    def find_user(self, field: str, value: Any) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """The first user whose `field` equals `value`, as (uid, data)."""
+        for uid, data in self._find("users", field, value):
+            return uid, data
+        return None, None
+
+
+class _Snapshot:
+    def __init__(self, key: Optional[str], value: Any):
+        self._key = key
+        self._value = value
+
+    def key(self):
+        return self._key
+
+    def val(self):
+        return self._value
+
+
+class _Response(_Snapshot):
+    def __init__(self, key: Optional[str], value: Any, items: Optional[List[_Snapshot]] = None):
+        super().__init__(key, value)
+        self._items = items
+
+    def each(self):
+        return self._items
+
+
+class FakeRealtimeDB:
+    """
+    In-memory stand-in for the pyrebase Realtime Database API used by the
+    server (child/get/set/update/push/remove, order_by_child/order_by_key with
+    equal_to and limits, shallow, multi-path updates and {".sv": {"increment": n}}
+    server values). Counts requests and bytes returned, and with `indexes`
+    ({collection: fields}) rejects queries on unindexed fields like Firebase
+    does. Pass `fake.database` wherever `firebase.database` is expected.
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, indexes: Optional[Dict[str, Iterable[str]]] = None):
+        self.data: Dict[str, Any] = copy.deepcopy(data) if data else {}
+        self.indexes = {k: set(v) for k, v in indexes.items()} if indexes is not None else None
+        self.requests = 0
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def database(self) -> "_FakeQuery":
+        return _FakeQuery(self)
+
+    def _node(self, path: List[str], create: bool = False):
+        node = self.data
+        for part in path:
+            if not isinstance(node, dict) or part not in node:
+                if not create:
+                    return None
+                node[part] = {}
+            node = node[part]
+        return node
+
+    def _read(self, path: List[str], query: Dict[str, Any]) -> _Response:
+        with self._lock:
+            self.requests += 1
+            key = path[-1] if path else None
+            node = copy.deepcopy(self._node(path))
+            if query.get("shallow"):
+                keys = list(node.keys()) if isinstance(node, dict) else None
+                self.bytes_read += len(json.dumps(keys))
+                return _Response(key, keys)
+            if query.get("orderBy") == "$key":
+                node = dict(sorted((node or {}).items()))
+            elif "orderBy" in query:
+                field = query["orderBy"]
+                collection = path[-1] if path else ""
+                if self.indexes is not None and field not in self.indexes.get(collection, ()):
+                    raise ValueError(f'Index not defined, add ".indexOn": "{field}", for path "/{collection}"')
+                node = {k: v for k, v in (node or {}).items()
+                        if isinstance(v, dict) and ("equalTo" not in query or v.get(field) == query["equalTo"])}
+            if "limitToFirst" in query:
+                node = dict(list(node.items())[:query["limitToFirst"]])
+            if "limitToLast" in query:
+                node = dict(list(node.items())[-query["limitToLast"]:])
+            self.bytes_read += len(json.dumps(node))
+            if isinstance(node, dict):
+                return _Response(key, node, [_Snapshot(k, v) for k, v in node.items()])
+            return _Response(key, node)
+
+    def _put(self, path: List[str], value: Any) -> None:
+        parent = self._node(path[:-1], create=True)
+        if isinstance(value, dict) and ".sv" in value:
+            current = parent.get(path[-1])
+            value = (current if isinstance(current, (int, float)) else 0) + value[".sv"]["increment"]
+        if value is None:
+            parent.pop(path[-1], None)
+        else:
+            parent[path[-1]] = copy.deepcopy(value)
+
+    def _write(self, path: List[str], value: Any, merge: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            if merge:
+                # update(): each key is a path relative to `path`, written independently
+                for relative, child_value in value.items():
+                    self._put(path + [p for p in relative.split("/") if p], child_value)
+            else:
+                self._put(path, value)
+
+
+class _FakeQuery:
+    def __init__(self, db: FakeRealtimeDB):
+        self._db = db
+        self._path: List[str] = []
+        self._query: Dict[str, Any] = {}
+
+    def child(self, *args):
+        self._path += [p for arg in args for p in str(arg).strip("/").split("/") if p]
+        return self
+
+    def order_by_child(self, field):
+        self._query["orderBy"] = field
+        return self
+
+    def equal_to(self, value):
+        self._query["equalTo"] = value
+        return self
+
+    def order_by_key(self):
+        self._query["orderBy"] = "$key"
+        return self
+
+    def limit_to_first(self, n):
+        self._query["limitToFirst"] = n
+        return self
+
+    def limit_to_last(self, n):
+        self._query["limitToLast"] = n
+        return self
+
+    def shallow(self):
+        self._query["shallow"] = True
+        return self
+
+    def get(self, token=None):
+        return self._db._read(self._path, self._query)
+
+    def set(self, data, token=None):
+        self._db._write(self._path, data)
+        return data
+
+    def update(self, data, token=None):
+        self._db._write(self._path, data, merge=True)
+        return data
+
+    def push(self, data, token=None):
+        key = uuid.uuid4().hex
+        self._db._write(self._path + [key], data)
+        return {"name": key}
+
+    def remove(self, token=None):
+        self._db._write(self._path, None)
@@ -0,0 +1,281 @@
+# dedup.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from resources import lazy_resource
+
+# Two questions are duplicates outright when their 64-bit SimHashes differ in at most this many
+# bits. Word SimHash only catches near-verbatim repeats: rephrasings of the same problem measure
+# 13-26 bits apart, no closer than unrelated questions on the same topic (16-17).
+DEDUP_MAX_HAMMING = int(os.environ.get("DEDUP_MAX_HAMMING", "6"))
+# Rephrasings are caught by embedding similarity instead: the DEDUP_EMBEDDING_CANDIDATES stored
+# questions closest by SimHash (within DEDUP_NEAR_MISS_HAMMING bits; unrelated text sits ~32
+# bits away) are embedded with the new one, and a cosine of DEDUP_MIN_COSINE or more is a
+# duplicate. DEDUP_EMBEDDINGS=0 leaves only the SimHash check.
+DEDUP_EMBEDDINGS = os.environ.get("DEDUP_EMBEDDINGS", "1") == "1"
+DEDUP_NEAR_MISS_HAMMING = int(os.environ.get("DEDUP_NEAR_MISS_HAMMING", "28"))
+DEDUP_EMBEDDING_CANDIDATES = int(os.environ.get("DEDUP_EMBEDDING_CANDIDATES", "8"))
+DEDUP_MIN_COSINE = float(os.environ.get("DEDUP_MIN_COSINE", "0.9"))
+QUESTION_HISTORY_DB = os.environ.get("QUESTION_HISTORY_DB",
+                                     os.environ.get("QUESTION_POOL_DB", "question_pool.sqlite3"))
+# Users whose history index is kept in memory (least recently used are dropped and reloaded on demand)
+DEDUP_CACHED_USERS = 256
+SHINGLE_SIZE = 1
+
+_TOKEN = re.compile(r"\w+")
+_BITS = np.arange(64, dtype=np.uint64)
+
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int:
+    """64-bit SimHash over lower-cased word shingles (single words by default)."""
+    tokens = _TOKEN.findall(str(text).lower())
+    if not tokens:
+        return 0
+    shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(max(1, len(tokens) - shingle_size + 1))]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles],
+        dtype=np.uint64,
+    )
+    bits = ((hashes[:, None] >> _BITS) & np.uint64(1)).astype(np.int32)
+    votes = (2 * bits - 1).sum(axis=0)
+    return int(sum(1 << i for i in np.flatnonzero(votes > 0)))
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Set bits of each uint64."""
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class SimHashIndex:
+    """
+    Incremental near-duplicate index. Fingerprints are split into
+    max_distance + 1 bands; any fingerprint within `max_distance` bits of a
+    stored one shares at least one band with it exactly, so a lookup only
+    compares against that band's bucket instead of the whole history. Each
+    fingerprint can carry a reference (e.g. its question) for `near_misses`.
+    """
+
+    def __init__(self, max_distance: int = DEDUP_MAX_HAMMING):
+        self.max_distance = max_distance
+        self._bands = max_distance + 1
+        self._band_bits = 64 // self._bands
+        self._buckets: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(self._bands)]
+        self._fingerprints: List[int] = []
+        self._refs: List[Any] = []
+        self._lock = threading.Lock()
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self._band_bits) - 1
+        for band in range(self._bands):
+            yield band, (fingerprint >> (band * self._band_bits)) & mask
+
+    def _has_near(self, fingerprint: int) -> bool:
+        for band, key in self._band_keys(fingerprint):
+            for other in self._buckets[band].get(key, ()):
+                if (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return True
+        return False
+
+    def _add(self, fingerprint: int, ref: Any = None) -> None:
+        for band, key in self._band_keys(fingerprint):
+            self._buckets[band][key].append(fingerprint)
+        self._fingerprints.append(fingerprint)
+        self._refs.append(ref)
+
+    def contains_near(self, fingerprint: int) -> bool:
+        with self._lock:
+            return self._has_near(fingerprint)
+
+    def add(self, fingerprint: int, ref: Any = None) -> None:
+        with self._lock:
+            self._add(fingerprint, ref)
+
+    def add_if_new(self, fingerprint: int, ref: Any = None) -> bool:
+        """Adds the fingerprint unless a near-duplicate is already stored; returns whether it was added."""
+        with self._lock:
+            if self._has_near(fingerprint):
+                return False
+            self._add(fingerprint, ref)
+            return True
+
+    def near_misses(self, fingerprint: int, max_distance: int, limit: int) -> List[Any]:
+        """
+        References of up to `limit` stored fingerprints more than
+        `self.max_distance` but at most `max_distance` bits away, closest first.
+        Scans the whole index (no banding), so it is meant for one user's history.
+        """
+        with self._lock:
+            if not self._fingerprints:
+                return []
+            fingerprints = np.array(self._fingerprints, dtype=np.uint64)
+            refs = list(self._refs)
+        distances = _popcount(fingerprints ^ np.uint64(fingerprint))
+        candidates = np.flatnonzero((distances > self.max_distance) & (distances <= max_distance))
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [refs[i] for i in candidates if refs[i] is not None][:limit]
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+
+def _to_signed(fingerprint: int) -> int:
+    # SQLite integers are signed 64-bit
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class QuestionHistory:
+    """
+    Fingerprints of every question a user has been given, persisted in SQLite
+    and mirrored in one in-memory SimHashIndex per user. Papers for anonymous
+    callers get a throwaway index under their own run key. With `embed` (texts
+    -> vectors), SimHash near-misses are also compared by embedding cosine.
+    """
+
+    def __init__(self, path: str = QUESTION_HISTORY_DB, max_distance: int = DEDUP_MAX_HAMMING,
+                 cached_users: int = DEDUP_CACHED_USERS,
+                 embed: Optional[Callable[[List[str]], List[Optional[List[float]]]]] = None,
+                 min_cosine: float = DEDUP_MIN_COSINE, near_miss_distance: int = DEDUP_NEAR_MISS_HAMMING,
+                 embedding_candidates: int = DEDUP_EMBEDDING_CANDIDATES):
+        self.path = path
+        self.max_distance = max_distance
+        self.cached_users = cached_users
+        self.embed = embed
+        self.min_cosine = min_cosine
+        self.near_miss_distance = near_miss_distance
+        self.embedding_candidates = embedding_candidates
+        self._indexes: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (index, last row id loaded)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS question_history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                "fingerprint INTEGER NOT NULL, created_at REAL NOT NULL, question_text TEXT)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(question_history)")}
+            if "question_text" not in columns:
+                # Histories written before the embedding check only have fingerprints
+                conn.execute("ALTER TABLE question_history ADD COLUMN question_text TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user ON question_history (user_id, id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def index_for(self, key: str, user_id: Optional[str] = None) -> SimHashIndex:
+        """
+        The index for `key`, loading (or topping up with rows other workers wrote
+        since the last call) the persisted history when `user_id` is given.
+        Persisted entries reference their row id; the text is read on demand.
+        """
+        with self._lock:
+            index, last_id = self._indexes.pop(key, (None, 0))
+            if index is None:
+                index = SimHashIndex(self.max_distance)
+            if user_id:
+                rows = self._connect().execute(
+                    "SELECT id, fingerprint FROM question_history WHERE user_id = ? AND id > ? ORDER BY id",
+                    (user_id, last_id),
+                ).fetchall()
+                for row_id, fingerprint in rows:
+                    # Rows this worker wrote itself are already in the index
+                    index.add_if_new(_to_unsigned(fingerprint), row_id)
+                    last_id = row_id
+            self._indexes[key] = (index, last_id)
+            while len(self._indexes) > self.cached_users:
+                self._indexes.popitem(last=False)
+            return index
+
+    def _texts(self, refs: List[Any]) -> List[str]:
+        """Question texts behind index references (texts, or history row ids)."""
+        row_ids = [ref for ref in refs if isinstance(ref, int)]
+        stored = {}
+        if row_ids:
+            placeholders = ",".join("?" * len(row_ids))
+            stored = dict(self._connect().execute(
+                f"SELECT id, question_text FROM question_history WHERE id IN ({placeholders})", row_ids,
+            ).fetchall())
+        texts = [stored.get(ref) if isinstance(ref, int) else ref for ref in refs]
+        return [text for text in texts if text]
+
+    def _rephrases_known(self, index: SimHashIndex, fingerprint: int, question_text: str) -> bool:
+        """Whether a SimHash near-miss is the same question reworded, judged by embedding cosine."""
+        if self.embed is None:
+            return False
+        others = self._texts(index.near_misses(fingerprint, self.near_miss_distance, self.embedding_candidates))
+        if not others:
+            return False
+        try:
+            vectors = self.embed([question_text] + others)
+        except Exception as e:
+            print(f"Embedding duplicate check failed, using SimHash only: {e}")
+            return False
+        if not vectors or vectors[0] is None:
+            return False
+        known = [v for v in vectors[1:] if v is not None]
+        if not known:
+            return False
+        query = np.asarray(vectors[0], dtype=np.float32)
+        matrix = np.asarray(known, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        cosines = matrix @ query / np.maximum(norms, 1e-12)
+        return bool((cosines >= self.min_cosine).any())
+
+    def claim(self, key: str, user_id: Optional[str], question_text: str) -> bool:
+        """
+        Records the question for `key` unless it near-duplicates one already
+        there (this paper or, for a known user, any earlier paper). Returns
+        False for a duplicate.
+        """
+        with self._lock:
+            entry = self._indexes.get(key)
+        index = entry[0] if entry else self.index_for(key, user_id)
+        fingerprint = simhash(question_text)
+        if index.contains_near(fingerprint) or self._rephrases_known(index, fingerprint, question_text):
+            return False
+        if not index.add_if_new(fingerprint, question_text):
+            return False
+        if user_id:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO question_history (user_id, fingerprint, created_at, question_text) "
+                    "VALUES (?, ?, ?, ?)",
+                    (user_id, _to_signed(fingerprint), time.time(), question_text),
+                )
+        return True
+
+    def release(self, key: str) -> None:
+        """Forgets an anonymous paper's throwaway index."""
+        with self._lock:
+            self._indexes.pop(key, None)
+
+
+def _embed_questions(texts: List[str]) -> List[Optional[List[float]]]:
+    # tool pulls in FAISS and the provider clients; imported on the first near-miss so dedup stays light
+    from tool import get_embeddings
+    return get_embeddings(texts)
+
+def _load_question_history():
+    return QuestionHistory(os.environ.get("QUESTION_HISTORY_DB", QUESTION_HISTORY_DB),
+                           embed=_embed_questions if DEDUP_EMBEDDINGS else None)
+
+_question_history = lazy_resource("question_history", _load_question_history)
+
+def get_question_history() -> QuestionHistory:
+    return _question_history.get()
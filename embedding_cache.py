@@ -0,0 +1,183 @@
+# embedding_cache.py
+import hashlib
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: flushes are only serialized within the process
+    fcntl = None
+
+KEY_DTYPE = "S32"
+
+
+def embedding_key(model: str, task_type: str, text: str) -> bytes:
+    """Cache key for a (model, task_type, text) triple."""
+    digest = hashlib.sha256(f"{model}\x00{task_type}\x00{text}".encode("utf-8")).hexdigest()
+    return digest[:32].encode("ascii")
+
+
+def _read_table(keys_path: str, vectors_path: str):
+    """Returns ({key: row}, memory-mapped vectors) or ({}, None) if there is no usable table."""
+    if not (os.path.exists(keys_path) and os.path.exists(vectors_path)):
+        return {}, None
+    try:
+        keys = np.load(keys_path)
+        vectors = np.load(vectors_path, mmap_mode="r")
+    except Exception as e:
+        print(f"Warning: could not load embedding cache {vectors_path}: {e}")
+        return {}, None
+    if len(keys) != len(vectors):
+        print(f"Warning: embedding cache {vectors_path} is inconsistent; ignoring it.")
+        return {}, None
+    return {bytes(k): i for i, k in enumerate(keys)}, vectors
+
+
+def _table_paths(cache_dir: str, version: Optional[str]):
+    """(keys, vectors) file paths of a table version; None is the unversioned legacy layout."""
+    if version is None:
+        return os.path.join(cache_dir, "keys.npy"), os.path.join(cache_dir, "vectors.npy")
+    return os.path.join(cache_dir, f"keys-{version}.npy"), os.path.join(cache_dir, f"vectors-{version}.npy")
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding table stored as two .npy files under `cache_dir`:
+    keys-<version>.npy (hashed keys) and vectors-<version>.npy (float32 rows),
+    with the `current` file naming the live version. Both are memory-mapped on
+    load, so the table is read once at startup and shared through the page
+    cache. New vectors are kept in memory until `flush` writes a new version
+    and swaps the pointer, so readers never see keys and vectors from
+    different flushes.
+    """
+
+    def __init__(self, cache_dir: str = "embedding_cache"):
+        self.cache_dir = cache_dir
+        self._pointer_path = os.path.join(cache_dir, "current")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._rows = {}
+        self._pending = {}
+        self._load()
+
+    def _current_version(self) -> Optional[str]:
+        try:
+            with open(self._pointer_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        self._rows, self._vectors = _read_table(*_table_paths(self.cache_dir, self._current_version()))
+        if self._rows:
+            print(f"Loaded {len(self._rows)} cached embeddings from {self.cache_dir}")
+
+    @contextmanager
+    def _flush_lock(self):
+        """Serializes flushes across processes sharing `cache_dir`."""
+        with open(os.path.join(self.cache_dir, ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @property
+    def dimension(self) -> Optional[int]:
+        if self._vectors is not None:
+            return self._vectors.shape[1]
+        for vec in self._pending.values():
+            return len(vec)
+        return None
+
+    def __len__(self):
+        return len(self._rows) + len(self._pending)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def get_many(self, keys: Iterable[bytes]) -> List[Optional[np.ndarray]]:
+        return [self.get(k) for k in keys]
+
+    def put(self, key: bytes, vector) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            dim = self.dimension
+            if dim is not None and vector.shape != (dim,):
+                print(f"Warning: not caching embedding of dimension {vector.shape} (table uses {dim}).")
+                return
+            if key not in self._rows:
+                self._pending[key] = vector
+
+    def flush(self) -> None:
+        """Writes pending vectors to disk, merging with whatever is already there."""
+        with self._lock:
+            if not self._pending:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with self._flush_lock():
+                self._write_version()
+            self._pending = {}
+            self._load()
+
+    def _write_version(self):
+        # Re-read the live table under the flush lock so entries flushed by other processes are kept
+        previous = self._current_version()
+        disk_rows, disk_vectors = _read_table(*_table_paths(self.cache_dir, previous))
+
+        keys = list(disk_rows.keys())
+        blocks = [np.asarray(disk_vectors, dtype=np.float32)] if keys else []
+        new_keys = [k for k in self._pending if k not in disk_rows]
+        if not new_keys:
+            return
+        keys.extend(new_keys)
+        blocks.append(np.stack([self._pending[k] for k in new_keys]))
+
+        # Fresh file names per flush: nothing another process has open or mapped is overwritten
+        version = uuid.uuid4().hex
+        keys_path, vectors_path = _table_paths(self.cache_dir, version)
+        np.save(keys_path, np.array(keys, dtype=KEY_DTYPE))
+        np.save(vectors_path, np.concatenate(blocks).astype(np.float32))
+        tmp_pointer = f"{self._pointer_path}.{version}.tmp"
+        with open(tmp_pointer, "w") as f:
+            f.write(version)
+        os.replace(tmp_pointer, self._pointer_path)
+        self._remove_stale_versions(keep=(version, previous))
+
+    def _remove_stale_versions(self, keep):
+        """
+        Deletes table versions older than the one just replaced. The replaced
+        version stays for readers that read the pointer before the swap;
+        processes that already mapped older files keep their (unlinked) copy.
+        """
+        for name in os.listdir(self.cache_dir):
+            for prefix in ("keys-", "vectors-"):
+                if name.startswith(prefix) and name.endswith(".npy") and name[len(prefix):-4] not in keep:
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+
+
+if __name__ == '__main__':
+    # Precompute the concept embedding table so it can ship with the image
+    from concept_weight import concepts_for_paper
+    from tool import prefetch_embeddings, get_embedding_cache
+
+    embedding_cache = get_embedding_cache()
+    concepts = [c for details in concepts_for_paper.values() for c in details['concepts']]
+    prefetch_embeddings(concepts)
+    print(f"Embedding cache now holds {len(embedding_cache)} vectors in {embedding_cache.cache_dir}")
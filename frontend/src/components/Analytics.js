@@ -61,13 +61,13 @@ export default function Analytics() {
         fetch("https://jee-question-generator.onrender.com/get-user-analytics", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ token, userName })
+            // The slim view omits question text and explanations; they are loaded per test in viewTestDetails
+            body: JSON.stringify({ token, userName, view: 'slim' })
         })
             .then(res => res.json())
             .then(data => {
                 if (data.results) {
                     setTestResults(data.results);
-                    calculateAnalytics(data.results);
                 } else {
                     setError(data.error || 'Failed to fetch results');
                 }
@@ -77,102 +77,38 @@ export default function Analytics() {
                 setError('Failed to fetch analytics data');
                 setLoading(false);
             });
+
+        fetch("https://jee-question-generator.onrender.com/analytics/summary", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ token })
+        })
+            .then(res => res.json())
+            .then(data => {
+                if (!data.error) applySummary(data);
+            })
+            .catch(err => console.error('Failed to fetch analytics summary', err));
     }, []);
 
-    const calculateAnalytics = (results) => {
-        if (results.length === 0) {
+    // Maps the server-side /analytics/summary aggregates onto the dashboard's fields
+    const applySummary = (summary) => {
+        if (!summary.total_tests) {
             setAnalytics({});
             return;
         }
 
-        const totalTests = results.length;
-        let totalQuestions = 0;
-        let totalCorrect = 0;
-
-        // Calculate total questions and total correct manually
-        results.forEach(result => {
-            if (result.paper_details && result.paper_details.question_number) {
-                const questionCount = result.paper_details.question_number.length;
-                totalQuestions += questionCount;
-
-                // Calculate correct answers for this test
-                const options = result.paper_details.options;
-                const correctAnswers = result.paper_details.correct_answer;
-
-                for (let index = 0; index < questionCount; index++) {
-                    const userAnswer = result.answers[index.toString()];
-                    const correctKey = correctAnswers[index];
-                    const correctValue = getCorrectOptionValue(options[index], correctKey);
-
-                    if (userAnswer === correctValue) {
-                        totalCorrect += 1;
-                    }
-                }
-            }
-        });
-
-        // Calculate average percentage from our manually calculated totals
-        const averagePercentage = totalQuestions > 0 ? (totalCorrect / totalQuestions) * 100 : 0;
-        const averageTime = results.reduce((sum, result) => sum + (result.time_spent || 0), 0) / totalTests;
-
-        // Subject-wise analytics (keep existing logic)
-        const subjectStats = {};
-        results.forEach(result => {
-            if (result.paper_details && result.paper_details.subject) {
-                const subjects = result.paper_details.subject;
-                const options = result.paper_details.options;
-                const correctAnswers = result.paper_details.correct_answer;
-
-                subjects.forEach((subject, index) => {
-                    if (!subjectStats[subject]) {
-                        subjectStats[subject] = { correct: 0, total: 0 };
-                    }
-                    subjectStats[subject].total += 1;
-
-                    // Check if user got this question correct
-                    const userAnswer = result.answers[index.toString()];
-                    const correctKey = correctAnswers[index];
-                    const correctValue = getCorrectOptionValue(options[index], correctKey);
-
-                    if (userAnswer === correctValue) {
-                        subjectStats[subject].correct += 1;
-                    }
-                });
-            }
-        });
-        // Difficulty-wise analytics
-        const difficultyStats = {};
-        results.forEach(result => {
-            if (result.paper_details && result.paper_details.difficulty) {
-                const difficulties = result.paper_details.difficulty;
-                const options = result.paper_details.options;
-                const correctAnswers = result.paper_details.correct_answer;
-
-                difficulties.forEach((difficulty, index) => {
-                    if (!difficultyStats[difficulty]) {
-                        difficultyStats[difficulty] = { correct: 0, total: 0 };
-                    }
-                    difficultyStats[difficulty].total += 1;
-
-                    const userAnswer = result.answers[index.toString()];
-                    const correctKey = correctAnswers[index];
-                    const correctValue = getCorrectOptionValue(options[index], correctKey);
-
-                    if (userAnswer === correctValue) {
-                        difficultyStats[difficulty].correct += 1;
-                    }
-                });
-            }
-        });
+        const toStats = (groups) => Object.fromEntries(
+            Object.entries(groups || {}).map(([name, stats]) => [name, { correct: stats.correct, total: stats.attempts }])
+        );
 
         setAnalytics({
-            totalTests,
-            totalQuestions,
-            totalCorrect,
-            averagePercentage: Math.round(averagePercentage * 100) / 100,
-            averageTime: Math.round(averageTime / 60), // Convert to minutes
-            subjectStats,
-            difficultyStats
+            totalTests: summary.total_tests,
+            totalQuestions: summary.total_questions,
+            totalCorrect: summary.total_correct,
+            averagePercentage: summary.average_percentage,
+            averageTime: Math.round(summary.average_time_spent / 60), // Convert to minutes
+            subjectStats: toStats(summary.subjects),
+            difficultyStats: toStats(summary.difficulties)
         });
     };
 
@@ -197,6 +133,22 @@ export default function Analytics() {
 
     const viewTestDetails = (result) => {
         setSelectedTest(result);
+        if (!result.paper_details || result.paper_details.question_text) return;
+
+        fetch("https://jee-question-generator.onrender.com/get-paper-for-test", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ token: localStorage.getItem('idToken'), paperId: result.paper_id })
+        })
+            .then(res => res.json())
+            .then(data => {
+                if (data.paper) {
+                    const detailed = { ...result, paper_details: data.paper };
+                    setTestResults(results => results.map(r => (r === result ? detailed : r)));
+                    setSelectedTest(current => (current === result ? detailed : current));
+                }
+            })
+            .catch(err => console.error('Failed to load paper details', err));
     };
 
     const closeTestDetails = () => {
@@ -263,7 +215,7 @@ export default function Analytics() {
                                     <div key={index} className={`p-4 rounded border-l-4 ${isCorrect ? 'border-green-500 bg-green-900/20' : 'border-red-500 bg-red-900/20'
                                         }`}>
                                         <div className="flex items-center justify-between mb-2">
-                                            <h4 className="font-bold text-white">Q{qNum}: {paper.question_text[index]}</h4>
+                                            <h4 className="font-bold text-white">Q{qNum}: {paper.question_text?.[index] ?? "Loading..."}</h4>
                                             <span className={`px-2 py-1 rounded text-xs font-bold ${isCorrect ? 'bg-green-600 text-white' : 'bg-red-600 text-white'
                                                 }`}>
                                                 {isCorrect ? 'CORRECT' : 'INCORRECT'}
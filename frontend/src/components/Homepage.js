@@ -1,31 +1,119 @@
 import React, { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 
-const generatePaperFromAPI = async (userData = null) => {
-    const API_URL = 'https://jee-question-generator.onrender.com/generate-paper';
+const API_BASE_URL = 'https://jee-question-generator.onrender.com';
+const JOB_POLL_INTERVAL_MS = 3000;
 
-    let requestBody = {};
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// One idempotency key per paper attempt. It is kept until the paper is saved, so retrying
+// after a failure or a dropped connection resumes the interrupted run on the server
+// instead of starting over.
+const PENDING_ATTEMPT_KEY = 'pendingPaperAttemptKey';
+
+const paperAttemptKey = () => {
+    let key = sessionStorage.getItem(PENDING_ATTEMPT_KEY);
+    if (!key) {
+        key = crypto.randomUUID();
+        sessionStorage.setItem(PENDING_ATTEMPT_KEY, key);
+    }
+    return key;
+};
+
+const describeProgress = (progress) => {
+    if (!progress || !progress.subjects) {
+        return 'Planning the paper...';
+    }
+    const perSubject = Object.entries(progress.subjects)
+        .map(([subject, { done, total }]) => `${subject} ${done}/${total}`)
+        .join(', ');
+    return `Generated ${progress.done}/${progress.total} questions (${perSubject})`;
+};
+
+const buildRequestBody = (userData) => {
     if (userData && userData.token && userData.name) {
-        requestBody = {
+        console.log("Sending request with user data:", { name: userData.name });
+        return {
             token: userData.token,
             name: userData.name
         };
-        console.log("Sending request with user data:", { name: userData.name });
-    } else {
-        console.log("Sending request without user authentication");
     }
+    console.log("Sending request without user authentication");
+    return {};
+};
 
-    const response = await fetch(API_URL, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(requestBody)
-    });
-
+const throwForResponse = async (response) => {
     if (!response.ok) {
         const errorData = await response.json();
         throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
     }
-    return response.json();
+};
+
+// Polls an existing generation job until the paper is ready; only its owner may read it
+const pollPaperJob = async (jobId, token, onProgress = () => {}) => {
+    while (true) {
+        await sleep(JOB_POLL_INTERVAL_MS);
+        const jobResponse = await fetch(`${API_BASE_URL}/generate-paper/jobs/${jobId}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        await throwForResponse(jobResponse);
+        const job = await jobResponse.json();
+        if (job.status === 'done') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Paper generation failed');
+        }
+        onProgress(job.progress);
+    }
+};
+
+// Streams questions (NDJSON) as they are generated; falls back to polling the job if the
+// connection drops before the paper is finished.
+const generatePaperFromAPI = async (userData = null, attemptKey = null, onEvent = () => {}, onProgress = () => {}) => {
+    const headers = { 'Content-Type': 'application/json', 'Accept': 'application/x-ndjson' };
+    if (attemptKey) {
+        headers['Idempotency-Key'] = attemptKey;
+    }
+    const response = await fetch(`${API_BASE_URL}/generate-paper/stream`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ ...buildRequestBody(userData), format: 'ndjson' })
+    });
+    await throwForResponse(response);
+
+    let jobId = null;
+    let serverError = null;
+    try {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const event = JSON.parse(line);
+                if (event.type === 'job') jobId = event.job_id;
+                if (event.type === 'error') {
+                    serverError = new Error(event.error || 'Paper generation failed');
+                    throw serverError;
+                }
+                if (event.type === 'done') return event;
+                onEvent(event);
+            }
+        }
+    } catch (error) {
+        if (!jobId || error === serverError) throw error;
+        console.warn("Stream interrupted, polling the job instead:", error);
+    }
+    if (!jobId) {
+        throw new Error('Paper generation stream ended unexpectedly');
+    }
+    return pollPaperJob(jobId, userData?.token, onProgress);
 };
 
 const Header = ({ user }) => (
@@ -91,8 +179,22 @@ export default function Homepage({ user, onLogout }) {
                 setStatus('Generating paper (not logged in)...');
             }
 
-            const result = await generatePaperFromAPI(userData);
-
+            let generatedCount = 0;
+            let plannedTotal = 0;
+            const handleEvent = (event) => {
+                if (event.type === 'plan') {
+                    plannedTotal = Object.values(event.totals).reduce((sum, n) => sum + n, 0);
+                    setStatus(`Generating ${plannedTotal} questions...`);
+                } else if (event.type === 'question') {
+                    generatedCount += 1;
+                    setStatus(`Generated ${generatedCount}/${plannedTotal} questions (latest: ${event.subject} - ${event.question.concept})`);
+                }
+            };
+
+            await generatePaperFromAPI(userData, paperAttemptKey(), handleEvent,
+                (progress) => setStatus(describeProgress(progress)));
+
+            sessionStorage.removeItem(PENDING_ATTEMPT_KEY);
             setStatus('Paper generated successfully!');
             setPaperGenerated(true);
 
@@ -0,0 +1,75 @@
+# http_client.py
+import atexit
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+# One keep-alive client per host, shared by every thread in the process, so hot paths
+# (generation, embeddings, auth) reuse warm connections instead of paying a TLS handshake
+# per call. Limits apply per host because each host gets its own pool.
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_MAX_KEEPALIVE_PER_HOST = int(os.getenv("HTTP_MAX_KEEPALIVE_PER_HOST", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Unified timeouts; callers with long-running requests (LLM completions) pass their own read timeout
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "30"))
+HTTP_POOL_TIMEOUT_SECONDS = float(os.getenv("HTTP_POOL_TIMEOUT_SECONDS", "10"))
+
+DEFAULT_TIMEOUT = httpx.Timeout(
+    connect=HTTP_CONNECT_TIMEOUT_SECONDS,
+    read=HTTP_READ_TIMEOUT_SECONDS,
+    write=HTTP_READ_TIMEOUT_SECONDS,
+    pool=HTTP_POOL_TIMEOUT_SECONDS,
+)
+
+_clients: Dict[str, httpx.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (pip install httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _host_key(url_or_host: str) -> str:
+    parts = urlsplit(url_or_host if "://" in url_or_host else f"https://{url_or_host}")
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_http_client(url_or_host: str, timeout: Optional[httpx.Timeout] = None) -> httpx.Client:
+    """
+    Returns the shared pooled client for the host of `url_or_host` (a full URL
+    or a bare host name), creating it on first use.
+    """
+    key = _host_key(url_or_host)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = httpx.Client(
+                http2=http2_available(),
+                timeout=timeout or DEFAULT_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_PER_HOST,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            )
+        return _clients[key]
+
+
+@atexit.register
+def close_all() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,200 @@
+# index_builder.py
+import argparse
+import json
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_KINDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# faiss.IO_FLAG_MMAP only maps the inverted lists of IVF indexes; flat and HNSW indexes
+# are still read into private memory, so every worker would hold its own copy
+MMAP_KINDS = ("ivf_flat", "ivf_pq")
+
+# Build-time defaults; anything passed explicitly overrides them
+DEFAULT_PARAMS = {
+    "flat": {},
+    "ivf_flat": {"nlist": None, "nprobe": 16},
+    "ivf_pq": {"nlist": None, "nprobe": 16, "m": 48, "nbits": 8},
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+}
+
+
+def metadata_path(index_path: str) -> str:
+    """Sidecar file describing how an index was built."""
+    return index_path + ".meta.json"
+
+
+def _default_nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but keep at least ~39 training points per list as FAISS recommends
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def build_index(embeddings: np.ndarray, kind: str = "flat", **params) -> faiss.Index:
+    """
+    Builds (and trains, where needed) a FAISS index of the given kind over the
+    embeddings. Returns the index with its search-time parameters applied; the
+    resolved parameters are available as `index.build_params`.
+    """
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind '{kind}'. Expected one of {INDEX_KINDS}")
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, d = embeddings.shape
+    resolved = {**DEFAULT_PARAMS[kind], **{k: v for k, v in params.items() if v is not None}}
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, int(resolved["M"]))
+        index.hnsw.efConstruction = int(resolved["ef_construction"])
+    else:
+        resolved["nlist"] = int(resolved["nlist"] or _default_nlist(n))
+        quantizer = faiss.IndexFlatL2(d)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, resolved["nlist"])
+        else:
+            if d % int(resolved["m"]) != 0:
+                raise ValueError(f"PQ sub-quantizers m={resolved['m']} must divide the dimension {d}")
+            index = faiss.IndexIVFPQ(quantizer, d, resolved["nlist"], int(resolved["m"]), int(resolved["nbits"]))
+        print(f"Training {kind} index with nlist={resolved['nlist']} on {n} vectors...")
+        index.train(embeddings)
+
+    index.add(embeddings)
+    apply_search_params(index, kind, resolved)
+    index.build_params = resolved
+    return index
+
+
+def apply_search_params(index: faiss.Index, kind: str, params: Dict[str, Any]) -> None:
+    """Sets the search-time knobs (nprobe / efSearch) that are not stored in the index file."""
+    if kind in ("ivf_flat", "ivf_pq") and params.get("nprobe"):
+        faiss.extract_index_ivf(index).nprobe = int(params["nprobe"])
+    elif kind == "hnsw" and params.get("ef_search"):
+        index.hnsw.efSearch = int(params["ef_search"])
+
+
+def save_index(index: faiss.Index, index_path: str, kind: str, params: Optional[Dict[str, Any]] = None) -> None:
+    """Writes the index and its metadata sidecar."""
+    faiss.write_index(index, index_path)
+    meta = {
+        "kind": kind,
+        "params": params if params is not None else getattr(index, "build_params", {}),
+        "dimension": index.d,
+        "ntotal": index.ntotal,
+        "metric": "l2",
+        "built_at": datetime.utcnow().isoformat(),
+    }
+    with open(metadata_path(index_path), "w") as f:
+        json.dump(meta, f, indent=2)
+    print(f"Saved {kind} index with {index.ntotal} vectors to {index_path}")
+
+
+def read_metadata(index_path: str) -> Dict[str, Any]:
+    """Reads the sidecar; indexes built before sidecars existed are flat."""
+    try:
+        with open(metadata_path(index_path), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"kind": "flat", "params": {}}
+
+
+def load_index(index_path: str, mmap: bool = False) -> faiss.Index:
+    """
+    Loads an index, applying the search parameters recorded in its sidecar. With
+    `mmap`, IVF indexes are memory-mapped so processes share their inverted lists
+    through the page cache; other kinds are read normally, with a warning.
+    """
+    meta = read_metadata(index_path)
+    kind = meta.get("kind", "flat")
+    if mmap and kind in MMAP_KINDS:
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+        except RuntimeError as e:
+            print(f"Warning: could not memory-map {index_path} ({e}); reading it into memory.")
+            index = faiss.read_index(index_path)
+    else:
+        if mmap:
+            print(f"Warning: {kind} index {index_path} cannot be memory-mapped, so each worker holds its own "
+                  f"copy. Rebuild it with `python index_builder.py build --kind ivf_flat` to share it.")
+        index = faiss.read_index(index_path)
+    apply_search_params(index, kind, meta.get("params", {}))
+    print(f"Loaded {kind} index with {index.ntotal} vectors from {index_path}")
+    return index
+
+
+def extract_vectors(index: faiss.Index) -> np.ndarray:
+    """Recovers the stored vectors from a flat index so it can be rebuilt as another kind."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def benchmark(embeddings: np.ndarray, candidate: faiss.Index, queries: np.ndarray, k: int = 10) -> Dict[str, float]:
+    """
+    Measures recall@k of `candidate` against exact flat search over the same
+    embeddings, plus per-query latency and serialized index size.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    def timed(index):
+        latencies = []
+        found = []
+        for q in queries:
+            start = time.perf_counter()
+            _, ids = index.search(q[None, :], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(ids[0])
+        return np.array(found), np.array(latencies)
+
+    truth, flat_latency = timed(exact)
+    approx, latency = timed(candidate)
+    recall = np.mean([len(set(a) & set(t)) / k for a, t in zip(approx, truth)])
+
+    return {
+        f"recall@{k}": float(recall),
+        "latency_ms_mean": float(latency.mean()),
+        "latency_ms_p95": float(np.percentile(latency, 95)),
+        "flat_latency_ms_mean": float(flat_latency.mean()),
+        "index_bytes": int(faiss.serialize_index(candidate).nbytes),
+        "flat_index_bytes": int(faiss.serialize_index(exact).nbytes),
+    }
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Build or benchmark FAISS indexes for the question bank.")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("--source", default="jee_questions.index", help="Flat index to take vectors from")
+    parser.add_argument("--out", default=None, help="Where to write the built index")
+    parser.add_argument("--kind", choices=INDEX_KINDS, default="ivf_flat")
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--m", type=int)
+    parser.add_argument("--nbits", type=int)
+    parser.add_argument("--M", type=int)
+    parser.add_argument("--ef-construction", dest="ef_construction", type=int)
+    parser.add_argument("--ef-search", dest="ef_search", type=int)
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries")
+    parser.add_argument("-k", type=int, default=10)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    params = {k: getattr(args, k) for k in ("nlist", "nprobe", "m", "nbits", "M", "ef_construction", "ef_search")}
+    params = {k: v for k, v in params.items() if k in DEFAULT_PARAMS[args.kind]}
+
+    vectors = extract_vectors(faiss.read_index(args.source))
+    built = build_index(vectors, args.kind, **params)
+
+    if args.command == "build":
+        save_index(built, args.out or f"jee_questions_{args.kind}.index", args.kind)
+    else:
+        # Queries: stored vectors with a little noise, so they are close to but not exactly in the bank
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+        noise = rng.normal(scale=float(vectors.std()) * 0.1, size=(len(picks), vectors.shape[1]))
+        results = benchmark(vectors, built, vectors[picks] + noise, k=args.k)
+        print(json.dumps({"kind": args.kind, "params": built.build_params, **results}, indent=2))
@@ -0,0 +1,200 @@
+# jobs.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+PAPER_JOBS_DB = os.environ.get("PAPER_JOBS_DB", "paper_jobs.sqlite3")
+PAPER_JOB_WORKERS = int(os.environ.get("PAPER_JOB_WORKERS", "2"))
+# Every worker touches its queued/running jobs each JOB_HEARTBEAT_SECONDS. Jobs not touched
+# for JOB_STALE_SECONDS belonged to a process that crashed or restarted; they are marked failed
+# (at startup and on every heartbeat) so pollers stop waiting for them.
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "300"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paper_jobs (
+    job_id TEXT PRIMARY KEY,
+    owner TEXT,
+    status TEXT NOT NULL,
+    progress TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class JobStore:
+    """
+    SQLite table of paper-generation jobs. Every gunicorn worker opens the same
+    file, so a job started on one worker can be polled through any other.
+    """
+
+    def __init__(self, path: str = PAPER_JOBS_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def create(self, owner: Optional[str]) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO paper_jobs (job_id, owner, status, progress, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', '{}', ?, ?)",
+                (job_id, owner, now, now),
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields) -> None:
+        for key in ("progress", "result"):
+            if key in fields and not isinstance(fields[key], str):
+                fields[key] = json.dumps(fields[key])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE paper_jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def heartbeat(self, job_ids: Iterable[str]) -> None:
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE paper_jobs SET updated_at = ? WHERE status IN ('queued', 'running') "
+                f"AND job_id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), *job_ids),
+            )
+
+    def fail_stale(self, max_age: float = JOB_STALE_SECONDS) -> int:
+        """Marks queued/running jobs with no heartbeat for `max_age` seconds as failed."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE paper_jobs SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE status IN ('queued', 'running') AND updated_at < ?",
+                ("The server restarted before the job finished; please try again.", now, now - max_age),
+            )
+        return cursor.rowcount
+
+    def get(self, job_id: str, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM paper_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["job_id"],
+            "owner": row["owner"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"] or "{}"),
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if include_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+
+class JobProgress:
+    """Tracks questions done per subject for one job and persists it as events arrive."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self._store = store
+        self._job_id = job_id
+        self._lock = threading.Lock()
+        self.subjects: Dict[str, Dict[str, int]] = {}
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if event.get("type") == "plan":
+                self.subjects = {s: {"done": 0, "total": int(n)} for s, n in event["totals"].items()}
+            elif event.get("type") == "question":
+                subject = self.subjects.setdefault(event["subject"], {"done": 0, "total": 0})
+                subject["done"] += 1
+            else:
+                return
+            snapshot = {
+                "subjects": self.subjects,
+                "done": sum(s["done"] for s in self.subjects.values()),
+                "total": sum(s["total"] for s in self.subjects.values()),
+            }
+        self._store.update(self._job_id, progress=snapshot)
+
+
+class JobManager:
+    """
+    Runs paper-generation callables on a small worker pool, off the request
+    threads. A heartbeat thread keeps this process's jobs fresh and fails the
+    stale ones left behind by processes that died.
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, max_workers: int = PAPER_JOB_WORKERS,
+                 heartbeat: float = JOB_HEARTBEAT_SECONDS, stale_after: float = JOB_STALE_SECONDS):
+        self.store = store or JobStore()
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="paper-job")
+        self._active = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweep()
+        self._thread = threading.Thread(target=self._loop, name="paper-job-heartbeat", daemon=True)
+        self._thread.start()
+
+    def submit(self, owner: Optional[str], fn: Callable[[Callable[[Dict[str, Any]], None]], Any]) -> str:
+        """
+        Queues `fn(on_event)` and returns its job id. `on_event` receives the agent's
+        progress events; whatever `fn` returns is stored as the job result.
+        """
+        job_id = self.store.create(owner)
+        with self._lock:
+            self._active.add(job_id)
+        self._pool.submit(self._run, job_id, fn)
+        return job_id
+
+    def _run(self, job_id: str, fn) -> None:
+        self.store.update(job_id, status="running")
+        try:
+            result = fn(JobProgress(self.store, job_id))
+            self.store.update(job_id, status="done", result=result)
+        except Exception as e:
+            traceback.print_exc()
+            self.store.update(job_id, status="failed", error=str(e))
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _sweep(self) -> None:
+        try:
+            with self._lock:
+                active = list(self._active)
+            self.store.heartbeat(active)
+            failed = self.store.fail_stale(self.stale_after)
+            if failed:
+                print(f"Marked {failed} interrupted paper generation job(s) as failed.")
+        except Exception as e:
+            print(f"Paper job heartbeat failed: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.heartbeat):
+            self._sweep()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,133 @@
+# llm_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# off: never touch the cache; record: store responses but always call the provider;
+# reuse: answer identical requests from the cache (deterministic replays for tests and
+# load benchmarks, and retried prompts are not paid for twice).
+LLM_CACHE_MODES = ("off", "record", "reuse")
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "record")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+# Expired and surplus rows are pruned once every this many writes
+_EVICT_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Content address of a provider request: sha256 of its canonical JSON (prompt, model and parameters)."""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-level response cache: an in-memory LRU in front of a SQLite table shared
+    by every worker. Entries expire after `ttl` seconds and the table is trimmed
+    to `max_entries` least recently used rows. Pass path=None for memory only.
+    """
+
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(_SCHEMA)
+            self.evict()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (response, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+        if not self.path:
+            return None
+
+        conn = self._connect()
+        row = conn.execute("SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            return None
+        with conn:
+            conn.execute("UPDATE llm_responses SET last_used = ? WHERE key = ?", (now, key))
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        self._remember(key, response, now)
+        if not self.path:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+        with self._lock:
+            self._writes += 1
+            due = self._writes % _EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drops expired rows, then the least recently used ones beyond max_entries."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl,))
+            conn.execute(
+                "DELETE FROM llm_responses WHERE key IN ("
+                "SELECT key FROM llm_responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+def open_llm_cache() -> LLMResponseCache:
+    """Builds the cache from the LLM_CACHE_* environment (LLM_CACHE_PATH="" keeps it in memory only)."""
+    return LLMResponseCache(os.environ.get("LLM_CACHE_PATH", LLM_CACHE_PATH) or None)
+
+
+def cache_mode() -> str:
+    mode = os.environ.get("LLM_CACHE_MODE", LLM_CACHE_MODE)
+    if mode not in LLM_CACHE_MODES:
+        raise ValueError(f"LLM_CACHE_MODE must be one of {LLM_CACHE_MODES}, got {mode!r}")
+    return mode
@@ -0,0 +1,104 @@
+# mastery.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from analytics import grade_answers
+from data_access import DataAccess
+
+# A test's answers count half as much every MASTERY_HALF_LIFE_TESTS newer tests
+MASTERY_HALF_LIFE_TESTS = float(os.environ.get("MASTERY_HALF_LIFE_TESTS", "5"))
+# Accuracy is shrunk towards MASTERY_PRIOR as if every concept had this many extra
+# (decayed) attempts, so one lucky or unlucky answer does not swing the weights
+MASTERY_PRIOR = 0.5
+MASTERY_PRIOR_ATTEMPTS = float(os.environ.get("MASTERY_PRIOR_ATTEMPTS", "2"))
+# A concept with mastery 0 gets MASTERY_BOOST times its blueprint weight, mastery 1 gets 1x
+MASTERY_BOOST = float(os.environ.get("MASTERY_BOOST", "2.0"))
+MASTERY_CACHE_SECONDS = float(os.environ.get("MASTERY_CACHE_SECONDS", "600"))
+MASTERY_CACHED_USERS = 1024
+
+
+def concept_mastery(tests: Sequence[Tuple[Dict[str, Any], Dict[str, Any]]], concepts: Sequence[str],
+                    half_life: float = MASTERY_HALF_LIFE_TESTS) -> np.ndarray:
+    """
+    Recency-weighted accuracy per concept from (paper, answers) pairs, oldest
+    test first. Every graded question becomes one row of flat arrays (concept
+    index, correct, decay); the per-concept sums are then two bincounts.
+    Concepts never attempted stay at MASTERY_PRIOR.
+    """
+    index = {concept: i for i, concept in enumerate(concepts)}
+    concept_ids, correct, test_ids = [], [], []
+    for test_id, (paper, answers) in enumerate(tests):
+        graded = grade_answers(paper, answers)
+        paper_concepts = paper.get("concept") or []
+        ids = [index.get(c, -1) for c in paper_concepts[:len(graded)]]
+        concept_ids.extend(ids)
+        correct.extend(graded[:len(ids)])
+        test_ids.extend([test_id] * len(ids))
+
+    concept_ids = np.asarray(concept_ids, dtype=np.int64)
+    known = concept_ids >= 0
+    concept_ids = concept_ids[known]
+    correct = np.asarray(correct, dtype=np.float64)[known]
+    age = (len(tests) - 1) - np.asarray(test_ids, dtype=np.float64)[known]
+    decay = np.power(0.5, age / half_life) if half_life > 0 else np.ones_like(age)
+
+    attempts = np.bincount(concept_ids, weights=decay, minlength=len(concepts))
+    hits = np.bincount(concept_ids, weights=decay * correct, minlength=len(concepts))
+    return (hits + MASTERY_PRIOR * MASTERY_PRIOR_ATTEMPTS) / (attempts + MASTERY_PRIOR_ATTEMPTS)
+
+
+def focus_weights(mastery: np.ndarray, concepts: Sequence[str], boost: float = MASTERY_BOOST) -> Dict[str, float]:
+    """Per-concept multipliers for the paper blueprint: 1 + (boost - 1) * (1 - mastery)."""
+    multipliers = 1.0 + (boost - 1.0) * (1.0 - np.clip(mastery, 0.0, 1.0))
+    return {concept: round(float(m), 4) for concept, m in zip(concepts, multipliers)}
+
+
+class MasteryEngine:
+    """
+    Computes each user's concept focus weights from their test history and
+    keeps them in an LRU cache until the user submits another test (or the
+    entry is older than MASTERY_CACHE_SECONDS, which bounds staleness across
+    workers).
+    """
+
+    def __init__(self, data_access: DataAccess, concepts: Sequence[str],
+                 ttl: float = MASTERY_CACHE_SECONDS, cached_users: int = MASTERY_CACHED_USERS):
+        self.data_access = data_access
+        self.concepts = list(concepts)
+        self.ttl = ttl
+        self.cached_users = cached_users
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _history(self, user_uid: Optional[str], user_name: Optional[str]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        results = self.data_access.test_results_for_user(user_uid, user_name)
+        results.sort(key=lambda r: r.get('created_at') or '')
+        papers = self.data_access.get_slim_papers(r.get('paper_id') for r in results)
+        return [(papers[r['paper_id']], r.get('answers') or {}) for r in results if r.get('paper_id') in papers]
+
+    def weights_for(self, user_uid: Optional[str] = None, user_name: Optional[str] = None) -> Dict[str, float]:
+        key = user_uid or f"name:{user_name}"
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._cache.move_to_end(key)
+                return entry[1]
+
+        weights = focus_weights(concept_mastery(self._history(user_uid, user_name), self.concepts), self.concepts)
+        with self._lock:
+            self._cache[key] = (now, weights)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cached_users:
+                self._cache.popitem(last=False)
+        return weights
+
+    def invalidate(self, user_uid: Optional[str] = None, user_name: Optional[str] = None) -> None:
+        with self._lock:
+            for key in (user_uid, f"name:{user_name}"):
+                self._cache.pop(key, None)
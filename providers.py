@@ -0,0 +1,317 @@
+# providers.py
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from http_client import get_http_client
+from rate_limit import AdaptiveRateLimiter, RATE_LIMIT_MAX_PAUSE_SECONDS, bucket_from_env
+
+# --- Provider configuration ---
+# GENERATION_PROVIDERS is a JSON list; each entry is an OpenAI-compatible endpoint
+# ("kind": "openai", the default) or a local fake ("kind": "fake"). For example, to add
+# OpenRouter next to Together:
+#   [{"name": "together"},
+#    {"name": "openrouter", "base_url": "https://openrouter.ai/api/v1",
+#     "api_key_env": "OPENROUTER_API_KEY_2", "model": "anthropic/claude-3-haiku",
+#     "env_prefix": "OPENROUTER", "requests_per_minute": 20}]
+# Rate limits start from <env_prefix>_REQUESTS_PER_MINUTE / _BURST and
+# <env_prefix>_TOKENS_PER_MINUTE / _BURST (or the entry's own values) and then follow each
+# provider's x-ratelimit-* and Retry-After headers. With RATE_LIMIT_BACKEND=file (the
+# default) every budget lives in RATE_LIMIT_STATE_DIR and is shared by all gunicorn workers.
+DEFAULT_PROVIDERS = [{
+    "name": "together",
+    "base_url": "https://api.together.xyz/v1",
+    "api_key_env": "together_api_key",
+    "model": "lgai/exaone-3-5-32b-instruct",
+    "env_prefix": "GENERATION",
+}]
+REQUEST_INTERVAL_SECONDS = 10.0  # default spacing until the provider's headers say otherwise
+DEFAULT_TOKENS_PER_MINUTE = 60000.0
+
+# Hedging: when a request has been in flight longer than the provider's recent p95 latency,
+# the same request is sent to a second provider and whichever answers first wins.
+GENERATION_HEDGING = os.getenv("GENERATION_HEDGING", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+LATENCY_WINDOW = 100
+
+
+class ProviderResponse(NamedTuple):
+    text: str
+    provider: str
+    latency: float
+    total_tokens: Optional[int]
+
+
+class LatencyStats:
+    """Recent request latencies and failures for one provider."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, alpha: float = 0.2):
+        self._samples = deque(maxlen=window)
+        self._alpha = alpha
+        self._lock = threading.Lock()
+        self.ewma: Optional[float] = None
+        self.consecutive_failures = 0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.ewma = seconds if self.ewma is None else self._alpha * seconds + (1 - self._alpha) * self.ewma
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100.0))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+def _shared_state_path(name: str) -> Optional[str]:
+    if os.getenv("RATE_LIMIT_BACKEND", "file") != "file":
+        return None
+    return os.path.join(os.getenv("RATE_LIMIT_STATE_DIR", ".rate_limit"), name)
+
+
+class Provider:
+    """
+    One model endpoint. Subclasses implement `_send`; `complete` wraps it with the
+    provider's own rate limiter and records latency (from submission), failures
+    and headroom.
+    """
+
+    def __init__(self, name: str, model: str, limiter: AdaptiveRateLimiter):
+        self.name = name
+        self.model = model
+        self.limiter = limiter
+        self.stats = LatencyStats()
+        self._headroom = 1.0
+        self._paused_until = 0.0
+
+    def _send(self, request: Dict[str, Any], timeout: float):
+        """Returns (text, headers, total_tokens) or raises."""
+        raise NotImplementedError
+
+    def _observe_headers(self, headers) -> None:
+        info = self.limiter.update_from_headers(headers or {})
+        if info["limit_requests"] and info["remaining_requests"] is not None:
+            self._headroom = max(0.0, min(1.0, info["remaining_requests"] / info["limit_requests"]))
+        pause = info["retry_after"] or (info["reset_requests"] if info["remaining_requests"] == 0 else None)
+        if pause:
+            self._paused_until = time.time() + min(pause, RATE_LIMIT_MAX_PAUSE_SECONDS)
+
+    def headroom(self) -> float:
+        """Share of the provider's request quota still available (0 while it asked us to back off)."""
+        if time.time() < self._paused_until:
+            return 0.0
+        return self._headroom
+
+    def complete(self, request: Dict[str, Any], timeout: float = 120,
+                 estimated_tokens: float = 0.0) -> ProviderResponse:
+        # Latency counts from submission, including the wait for this provider's own rate
+        # limiter, so a provider stalled in its bucket looks slow to the router's weights
+        # and hedge delay instead of looking as fast as its last send
+        start = time.perf_counter()
+        self.limiter.acquire(estimated_tokens)
+        try:
+            text, headers, total_tokens = self._send(request, timeout)
+        except Exception as e:
+            self.stats.record_failure()
+            self._observe_headers(getattr(getattr(e, "response", None), "headers", None)
+                                  or getattr(e, "headers", None))
+            raise
+        latency = time.perf_counter() - start
+        self.stats.record(latency)
+        self._observe_headers(headers)
+        self.limiter.settle(estimated_tokens, total_tokens)
+        return ProviderResponse(text, self.name, latency, total_tokens)
+
+
+class OpenAICompatibleProvider(Provider):
+    """Chat-completions endpoint reached through the openai client (Together, OpenRouter, ...)."""
+
+    def __init__(self, name: str, model: str, limiter: AdaptiveRateLimiter, base_url: str, api_key: Optional[str]):
+        super().__init__(name, model, limiter)
+        self.base_url = base_url
+        self._api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import openai
+                    # Pooled keep-alive connections shared with every other caller of this host
+                    self._client = openai.OpenAI(base_url=self.base_url, api_key=self._api_key,
+                                                 http_client=get_http_client(self.base_url))
+        return self._client
+
+    def _send(self, request, timeout):
+        raw_response = self.client.chat.completions.with_raw_response.create(
+            model=self.model, **request, timeout=timeout
+        )
+        response = raw_response.parse()
+        usage = getattr(response, "usage", None)
+        return response.choices[0].message.content, raw_response.headers, getattr(usage, "total_tokens", None)
+
+
+class FakeProvider(Provider):
+    """
+    Local stand-in for tests and load benchmarks: answers after `latency` seconds
+    (plus up to `jitter`), fails with probability `failure_rate`, and returns
+    well-formed questions unless a custom `responder(request) -> str` is given.
+    """
+
+    def __init__(self, name: str = "fake", latency: float = 0.05, jitter: float = 0.0,
+                 failure_rate: float = 0.0, responder: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 limiter: Optional[AdaptiveRateLimiter] = None):
+        limiter = limiter or _make_limiter(name, {"requests_per_minute": 600000, "tokens_per_minute": 1e9},
+                                           shared=False)
+        super().__init__(name, "fake-model", limiter)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.responder = responder or _fake_questions
+        self.calls = 0
+
+    def _send(self, request, timeout):
+        self.calls += 1
+        time.sleep(self.latency + random.random() * self.jitter)
+        if random.random() < self.failure_rate:
+            raise RuntimeError(f"{self.name}: simulated provider failure")
+        return self.responder(request), {}, None
+
+
+def _fake_questions(request: Dict[str, Any]) -> str:
+    prompt = request["messages"][-1]["content"]
+    match = re.search(r"array of exactly (\d+) objects", prompt)
+    question = {
+        "question_text": "A body starts from rest with acceleration 2 m/s^2. How far does it travel in 3 s?",
+        "options": {"A": "6 m", "B": "9 m", "C": "12 m", "D": "18 m"},
+        "correct_answer": "B",
+        "explanation": "s = (1/2)at^2 = 0.5 * 2 * 9 = 9 m.",
+    }
+    if match:
+        return json.dumps({"questions": [question] * int(match.group(1))})
+    return json.dumps(question)
+
+
+def _make_limiter(name: str, config: Dict[str, Any], shared: bool = True) -> AdaptiveRateLimiter:
+    prefix = config.get("env_prefix", name.upper())
+    requests = bucket_from_env(
+        f"{prefix}_REQUESTS",
+        default_per_minute=config.get("requests_per_minute", 60.0 / REQUEST_INTERVAL_SECONDS),
+        shared_path=_shared_state_path(f"{name}_requests.json") if shared else None,
+    )
+    tokens_per_minute = config.get("tokens_per_minute", DEFAULT_TOKENS_PER_MINUTE)
+    tokens = bucket_from_env(
+        f"{prefix}_TOKENS",
+        default_per_minute=tokens_per_minute,
+        default_burst=tokens_per_minute,
+        shared_path=_shared_state_path(f"{name}_tokens.json") if shared else None,
+    )
+    return AdaptiveRateLimiter(requests, tokens)
+
+
+def build_provider(config: Dict[str, Any]) -> Provider:
+    kind = config.get("kind", "openai")
+    name = config["name"]
+    if kind == "fake":
+        return FakeProvider(name, latency=float(config.get("latency", 0.05)),
+                            jitter=float(config.get("jitter", 0.0)),
+                            failure_rate=float(config.get("failure_rate", 0.0)))
+    if kind != "openai":
+        raise ValueError(f"Unknown provider kind {kind!r} for {name}")
+    defaults = next((p for p in DEFAULT_PROVIDERS if p["name"] == name), {})
+    config = {**defaults, **config}
+    return OpenAICompatibleProvider(
+        name, config["model"], _make_limiter(name, config),
+        base_url=config["base_url"], api_key=os.getenv(config.get("api_key_env", ""), config.get("api_key")),
+    )
+
+
+class ProviderRouter:
+    """
+    Spreads requests over several providers, favouring the ones that have been
+    fast recently and still have rate-limit headroom, and optionally hedges slow
+    requests to a second provider.
+    """
+
+    def __init__(self, providers: List[Provider], hedging: bool = GENERATION_HEDGING,
+                 hedge_percentile: float = HEDGE_PERCENTILE, hedge_min_samples: int = HEDGE_MIN_SAMPLES):
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = providers
+        self.hedging = hedging and len(providers) > 1
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge") if self.hedging else None
+
+    def models(self) -> List[str]:
+        return sorted(f"{p.name}:{p.model}" for p in self.providers)
+
+    def _weight(self, provider: Provider) -> float:
+        measured = [p.stats.ewma for p in self.providers if p.stats.ewma is not None]
+        # Providers without samples yet look as fast as the best one, so they get tried
+        latency = provider.stats.ewma if provider.stats.ewma is not None else min(measured, default=1.0)
+        weight = max(provider.headroom(), 0.01) / max(latency, 0.01)
+        return weight / (1 + 4 * provider.stats.consecutive_failures)
+
+    def pick(self, exclude: tuple = ()) -> Optional[Provider]:
+        candidates = [p for p in self.providers if p not in exclude]
+        if not candidates:
+            return None
+        return random.choices(candidates, weights=[self._weight(p) for p in candidates])[0]
+
+    def _hedge_after(self, provider: Provider) -> Optional[float]:
+        if len(provider.stats) < self.hedge_min_samples:
+            return None
+        return provider.stats.percentile(self.hedge_percentile)
+
+    def complete(self, request: Dict[str, Any], timeout: float = 120,
+                 estimated_tokens: float = 0.0) -> ProviderResponse:
+        primary = self.pick()
+        hedge_after = self._hedge_after(primary) if self.hedging else None
+        if hedge_after is None:
+            return primary.complete(request, timeout, estimated_tokens)
+
+        futures = {self._hedge_pool.submit(primary.complete, request, timeout, estimated_tokens): primary}
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            secondary = self.pick(exclude=(primary,))
+            print(f"    {primary.name} slower than its p{self.hedge_percentile:g} ({hedge_after:.1f}s); "
+                  f"hedging to {secondary.name}")
+            futures[self._hedge_pool.submit(secondary.complete, request, timeout, estimated_tokens)] = secondary
+
+        # First successful answer wins; only fail once every attempt has failed
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+        raise error
+
+
+def providers_from_env() -> List[Provider]:
+    raw = os.getenv("GENERATION_PROVIDERS")
+    configs = json.loads(raw) if raw else DEFAULT_PROVIDERS
+    return [build_provider(config) for config in configs]
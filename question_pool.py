@@ -0,0 +1,256 @@
+# question_pool.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from question_schema import is_valid_question
+from resources import lazy_resource
+
+QUESTION_POOL_DB = os.environ.get("QUESTION_POOL_DB", "question_pool.sqlite3")
+# A pooled question is retired after it has been served to this many different users
+POOL_MAX_SERVES = int(os.environ.get("POOL_MAX_SERVES", "20"))
+# The replenisher tops a concept back up when fewer than this many questions are still servable
+POOL_LOW_WATER = int(os.environ.get("POOL_LOW_WATER", "6"))
+POOL_REFILL_BATCH = int(os.environ.get("POOL_REFILL_BATCH", "3"))
+POOL_REPLENISH_INTERVAL_SECONDS = float(os.environ.get("POOL_REPLENISH_INTERVAL_SECONDS", "300"))
+REPLENISH_LEASE_SECONDS = 600
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS pool_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subject TEXT NOT NULL,
+        concept TEXT NOT NULL,
+        difficulty TEXT NOT NULL,
+        question TEXT NOT NULL,
+        serve_count INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_pool_lookup ON pool_questions (subject, concept, difficulty, serve_count)",
+    """
+    CREATE TABLE IF NOT EXISTS pool_served (
+        user_id TEXT NOT NULL,
+        question_id INTEGER NOT NULL,
+        served_at REAL NOT NULL,
+        PRIMARY KEY (user_id, question_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pool_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+]
+
+
+def is_poolable(question: Dict[str, Any]) -> bool:
+    """Only questions that pass the schema (options A-D, answer one of them) go into the pool."""
+    return is_valid_question(question)
+
+
+class QuestionPool:
+    """
+    SQLite-backed pool of generated questions indexed by (subject, concept,
+    difficulty). Questions are reused across users but never served twice to
+    the same user; the file is shared by every gunicorn worker.
+    """
+
+    def __init__(self, path: str = QUESTION_POOL_DB, max_serves: int = POOL_MAX_SERVES):
+        self.path = path
+        self.max_serves = max_serves
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, subject: str, concept: str, question: Dict[str, Any],
+            served_to: Optional[str] = None) -> Optional[int]:
+        """Stores a validated question, optionally recording it as already served to a user."""
+        if not is_poolable(question):
+            return None
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO pool_questions (subject, concept, difficulty, question, serve_count, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (subject, concept, str(question.get("difficulty", "")), json.dumps(question),
+                 1 if served_to else 0, now),
+            )
+            question_id = cur.lastrowid
+            if served_to:
+                conn.execute("INSERT OR IGNORE INTO pool_served (user_id, question_id, served_at) VALUES (?, ?, ?)",
+                             (served_to, question_id, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return question_id
+
+    def candidates(self, user_id: Optional[str], subject: str, concept: str, n: int,
+                   difficulty: Optional[str] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Up to `n` (id, question) pairs for (subject, concept) that `user_id` has
+        not seen, least-served first. With `difficulty` only that level is
+        returned; without it the picks alternate between difficulty levels, the
+        way live generation mixes whatever templates retrieval finds. Nothing is
+        recorded until mark_served.
+        """
+        if n <= 0:
+            return []
+        rows = self._connect().execute(
+            """
+            SELECT id, question FROM (
+                SELECT id, question, serve_count,
+                       ROW_NUMBER() OVER (PARTITION BY difficulty ORDER BY serve_count, id) AS turn
+                FROM pool_questions
+                WHERE subject = ? AND concept = ? AND serve_count < ? AND (? IS NULL OR difficulty = ?)
+                  AND id NOT IN (SELECT question_id FROM pool_served WHERE user_id = ?)
+            )
+            ORDER BY turn, serve_count, id
+            LIMIT ?
+            """,
+            (subject, concept, self.max_serves, difficulty, difficulty, user_id or "", n),
+        ).fetchall()
+        return [(question_id, json.loads(q)) for question_id, q in rows]
+
+    def mark_served(self, user_id: Optional[str], question_ids: Iterable[int]) -> None:
+        """Records the questions as served (to `user_id`, if given), counting each user once."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for question_id in question_ids:
+                if user_id:
+                    cur = conn.execute("INSERT OR IGNORE INTO pool_served (user_id, question_id, served_at) "
+                                       "VALUES (?, ?, ?)", (user_id, question_id, now))
+                    if not cur.rowcount:
+                        continue
+                conn.execute("UPDATE pool_questions SET serve_count = serve_count + 1 WHERE id = ?", (question_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def available(self, subject: str, concept: str) -> int:
+        """Number of questions for (subject, concept) that can still be served."""
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM pool_questions WHERE subject = ? AND concept = ? AND serve_count < ?",
+            (subject, concept, self.max_serves),
+        ).fetchone()
+        return int(row[0])
+
+    def low_concepts(self, blueprint: Dict[str, Any], low_water: int = POOL_LOW_WATER) -> List[tuple]:
+        """(subject, concept, available) for every blueprint concept below the low-water mark."""
+        low = []
+        for subject, details in blueprint.items():
+            for concept in details["concepts"]:
+                available = self.available(subject, concept)
+                if available < low_water:
+                    low.append((subject, concept, available))
+        return low
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Takes (or renews) a named lease so only one worker process runs a given
+        background task at a time. Returns False while another owner holds it.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO pool_leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE pool_leases.owner = excluded.owner OR pool_leases.expires_at < ?",
+                (name, owner, now + ttl, now),
+            )
+            row = conn.execute("SELECT owner FROM pool_leases WHERE name = ?", (name,)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None and row[0] == owner
+
+
+def _load_question_pool():
+    return QuestionPool(os.environ.get("QUESTION_POOL_DB", QUESTION_POOL_DB))
+
+_question_pool = lazy_resource("question_pool", _load_question_pool)
+
+def get_question_pool() -> QuestionPool:
+    return _question_pool.get()
+
+
+class PoolReplenisher:
+    """
+    Background thread that keeps every blueprint concept above the low-water mark.
+    `generate_fn(subject, concept, n)` must return a list of question dicts; the
+    agent's retrieval + generation pipeline is plugged in by the server.
+    """
+
+    def __init__(self, pool: QuestionPool, blueprint: Dict[str, Any],
+                 generate_fn: Callable[[str, str, int], List[Dict[str, Any]]],
+                 low_water: int = POOL_LOW_WATER, batch: int = POOL_REFILL_BATCH,
+                 interval: float = POOL_REPLENISH_INTERVAL_SECONDS):
+        self.pool = pool
+        self.blueprint = blueprint
+        self.generate_fn = generate_fn
+        self.low_water = low_water
+        self.batch = batch
+        self.interval = interval
+        self._owner = f"{os.getpid()}-{id(self)}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """Tops up every low concept by one batch; returns the number of questions added."""
+        added = 0
+        for subject, concept, available in self.pool.low_concepts(self.blueprint, self.low_water):
+            # Every gunicorn worker starts a replenisher; only the lease holder generates.
+            # The lease is renewed per concept since a full pass can outlast the interval.
+            if self._stop.is_set() or not self.pool.acquire_lease("replenisher", self._owner, REPLENISH_LEASE_SECONDS):
+                break
+            wanted = min(self.batch, self.low_water - available)
+            print(f"Replenishing pool: {subject} / {concept} ({available} available, generating {wanted})")
+            try:
+                questions = self.generate_fn(subject, concept, wanted)
+            except Exception as e:
+                print(f"Pool replenishment failed for {concept}: {e}")
+                continue
+            for question in questions:
+                if self.pool.add(subject, concept, question) is not None:
+                    added += 1
+        return added
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Pool replenisher error: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self._loop, name="pool-replenisher", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
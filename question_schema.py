@@ -0,0 +1,109 @@
+# question_schema.py
+import json
+import re
+from typing import Any, Dict, List
+
+OPTION_KEYS = ("A", "B", "C", "D")
+
+_decoder = json.JSONDecoder()
+_JSON_START = re.compile(r"[\{\[]")
+_KEY_DECORATION = re.compile(r"^\s*(?:option\s+)?[\(\[]?\s*([A-Da-d])\s*[\)\]\.:]?\s*$", re.IGNORECASE)
+
+
+class SchemaError(ValueError):
+    """A provider answer that cannot be turned into a valid question."""
+
+
+def extract_json(text: str) -> Any:
+    """
+    Parses the first JSON object or array in `text`, ignoring code fences and any
+    prose around it. Decoding starts at the first '{' or '[' and stops at the end
+    of that value, so a well-formed answer is parsed in a single pass.
+    """
+    if not isinstance(text, str):
+        raise SchemaError("Expected string for JSON extraction")
+    start = 0
+    while True:
+        match = _JSON_START.search(text, start)
+        if match is None:
+            raise SchemaError("No JSON object found in model output")
+        try:
+            value, _ = _decoder.raw_decode(text, match.start())
+            return value
+        except json.JSONDecodeError:
+            # A stray brace in leading prose; try the next candidate
+            start = match.start() + 1
+
+
+def _option_key(key: Any) -> str:
+    match = _KEY_DECORATION.match(str(key))
+    return match.group(1).upper() if match else str(key).strip()
+
+
+def _normalize_options(raw: Any, problems: List[str]) -> Dict[str, str]:
+    if isinstance(raw, list) and len(raw) == len(OPTION_KEYS):
+        raw = dict(zip(OPTION_KEYS, raw))
+    if not isinstance(raw, dict):
+        problems.append("options must be an object with keys A-D")
+        return {}
+    options = {_option_key(k): "" if v is None else str(v).strip() for k, v in raw.items()}
+    if sorted(options) != list(OPTION_KEYS):
+        problems.append(f"options must have exactly the keys A-D, got {sorted(options)}")
+    elif not all(options.values()):
+        problems.append("every option needs a non-empty value")
+    elif len(set(options.values())) < len(options):
+        problems.append("options must be distinct")
+    return options
+
+
+def _normalize_answer(raw: Any, options: Dict[str, str], problems: List[str]) -> str:
+    answer = "" if raw is None else str(raw).strip()
+    key = _option_key(answer)
+    if key in options:
+        return key
+    # Some models answer with the option text instead of its key
+    by_value = {value.lower(): k for k, value in options.items()}
+    if answer.lower() in by_value:
+        return by_value[answer.lower()]
+    problems.append(f"correct_answer {answer!r} is not one of the option keys")
+    return answer
+
+
+def normalize_question(raw: Any) -> Dict[str, Any]:
+    """
+    Validates one generated question and returns it as question_text, options
+    (exactly A-D), correct_answer (an option key) and explanation. Accepts a dict,
+    a list holding one, or a string containing JSON. Small slips are repaired
+    (option keys like "(a)", answers given as option text); anything else raises
+    SchemaError naming every problem found.
+    """
+    if isinstance(raw, str):
+        raw = extract_json(raw)
+    if isinstance(raw, list) and raw and isinstance(raw[0], dict):
+        raw = raw[0]
+    if not isinstance(raw, dict):
+        raise SchemaError(f"Expected a question object, got {type(raw).__name__}")
+
+    problems: List[str] = []
+    question_text = str(raw.get("question_text") or raw.get("text") or "").strip()
+    if not question_text:
+        problems.append("question_text is empty")
+    options = _normalize_options(raw.get("options"), problems)
+    correct_answer = _normalize_answer(raw.get("correct_answer") or raw.get("answer"), options, problems)
+    explanation = raw.get("explanation") or raw.get("rationale") or ""
+    if problems:
+        raise SchemaError("; ".join(problems))
+    return {
+        "question_text": question_text,
+        "options": options,
+        "correct_answer": correct_answer,
+        "explanation": str(explanation).strip(),
+    }
+
+
+def is_valid_question(raw: Any) -> bool:
+    try:
+        normalize_question(raw)
+    except SchemaError:
+        return False
+    return True
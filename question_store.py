@@ -0,0 +1,214 @@
+# question_store.py
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+QUESTION_STORE_DIR = "question_store"
+TEXT_COLUMNS = ['question', 'option1', 'option2', 'option3', 'option4', 'solution', 'explanation', 'difficulty', 'difficulty_prob', 'concept']
+
+# Columns with at most this share of distinct values are stored as int32 codes + a vocabulary
+DICTIONARY_MAX_RATIO = 0.1
+
+
+def _write_blob_column(out_dir: str, col: str, values: List[str]) -> None:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    np.save(os.path.join(out_dir, f"{col}.offsets.npy"), offsets)
+    with open(os.path.join(out_dir, f"{col}.blob"), "wb") as f:
+        f.write(b"".join(encoded))
+
+
+def _write_dictionary_column(out_dir: str, col: str, values: List[str]) -> None:
+    vocab = list(dict.fromkeys(values))
+    lookup = {v: i for i, v in enumerate(vocab)}
+    np.save(os.path.join(out_dir, f"{col}.codes.npy"), np.array([lookup[v] for v in values], dtype=np.int32))
+    with open(os.path.join(out_dir, f"{col}.vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def csv_fingerprint(csv_path: str) -> Dict[str, object]:
+    """Size, mtime and SHA-256 of the source CSV, recorded in meta.json."""
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": _file_sha256(csv_path)}
+
+
+def _source_changed(meta: Dict[str, object], csv_path: str) -> bool:
+    """
+    Whether the CSV differs from the one the store was converted from. Size and
+    mtime are checked first; a matching size with a new mtime (e.g. a fresh
+    checkout) is settled by the hash.
+    """
+    recorded = meta.get("source_fingerprint")
+    if not isinstance(recorded, dict):
+        return True
+    stat = os.stat(csv_path)
+    if stat.st_size != recorded.get("size"):
+        return True
+    if stat.st_mtime == recorded.get("mtime"):
+        return False
+    return _file_sha256(csv_path) != recorded.get("sha256")
+
+
+def convert_csv(csv_path: str, out_dir: str = QUESTION_STORE_DIR, replace: bool = False) -> str:
+    """
+    Converts the question CSV into the columnar store. Free-text columns become
+    an int64 offsets array (n+1 entries) plus a UTF-8 blob; low-cardinality
+    columns (difficulty, concept, ...) become int32 codes plus a vocabulary.
+    The store is written to a temporary directory and renamed into place, so
+    concurrent workers never see a half-written store. With `replace` an
+    existing store is swapped out; workers that mapped it keep their copy.
+    """
+    import pandas as pd
+
+    fingerprint = csv_fingerprint(csv_path)
+    df = pd.read_csv(csv_path)
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].fillna('')
+
+    tmp_dir = f"{out_dir}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_dir)
+    encodings = {}
+    for col in TEXT_COLUMNS:
+        values = [str(v) for v in df[col]]
+        if len(set(values)) <= max(1, DICTIONARY_MAX_RATIO * len(values)):
+            _write_dictionary_column(tmp_dir, col, values)
+            encodings[col] = "dictionary"
+        else:
+            _write_blob_column(tmp_dir, col, values)
+            encodings[col] = "blob"
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"rows": len(df), "columns": TEXT_COLUMNS, "encodings": encodings,
+                   "source": os.path.basename(csv_path), "source_fingerprint": fingerprint}, f)
+
+    old_dir = None
+    if replace and os.path.exists(out_dir):
+        old_dir = f"{out_dir}.old-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(out_dir, old_dir)
+        except OSError:
+            # Another worker is swapping the store right now
+            old_dir = None
+    try:
+        os.rename(tmp_dir, out_dir)
+        print(f"Converted {len(df)} questions from {csv_path} into {out_dir}")
+    except OSError:
+        # Another worker finished the conversion first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return out_dir
+
+
+class _BlobColumn:
+    def __init__(self, path: str, col: str):
+        self._offsets = np.load(os.path.join(path, f"{col}.offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(path, f"{col}.blob")
+        # np.memmap cannot map an empty file
+        if os.path.getsize(blob_path) > 0:
+            self._blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self._blob = np.zeros(0, dtype=np.uint8)
+
+    def get(self, row_id: int) -> str:
+        start, end = int(self._offsets[row_id]), int(self._offsets[row_id + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+
+class _DictionaryColumn:
+    def __init__(self, path: str, col: str):
+        self._codes = np.load(os.path.join(path, f"{col}.codes.npy"), mmap_mode="r")
+        with open(os.path.join(path, f"{col}.vocab.json"), "r", encoding="utf-8") as f:
+            self._vocab = json.load(f)
+
+    def get(self, row_id: int) -> str:
+        return self._vocab[int(self._codes[row_id])]
+
+
+class QuestionStore:
+    """
+    Read-only, memory-mapped view of the question table. Columns are opened on
+    first access, so callers only pay for the columns they read, and every worker
+    maps the same files through the page cache. Rows are read by id into plain
+    dicts; no DataFrame is ever built.
+    """
+
+    def __init__(self, path: str = QUESTION_STORE_DIR):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.rows = int(meta["rows"])
+        self.columns = list(meta["columns"])
+        self._encodings = meta.get("encodings", {})
+        self._open_columns = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.rows
+
+    def _column(self, column: str):
+        col = self._open_columns.get(column)
+        if col is None:
+            if column not in self.columns:
+                raise KeyError(f"Unknown question column: {column}")
+            with self._lock:
+                col = self._open_columns.get(column)
+                if col is None:
+                    column_type = _DictionaryColumn if self._encodings.get(column) == "dictionary" else _BlobColumn
+                    col = column_type(self.path, column)
+                    self._open_columns[column] = col
+        return col
+
+    def value(self, column: str, row_id: int) -> str:
+        return self._column(column).get(int(row_id))
+
+    def row(self, row_id: int, columns: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        return {col: self.value(col, row_id) for col in (columns or self.columns)}
+
+    def rows_for(self, row_ids: Iterable[int], columns: Optional[Iterable[str]] = None) -> List[Dict[str, str]]:
+        columns = list(columns or self.columns)
+        return [self.row(i, columns) for i in row_ids]
+
+
+def open_question_store(store_dir: str = QUESTION_STORE_DIR,
+                        csv_path: str = "question_difficulty_concept.csv") -> QuestionStore:
+    """
+    Opens the store, converting it from the CSV on first use and again whenever
+    the CSV has changed since the last conversion. A store shipped without its
+    CSV is used as is.
+    """
+    meta_path = os.path.join(store_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        convert_csv(csv_path, store_dir)
+    elif os.path.exists(csv_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if _source_changed(meta, csv_path):
+            print(f"{csv_path} changed since {store_dir} was built; converting it again.")
+            convert_csv(csv_path, store_dir, replace=True)
+    return QuestionStore(store_dir)
+
+
+if __name__ == '__main__':
+    # python question_store.py [csv_path] [store_dir]
+    csv_arg = sys.argv[1] if len(sys.argv) > 1 else "question_difficulty_concept.csv"
+    out_arg = sys.argv[2] if len(sys.argv) > 2 else QUESTION_STORE_DIR
+    if os.path.exists(out_arg):
+        print(f"{out_arg} already exists; remove it first to rebuild the store.")
+        sys.exit(1)
+    convert_csv(csv_arg, out_arg)
@@ -0,0 +1,294 @@
+# rate_limit.py
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process backend, buckets stay per process
+    fcntl = None
+
+# Window the provider's x-ratelimit-limit-* values refer to (OpenAI-compatible APIs: per minute)
+RATE_LIMIT_WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+# Longest a reset or Retry-After may hold a bucket (or a provider) back. Bounds the damage of a
+# misread header; a bucket persisted with a later refill time is pulled back to this on use.
+RATE_LIMIT_MAX_PAUSE_SECONDS = float(os.getenv("RATE_LIMIT_MAX_PAUSE_SECONDS", str(RATE_LIMIT_WINDOW_SECONDS)))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate` per second up
+    to `capacity`; `acquire` blocks until enough tokens are available. Rate and
+    capacity can be changed at runtime, e.g. from provider headers.
+    """
+
+    _clock = staticmethod(time.monotonic)
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._state = {"rate": float(rate), "capacity": max(float(capacity), 1.0)}
+        self._state.update(tokens=self._state["capacity"], updated=self._clock())
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self):
+        """Yields the mutable bucket state under the lock; changes are kept on exit."""
+        with self._lock:
+            yield self._state
+
+    @property
+    def rate(self) -> float:
+        with self._transaction() as state:
+            return state["rate"]
+
+    @property
+    def capacity(self) -> float:
+        with self._transaction() as state:
+            return state["capacity"]
+
+    def _refill(self, state: Dict[str, float], now: float):
+        state["updated"] = min(state["updated"], now + RATE_LIMIT_MAX_PAUSE_SECONDS)
+        elapsed = now - state["updated"]
+        if elapsed > 0:
+            state["tokens"] = min(state["capacity"], state["tokens"] + elapsed * state["rate"])
+            state["updated"] = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Blocks until `tokens` can be taken from the bucket."""
+        while True:
+            with self._transaction() as state:
+                needed = min(float(tokens), state["capacity"])
+                now = self._clock()
+                self._refill(state, now)
+                if state["tokens"] >= needed:
+                    state["tokens"] -= needed
+                    return
+                # A drained bucket has its refill start in the future
+                wait = max(state["updated"] - now, 0.0) + (needed - max(state["tokens"], 0.0)) / state["rate"]
+            # Sleep outside the lock so other threads can refill/inspect the bucket
+            time.sleep(wait)
+
+    def debit(self, tokens: float):
+        """Takes `tokens` without blocking (the balance may go negative), e.g. to settle actual usage."""
+        with self._transaction() as state:
+            self._refill(state, self._clock())
+            state["tokens"] -= float(tokens)
+
+    def drain(self, seconds: float):
+        """
+        Empties the bucket and pushes the next refill `seconds` (at most
+        RATE_LIMIT_MAX_PAUSE_SECONDS) into the future.
+        """
+        with self._transaction() as state:
+            now = self._clock()
+            state["tokens"] = min(state["tokens"], 0.0)
+            state["updated"] = min(max(state["updated"], now + max(seconds, 0.0)),
+                                   now + RATE_LIMIT_MAX_PAUSE_SECONDS)
+
+    def configure(self, rate: Optional[float] = None, capacity: Optional[float] = None):
+        """Changes the refill rate and/or capacity, keeping the current balance."""
+        with self._transaction() as state:
+            self._refill(state, self._clock())
+            if rate is not None and rate > 0:
+                state["rate"] = float(rate)
+            if capacity is not None:
+                state["capacity"] = max(float(capacity), 1.0)
+                state["tokens"] = min(state["tokens"], state["capacity"])
+
+    def observe(self, remaining: Optional[float] = None, reset_seconds: Optional[float] = None):
+        """
+        Reconciles the local balance with what the provider reports: never more
+        than `remaining`, and nothing at all until `reset_seconds` if it is zero.
+        """
+        if remaining is None:
+            return
+        if remaining <= 0:
+            self.drain(reset_seconds or 0.0)
+            return
+        with self._transaction() as state:
+            self._refill(state, self._clock())
+            state["tokens"] = min(state["tokens"], float(remaining))
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose state lives in a small JSON file guarded by flock, so every
+    gunicorn worker on the host draws from the same budget.
+    """
+
+    _clock = staticmethod(time.time)
+
+    def __init__(self, path: str, rate: float, capacity: float = 1.0):
+        if fcntl is None:
+            raise RuntimeError("SharedTokenBucket needs fcntl (POSIX only)")
+        super().__init__(rate, capacity)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Keep the existing budget when another worker has already created the file
+        with self._transaction():
+            pass
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw else dict(self._state)
+                except json.JSONDecodeError:
+                    state = dict(self._state)
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+# Plain numbers this large are not durations but absolute reset times (OpenRouter sends
+# x-ratelimit-reset as epoch milliseconds): epoch seconds or milliseconds after 2001
+_EPOCH_SECONDS_MIN = 1e9
+_EPOCH_MILLISECONDS_MIN = 1e12
+
+
+def parse_duration(value: Any) -> Optional[float]:
+    """
+    Parses reset values such as "12", "1.5", "20ms", "6m0s" or "1h2m3s" into
+    seconds. Absolute epoch timestamps (in seconds or milliseconds) become the
+    time left until them.
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        pass
+    else:
+        if number >= _EPOCH_MILLISECONDS_MIN:
+            number /= 1000.0
+        if number >= _EPOCH_SECONDS_MIN:
+            return max(number - time.time(), 0.0)
+        return number
+    parts = _DURATION_PART.findall(text)
+    if not parts:
+        return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """Retry-After is either delay-seconds or an HTTP date."""
+    if value is None:
+        return None
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(parsedate_to_datetime(str(value)).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _header(headers: Mapping[str, str], *names: str) -> Optional[str]:
+    """First of `names` present in `headers` (lower-cased keys)."""
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def parse_rate_limit_headers(headers: Optional[Mapping[str, str]]) -> Dict[str, Optional[float]]:
+    """
+    Extracts the provider's quota view from response headers. Understands the
+    OpenAI-style `x-ratelimit-{limit,remaining,reset}-{requests,tokens}` names
+    and the bare `x-ratelimit-{limit,remaining,reset}` variant (requests).
+    """
+    # Header names are case-insensitive; providers differ (OpenRouter sends X-RateLimit-*)
+    headers = {str(name).lower(): value for name, value in (headers or {}).items()}
+    return {
+        "limit_requests": _number(_header(headers, "x-ratelimit-limit-requests", "x-ratelimit-limit")),
+        "remaining_requests": _number(_header(headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining")),
+        "reset_requests": parse_duration(_header(headers, "x-ratelimit-reset-requests", "x-ratelimit-reset")),
+        "limit_tokens": _number(_header(headers, "x-ratelimit-limit-tokens")),
+        "remaining_tokens": _number(_header(headers, "x-ratelimit-remaining-tokens")),
+        "reset_tokens": parse_duration(_header(headers, "x-ratelimit-reset-tokens")),
+        "retry_after": parse_retry_after(_header(headers, "retry-after")),
+    }
+
+
+class AdaptiveRateLimiter:
+    """
+    Request and token budgets for one provider. Starts from configured defaults
+    and follows the provider's rate-limit headers: the advertised limits set the
+    refill rates, `remaining`/`reset` correct the balance, and Retry-After pauses
+    every caller sharing the buckets.
+    """
+
+    def __init__(self, requests: TokenBucket, tokens: TokenBucket,
+                 window_seconds: float = RATE_LIMIT_WINDOW_SECONDS):
+        self.requests = requests
+        self.tokens = tokens
+        self.window_seconds = window_seconds
+
+    def acquire(self, estimated_tokens: float = 0.0):
+        """Blocks until one request and `estimated_tokens` tokens fit in the budget."""
+        self.requests.acquire(1.0)
+        if estimated_tokens > 0:
+            self.tokens.acquire(estimated_tokens)
+
+    def settle(self, estimated_tokens: float, actual_tokens: Optional[float]):
+        """Charges (or refunds) the difference between estimated and actual token usage."""
+        if actual_tokens is not None:
+            self.tokens.debit(float(actual_tokens) - float(estimated_tokens))
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> Dict[str, Optional[float]]:
+        info = parse_rate_limit_headers(headers)
+        if info["limit_requests"]:
+            self.requests.configure(rate=info["limit_requests"] / self.window_seconds)
+        if info["limit_tokens"]:
+            self.tokens.configure(rate=info["limit_tokens"] / self.window_seconds,
+                                  capacity=info["limit_tokens"])
+        self.requests.observe(info["remaining_requests"], info["reset_requests"])
+        self.tokens.observe(info["remaining_tokens"], info["reset_tokens"])
+        if info["retry_after"]:
+            self.pause(info["retry_after"])
+        return info
+
+    def pause(self, seconds: float):
+        """Holds back every caller (in every worker, with the shared backend) for `seconds`."""
+        self.requests.drain(seconds)
+
+
+def bucket_from_env(prefix: str, default_per_minute: float, default_burst: float = 1.0,
+                    shared_path: Optional[str] = None) -> TokenBucket:
+    """
+    Builds a TokenBucket from `<prefix>_PER_MINUTE` and `<prefix>_BURST`
+    environment variables, falling back to the given defaults. With
+    `shared_path` (and fcntl available) the bucket is shared across processes.
+    """
+    per_minute = float(os.getenv(f"{prefix}_PER_MINUTE", default_per_minute))
+    burst = float(os.getenv(f"{prefix}_BURST", default_burst))
+    if shared_path and fcntl is not None:
+        return SharedTokenBucket(shared_path, rate=per_minute / 60.0, capacity=burst)
+    return TokenBucket(rate=per_minute / 60.0, capacity=burst)
@@ -0,0 +1,90 @@
+# resources.py
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+_registry: Dict[str, "LazyResource"] = {}
+_registry_lock = threading.Lock()
+
+
+class LazyResource:
+    """
+    A value that is built on first use and then shared. Loading happens once even
+    when several request threads ask for it at the same time.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._loaded = False
+        self._error: Optional[str] = None
+        self._load_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> Any:
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                print(f"Loading resource: {self.name}...")
+                start = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                except Exception as e:
+                    self._error = str(e)
+                    raise
+                self._load_seconds = time.perf_counter() - start
+                self._error = None
+                self._loaded = True
+                print(f"Resource {self.name} ready in {self._load_seconds:.2f}s")
+        return self._value
+
+    def status(self) -> Dict[str, Any]:
+        return {"loaded": self._loaded, "load_seconds": self._load_seconds, "error": self._error}
+
+
+def lazy_resource(name: str, loader: Callable[[], Any]) -> LazyResource:
+    """Registers a lazily loaded resource under `name` (re-registering returns the existing one)."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LazyResource(name, loader)
+        return _registry[name]
+
+
+def warm_up() -> List[str]:
+    """
+    Loads every registered resource. Loading one resource may import modules
+    that register more, so this repeats until nothing new shows up. Returns the
+    names of resources that failed to load.
+    """
+    failed = set()
+    while True:
+        with _registry_lock:
+            pending = [r for name, r in _registry.items() if not r.loaded and name not in failed]
+        if not pending:
+            return sorted(failed)
+        for resource in pending:
+            try:
+                resource.get()
+            except Exception as e:
+                print(f"Warm-up of {resource.name} failed: {e}")
+                failed.add(resource.name)
+
+
+def start_background_warm_up() -> threading.Thread:
+    """Warms every resource on a daemon thread so the first heavy request does not pay for it."""
+    thread = threading.Thread(target=warm_up, name="resource-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> Dict[str, Any]:
+    """Per-resource load state, and whether everything registered so far is loaded."""
+    with _registry_lock:
+        statuses = {name: r.status() for name, r in _registry.items()}
+    return {"ready": bool(statuses) and all(s["loaded"] for s in statuses.values()), "resources": statuses}
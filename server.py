@@ -1,15 +1,23 @@
-from flask import Flask, request, jsonify, redirect, session, url_for
+from flask import Flask, request, jsonify, redirect, session, url_for, Response
 from flask_cors import CORS
-from agent import get_agent_graph
 from concept_weight import concepts_for_paper
 import pyrebase
 import os
 import json
 from google_auth_oauthlib.flow import Flow
-import requests # Make sure to install this
 import secrets
 from datetime import datetime
 import uuid
+import queue
+from resources import lazy_resource, start_background_warm_up, readiness
+from jobs import JobManager
+from http_client import get_http_client
+from question_pool import PoolReplenisher, get_question_pool
+from checkpoints import PAPER_CHECKPOINTS, open_checkpointer, get_generation_journal
+from data_access import DataAccess
+from analytics import AnalyticsAggregates, grade_answers
+from mastery import MasteryEngine
+from token_cache import FirebaseTokenVerifier, KeysUnavailable, ProfileCache, project_id_from_config
 
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
@@ -25,8 +33,21 @@ with open(file_path, 'r') as file:
 firebase = pyrebase.initialize_app(config)    
 auth = firebase.auth()
 
+# Firebase ID tokens are verified locally against Google's cached signing keys instead of a
+# get_account_info round-trip per request; LOCAL_TOKEN_VERIFICATION=0 restores the remote check.
+_project_id = project_id_from_config(config)
+token_verifier = (FirebaseTokenVerifier(_project_id)
+                  if _project_id and os.environ.get("LOCAL_TOKEN_VERIFICATION", "1") == "1" else None)
+profile_cache = ProfileCache()
+
 # Add this line to connect to the database
 db = firebase.database()
+# Per-user reads (papers, test results, user lookups) go through indexed queries
+data_access = DataAccess(firebase.database)
+analytics_aggregates = AnalyticsAggregates(firebase.database, data_access)
+mastery_engine = MasteryEngine(
+    data_access, list(dict.fromkeys(c for subject in concepts_for_paper.values() for c in subject["concepts"]))
+)
 pending_verifications = {}
 
 # Initialize Flask app
@@ -194,7 +215,7 @@ def google_login_callback():
         # 3. Get user info from Google
         user_info_url = 'https://www.googleapis.com/oauth2/v3/userinfo'
         headers = {'Authorization': f'Bearer {google_access_token}'}
-        user_info_response = requests.get(user_info_url, headers=headers)
+        user_info_response = get_http_client(user_info_url).get(user_info_url, headers=headers)
         
         if user_info_response.status_code != 200:
             raise Exception("Failed to fetch user info from Google")
@@ -208,15 +229,10 @@ def google_login_callback():
         print(f"Google user info: name={name}, email={email}, id={google_user_id}")
         
         # 4. Check if user exists in our database
-        users_data = db.child("users").get().val() or {}
-        existing_user_uid = None
-        
         # Look for existing user by email
-        for uid, user_data in users_data.items():
-            if user_data.get('email') == email:
-                existing_user_uid = uid
-                print(f"Found existing user by email: {uid}")
-                break
+        existing_user_uid, _ = data_access.find_user('email', email)
+        if existing_user_uid:
+            print(f"Found existing user by email: {existing_user_uid}")
         
         if existing_user_uid:
             # Update existing user with Google info
@@ -311,9 +327,54 @@ def google_login_callback():
     
 # ... (rest of your server.py file remains the same) ...
 # --- Load the LangGraph Agent ---
-print("Initializing LangGraph agent...")
-langgraph_app = get_agent_graph()
-print("Agent initialized successfully.")
+# The agent (and with it the index, question store and LLM clients) is loaded lazily so
+# auth endpoints can serve right after boot. A background thread warms it up unless
+# WARM_UP_ON_BOOT=0, in which case the first /generate-paper pays for it.
+def _load_agent_graph():
+    from agent import get_agent_graph
+    return get_agent_graph()
+
+def _load_resumable_agent_graph():
+    from agent import get_agent_graph
+    return get_agent_graph(checkpointer=open_checkpointer())
+
+langgraph_app = lazy_resource("agent_graph", _load_agent_graph)
+# Runs with an idempotency key are checkpointed so a retry can resume them; runs without
+# one can never be resumed, so they use the graph without a checkpointer
+resumable_langgraph_app = lazy_resource("resumable_agent_graph", _load_resumable_agent_graph)
+if os.environ.get("WARM_UP_ON_BOOT", "1") == "1":
+    start_background_warm_up()
+
+# --- Question pool replenishment ---
+# Keeps every blueprint concept stocked with pre-generated questions so papers are mostly
+# assembled from the pool. It draws on the same provider rate limits as live papers, so it is
+# opt-in (POOL_REPLENISHER=1): without it the pool still fills with every generated question.
+def _generate_for_pool(subject, concept, n):
+    from agent import generate_questions_for_concept
+    return generate_questions_for_concept(subject, concept, n)
+
+if os.environ.get("POOL_REPLENISHER", "0") == "1" and os.environ.get("QUESTION_POOL_ENABLED", "1") == "1":
+    PoolReplenisher(get_question_pool(), concepts_for_paper, _generate_for_pool).start()
+
+@app.route('/healthz')
+def healthz():
+    """Liveness/readiness probe: 200 once every heavy resource is loaded, 503 while warming up."""
+    state = readiness()
+    body = {"status": "ready" if state["ready"] else "warming_up", **state}
+    return jsonify(body), 200 if state["ready"] else 503
+
+def verify_firebase_token(token):
+    """
+    Claims of a Firebase ID token ('sub' is the UID). Raises if the token is
+    invalid; goes remote only when the signing keys cannot be fetched.
+    """
+    if token_verifier is not None:
+        try:
+            return token_verifier.verify(token)
+        except KeysUnavailable as e:
+            print(f"{e}; verifying the token remotely.")
+    user_info = auth.get_account_info(token)
+    return {'sub': user_info['users'][0]['localId']}
 
 def validate_user_token(token):
     """
@@ -329,11 +390,15 @@ def validate_user_token(token):
     else:
         # Firebase ID token
         try:
-            user_info = auth.get_account_info(token)
-            uid = user_info['users'][0]['localId']
-            # Get name from database
-            user_data = db.child("users").child(uid).get().val()
-            name = user_data.get('name', 'User') if user_data else 'User'
+            claims = verify_firebase_token(token)
+            uid = claims['sub']
+            # Get name from database, cached for at most the token's lifetime
+            profile = profile_cache.get(uid)
+            if profile is None:
+                user_data = data_access.get("users", uid)
+                profile = {'name': user_data.get('name', 'User') if user_data else 'User'}
+                profile_cache.put(uid, profile, claims.get('exp'))
+            name = profile['name']
             return {
                 'uid': uid,
                 'name': name,
@@ -360,6 +425,81 @@ def my_endpoint():
 
     return jsonify({"status": "success"})
 
+def _idempotency_key(data):
+    """Client-chosen key (Idempotency-Key header or "idempotency_key" field) that makes a retry resume."""
+    return request.headers.get('Idempotency-Key') or (data or {}).get('idempotency_key')
+
+def _generate_paper(user_token, user_name, on_event=None, user_uid=None, idempotency_key=None):
+    """
+    Runs the agent for one user and saves the resulting paper. Returns the paper
+    data with its paper_id. `on_event` receives the agent's progress events;
+    `user_uid` keeps pooled questions from repeating for the same user.
+
+    Runs with an idempotency key are checkpointed under <user>:<idempotency_key>
+    (unless PAPER_CHECKPOINTS=0). Retrying with the same key resumes an
+    interrupted run from its last generated question, and returns the already
+    saved paper if the run had finished.
+    """
+    config = {"configurable": {}}
+    # Without a checkpointer a thread_id would only journal questions nothing ever resumes
+    if idempotency_key and PAPER_CHECKPOINTS:
+        graph = resumable_langgraph_app.get()
+        thread_id = f"{user_uid or 'anonymous'}:{idempotency_key}"
+        config["configurable"]["thread_id"] = thread_id
+    else:
+        graph = langgraph_app.get()
+    if on_event:
+        config["configurable"]["on_event"] = on_event
+
+    snapshot = graph.get_state(config) if graph.checkpointer else None
+    if snapshot and snapshot.values and not snapshot.next:
+        print(f"Run {thread_id} already finished.")
+        final_state = snapshot.values
+        paper_id = get_generation_journal().saved_paper(thread_id)
+        if paper_id:
+            return {**final_state['final_paper'], 'paper_id': paper_id}
+    elif snapshot and snapshot.values:
+        print(f"Resuming run {thread_id} at {snapshot.next}.")
+        if 'plan_paper' not in snapshot.next and on_event:
+            from agent import plan_event
+            on_event(plan_event(snapshot.values))
+        final_state = graph.invoke(None, config=config)
+    else:
+        # Manipulation concepts_for_paper as per users before sending to the agent
+        user_test_data = []
+        if user_name:
+            user_test_data = get_user_data(user_name, user_uid)
+
+        print(user_test_data)
+
+        # The initial state for the agent
+        initial_state = {
+            "paper_structure": concepts_for_paper,
+            "weak_concepts" : user_test_data,
+            "user_id": user_uid,
+        }
+
+        print("Invoking the agent... This may take a while.")
+        if graph.checkpointer:
+            get_generation_journal().start(thread_id)
+        final_state = graph.invoke(initial_state, config=config)
+    
+    paper_data = final_state.get('final_paper')
+
+    if not paper_data:
+        raise RuntimeError("Agent failed to produce paper data.")
+
+    print(f"Agent finished. Total questions generated: {len(paper_data.get('question_number', []))}")
+    
+    # Save the paper with user data
+    paper_id = save_user_paper(paper_data, user_token, user_name, user_uid)
+    if graph.checkpointer and paper_id:
+        get_generation_journal().record_paper(thread_id, paper_id)
+    
+    # Add paper_id to response
+    paper_data['paper_id'] = paper_id
+    return paper_data
+
 # Fixed server.py sections
 @app.route('/generate-paper', methods=['POST'])
 def generate_paper_endpoint():
@@ -385,42 +525,129 @@ def generate_paper_endpoint():
 
         print(f"User data received: name={user_name}, token={'***' if user_token else 'None'}")
 
-        # Manipulation concepts_for_paper as per users before sending to the agent
-        if user_name:
-            user_test_data = get_user_data(user_name)
-        
-        print(user_test_data)
+        paper_data = _generate_paper(user_token, user_name, user_uid=user_info.get('uid'),
+                                     idempotency_key=_idempotency_key(data))
+        return jsonify(paper_data)
 
-        # The initial state for the agent
-        initial_state = {
-            "paper_structure": concepts_for_paper,
-            "weak_concepts" : user_test_data,
-        }
+    except Exception as e:
+        print(f"An error occurred during agent invocation: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        print("Invoking the agent... This may take a while.")
-        # Invoke the Agent
-        final_state = langgraph_app.invoke(initial_state)
-        
-        paper_data = final_state.get('final_paper')
+# --- Asynchronous paper generation ---
+# POST /generate-paper/jobs returns a job_id immediately; the agent runs on the job pool and
+# clients poll GET /generate-paper/jobs/<job_id> for progress and the finished paper.
+job_manager = JobManager()
 
-        if not paper_data:
-            print("Error: Agent finished but 'final_paper' key is missing or empty.")
-            return jsonify({"error": "Agent failed to produce paper data."}), 500
+@app.route('/generate-paper/jobs', methods=['POST'])
+def create_paper_job():
+    try:
+        data = request.get_json() or {}
+        user_token = data.get('token')
+        user_name = data.get('name')
 
-        print(f"Agent finished. Total questions generated: {len(paper_data.get('question_number', []))}")
-        
-        # Save the paper with user data
-        paper_id = save_user_paper(paper_data, user_token, user_name)
-        
-        # Add paper_id to response
-        paper_data['paper_id'] = paper_id
-        
-        return jsonify(paper_data)
+        user_info = validate_user_token(user_token) if user_token else None
+        if not user_info:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        idempotency_key = _idempotency_key(data)
+        job_id = job_manager.submit(
+            user_info.get('uid'),
+            lambda on_event: _generate_paper(user_token, user_name, on_event, user_info.get('uid'), idempotency_key)
+        )
+        print(f"Queued paper generation job {job_id} for {user_name}")
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
 
     except Exception as e:
-        print(f"An error occurred during agent invocation: {e}")
         return jsonify({"error": str(e)}), 500
-    
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    return header[len('Bearer '):].strip() if header.startswith('Bearer ') else None
+
+@app.route('/generate-paper/jobs/<job_id>', methods=['GET'])
+def get_paper_job(job_id):
+    """
+    Job status and per-subject progress; includes the paper once the job is done.
+    Only the user who started the job can read it (Authorization: Bearer <token>).
+    """
+    user_token = _bearer_token()
+    user_info = validate_user_token(user_token) if user_token else None
+    if not user_info or not user_info.get('uid'):
+        return jsonify({"error": "Invalid or expired token"}), 401
+
+    job = job_manager.store.get(job_id, include_result=True)
+    # Someone else's job is reported as missing so job ids cannot be probed
+    if job is None or job.pop('owner', None) != user_info['uid']:
+        return jsonify({"error": "Job not found"}), 404
+
+    if job['status'] != 'done':
+        job.pop('result', None)
+    return jsonify(job), 200
+
+# --- Streaming paper generation ---
+# POST /generate-paper/stream runs the same job but streams each question as soon as it is
+# generated, as Server-Sent Events (default) or NDJSON ({"format": "ndjson"} or
+# Accept: application/x-ndjson). Events: job, plan, question..., then done (with paper_id)
+# or error. If the stream drops, the job can still be polled with its job_id.
+STREAM_KEEPALIVE_SECONDS = 15
+
+def _format_stream_event(event, stream_format):
+    payload = json.dumps(event)
+    if stream_format == 'ndjson':
+        return payload + "\n"
+    return f"event: {event['type']}\ndata: {payload}\n\n"
+
+@app.route('/generate-paper/stream', methods=['POST'])
+def stream_paper_endpoint():
+    data = request.get_json() or {}
+    user_token = data.get('token')
+    user_name = data.get('name')
+
+    user_info = validate_user_token(user_token) if user_token else None
+    if not user_info:
+        return jsonify({"error": "Invalid or expired token"}), 401
+
+    accepts_ndjson = 'application/x-ndjson' in request.headers.get('Accept', '')
+    stream_format = data.get('format') or ('ndjson' if accepts_ndjson else 'sse')
+    idempotency_key = _idempotency_key(data)
+    events = queue.Queue()
+
+    def run(on_progress):
+        def on_event(event):
+            on_progress(event)
+            events.put(event)
+        try:
+            paper_data = _generate_paper(user_token, user_name, on_event, user_info.get('uid'), idempotency_key)
+        except Exception as e:
+            events.put({"type": "error", "error": str(e)})
+            raise
+        events.put({
+            "type": "done",
+            "paper_id": paper_data.get('paper_id'),
+            "question_count": len(paper_data.get('question_number', [])),
+        })
+        return paper_data
+
+    job_id = job_manager.submit(user_info.get('uid'), run)
+    print(f"Streaming paper generation job {job_id} for {user_name}")
+
+    def generate():
+        yield _format_stream_event({"type": "job", "job_id": job_id}, stream_format)
+        while True:
+            try:
+                event = events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                # Keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n" if stream_format == 'sse' else "\n"
+                continue
+            yield _format_stream_event(event, stream_format)
+            if event["type"] in ("done", "error"):
+                return
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'text/event-stream'
+    return Response(generate(), mimetype=mimetype,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route('/get-paper-for-test', methods=['POST'])
 def get_paper_for_test():
     try:
@@ -459,8 +686,7 @@ def submit_test_result():
             user_uid = session.get('user_uid')
         else:
             try:
-                user_info = auth.get_account_info(token)
-                user_uid = user_info['users'][0]['localId']
+                user_uid = verify_firebase_token(token)['sub']
             except:
                 user_uid = session.get('user_uid')
 
@@ -476,26 +702,10 @@ def submit_test_result():
         if not paper_data:
             return jsonify({'error': 'Paper not found'}), 404
 
-        correct_answer_keys = paper_data.get('correct_answer', [])
-        options_data = paper_data.get('options', [])
-        score = 0
-        total_questions = len(correct_answer_keys)
-
-        # Helper function to get option value from key
-        def get_option_value(options_obj, key):
-            if not options_obj or not key:
-                return None
-            return options_obj.get(key)
-
         # Calculate score by converting correct answer keys to values
-        for index, correct_key in enumerate(correct_answer_keys):
-            user_answer = user_answers.get(str(index))
-            
-            # Get the actual correct answer value from options
-            if index < len(options_data):
-                correct_value = get_option_value(options_data[index], correct_key)
-                if user_answer == correct_value:
-                    score += 1
+        graded = grade_answers(paper_data, user_answers)
+        score = sum(graded)
+        total_questions = len(graded)
 
         # Create result ID
         result_id = str(uuid.uuid4())
@@ -527,6 +737,14 @@ def submit_test_result():
             'completed_at': test_result['completedAt']
         })
 
+        # Fold the result into the user's running analytics
+        mastery_engine.invalidate(user_uid, user_name)
+        try:
+            analytics_aggregates.record(user_uid, result_id, paper_data, graded, result_data['percentage'],
+                                        result_data['time_spent'], result_data['completed_at'])
+        except Exception as e:
+            print(f"Could not update analytics for {user_uid}: {e}")
+
         return jsonify({
             'success': True, 
             'resultId': result_id,
@@ -550,19 +768,10 @@ def retrieve_papers():
             return jsonify({'error': 'Missing authentication data'}), 400
         
         # Decode Firebase ID token to get UID
-        decoded_token = auth.get_account_info(token)
-        user_uid = decoded_token['users'][0]['localId']
-
-        # Fetch all papers from 'papers' collection
-        all_papers = db.child('papers').get()
+        user_uid = verify_firebase_token(token)['sub']
 
-        # Filter papers that match this user's UID
-        user_papers = []
-        if all_papers.each() is not None:
-            for paper_snapshot in all_papers.each():
-                paper = paper_snapshot.val()
-                if paper.get('created_by_uid') == user_uid or paper.get('created_by') == user_name:
-                    user_papers.append(paper)
+        # Papers created by this user (by UID, or by name for papers saved without one)
+        user_papers = data_access.papers_for_user(user_uid, user_name)
 
         return jsonify({'papers': user_papers}), 200
 
@@ -585,8 +794,7 @@ def get_user_analytics():
             user_uid = session.get('user_uid')
         else:
             try:
-                user_info = auth.get_account_info(token)
-                user_uid = user_info['users'][0]['localId']
+                user_uid = verify_firebase_token(token)['sub']
             except:
                 user_uid = session.get('user_uid')
 
@@ -594,23 +802,22 @@ def get_user_analytics():
             return jsonify({'error': 'Could not identify user'}), 400
 
         # Fetch all test results for this user
-        all_results = db.child('test_results').get()
-        user_results = []
-        
-        if all_results.each() is not None:
-            for result_snapshot in all_results.each():
-                result = result_snapshot.val()
-                if result.get('user_uid') == user_uid:
-                    user_results.append(result)
+        user_results = data_access.test_results_for_user(user_uid)
+
+        # Load each referenced paper once, concurrently. {"view": "slim"} reads the papers'
+        # slim copies: enough to score and chart every question, without question text or
+        # explanations (fetch those per paper from /get-paper-for-test)
+        paper_ids = (r.get('paper_id') for r in user_results)
+        if data.get('view') == 'slim':
+            papers = data_access.get_slim_papers(paper_ids)
+        else:
+            papers = data_access.get_many('papers', paper_ids)
 
-        # Fetch paper details for each result
         detailed_results = []
         for result in user_results:
-            paper_id = result.get('paper_id')
-            if paper_id:
-                paper_data = db.child('papers').child(paper_id).get().val()
-                if paper_data:
-                    result['paper_details'] = paper_data
+            paper_data = papers.get(result.get('paper_id'))
+            if paper_data:
+                result['paper_details'] = paper_data
             detailed_results.append(result)
 
         return jsonify({
@@ -621,108 +828,62 @@ def get_user_analytics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
-def get_user_data(user_name):
-    papers = db.child('papers').get()
-    test_results = db.child('test_results').get()
-
-    user_papers = []
-    user_test_results = []
-
-    # Get papers created by the user
-    if papers.each():
-        for paper in papers.each():
-            paper_data = paper.val()
-            # Fix: Use 'created_by_uid' instead of 'created_by' based on your DB structure
-            if paper_data.get('created_by') == user_name:
-                user_papers.append(paper_data)
-
-    # Get test results - need to filter by a user identifier
-    # Since there's no 'user_name' field visible, you might need to add one
-    # or use a different field to identify the user
-    if test_results.each():
-        for result in test_results.each():
-            result_data = result.val()
-            # You'll need to add a user identifier field to test_results
-            # For now, assuming you add 'user_id' or similar field
-            if result_data.get('user_name') == user_name:
-                user_test_results.append(result_data)
-    
-    final_concepts = {}
-    
-    # Process each test result
-    for test_result in user_test_results:
-        paper_id = test_result.get('paper_id')
-        answers = test_result.get('answers', {})
-        
-        # Find the corresponding paper
-        matching_paper = None
-        for paper in user_papers:
-            if paper.get('paper_id') == paper_id:
-                matching_paper = paper
-                break
-        
-        if matching_paper:
-            # Get the concept for this paper
-            concept = matching_paper.get('concept')
-            correct_answer = matching_paper.get('correct_answer')
-            
-            """
-            final_concepts[paper_id] = {
-                'concept': concept,
-                'correct_answer': correct_answer,
-                'user_answers': answers,
-                'question_text': matching_paper.get('question_text'),
-                'options': matching_paper.get('options')
-            }"""
-        
-    #analysis part
-    final_concepts_matrix = {}
-
-    for subject in ["Chemistry", "Physics", "Maths"]:
-        final_concepts_matrix.update(concepts_for_paper[subject]["concepts"])  
+@app.route('/analytics/summary', methods=['POST'])
+def get_analytics_summary():
+    """
+    Aggregated analytics for the caller (totals, per-subject/concept/difficulty
+    accuracy, time histogram, recent scores), maintained as tests are submitted.
+    """
+    try:
+        data = request.json or {}
+        token = data.get('token')
 
-    concept_names = list(final_concepts_matrix.keys())
+        if not token:
+            return jsonify({'error': 'Missing authentication data'}), 400
 
-    # 1. initialise counters at 0
-    counts_dict = {name: 0 for name in concept_names}
+        # Get user UID
+        user_uid = None
+        if token.startswith("session_"):
+            user_uid = session.get('user_uid')
+        else:
+            try:
+                user_uid = verify_firebase_token(token)['sub']
+            except:
+                user_uid = session.get('user_uid')
 
-    # 2. tally correct answers
-    for c in concept:
-        if c in counts_dict:          # ignore any stray concepts
-            counts_dict[c] += 1
+        if not user_uid:
+            return jsonify({'error': 'Could not identify user'}), 400
 
-    # 3. convert to a list if you need a numeric vector / matrix row
-    counts_list = [counts_dict[name] for name in concept_names]
+        return jsonify(analytics_aggregates.summary(user_uid)), 200
 
-    # 4. topics the learner still struggles with
-    weak_topics = [name for name, cnt in counts_dict.items() if cnt == 0]
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-    #return counts_dict, counts_list, weak_topics
-    return weak_topics
+def get_user_data(user_name, user_uid=None):
+    """
+    Per-concept focus weights for the user's next paper: concepts they keep
+    getting wrong (recent tests counting most) get up to MASTERY_BOOST times
+    their blueprint weight. Cached until the user submits another test.
+    """
+    return mastery_engine.weights_for(user_uid, user_name)
 
-def save_user_paper(paper_json, user_token, user_name):
+def save_user_paper(paper_json, user_token, user_name, user_uid=None):
     """
-    Save paper with proper user identification
+    Save paper with proper user identification. `user_uid` is the caller's
+    validated UID; without it the user is looked up by name.
     """
     if not user_token or not user_name:
         print("Error: Missing user data")
         return None
 
     try:
-        users = db.child('users').get()
-
-        matched_user = None
-        if users.each():
-            for node in users.each():                # node.key() is the push key; node.val() is the dict
-                data = node.val()
-                if data.get("name") == user_name:
-                    matched_user = data              # keep the first match (or break after setting)
-                    break
+        if not user_uid:
+            _, matched_user = data_access.find_user("name", user_name)
 
-        if not matched_user:
-            raise ValueError("No user found with that name")
+            if not matched_user:
+                raise ValueError("No user found with that name")
 
-        user_uid = matched_user.get("firebase_uid")
+            user_uid = matched_user.get("firebase_uid")
 
         """
         user_uid = None
@@ -758,8 +919,9 @@ def save_user_paper(paper_json, user_token, user_name):
         paper_json['created_by_uid'] = user_uid
         paper_json['created_at'] = datetime.utcnow().isoformat()
 
-        # Save paper in global "papers" collection
+        # Save paper in global "papers" collection, plus the slim copy analytics reads
         db.child("papers").child(paper_id).set(paper_json)
+        data_access.save_slim_paper(paper_id, paper_json)
 
         # Save reference under user's profile
         db.child("users").child(user_uid).child("papers").child(paper_id).set({
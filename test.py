@@ -1,4 +1,3 @@
-import pandas as pd
 import numpy as np
 import faiss
 import openai
@@ -7,9 +6,11 @@ import os
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 import json
 from typing import Dict, Any
-import requests
 import time
 import gc
+from index_builder import build_index, save_index
+from http_client import get_http_client
+from question_store import open_question_store, QUESTION_STORE_DIR
 
 # --- Configuration ---
 load_dotenv(dotenv_path=".env")
@@ -21,13 +22,13 @@ if not openrouter_api_key:
 client = openai.OpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=openrouter_api_key,
+    http_client=get_http_client("https://openrouter.ai"),
 )
 
+OPENROUTER_EMBEDDINGS_URL = "https://openrouter.ai/api/v1/embeddings"
+
 # --- Load Data ---
-df = pd.read_csv("question_difficulty_concept.csv")
-text_columns = ['question', 'option1', 'option2', 'option3', 'option4', 'solution', 'explanation', 'difficulty', 'difficulty_prob', 'concept']
-for col in text_columns:
-    df[col] = df[col].fillna('')
+question_store = open_question_store(QUESTION_STORE_DIR, "question_difficulty_concept.csv")
 
 def force_delete_file(filepath: str) -> bool:
     """Force delete a file on Windows, handling file locks"""
@@ -102,7 +103,6 @@ def load_or_create_index() -> faiss.Index:
         else:
             # If we can't delete it, create with a different name
             print("⚠️ Could not remove corrupted file. Creating with new name...")
-            global index_path
             index_path = f"jee_questions_open_new_{int(time.time())}.index"
     
     # Create new index
@@ -138,8 +138,8 @@ def get_embedding(text: str) -> list[float] | None:
         }
 
         try:
-            api_response = requests.post(
-                "https://openrouter.ai/api/v1/embeddings",
+            api_response = get_http_client(OPENROUTER_EMBEDDINGS_URL).post(
+                OPENROUTER_EMBEDDINGS_URL,
                 headers=headers,
                 json=data,
                 timeout=30
@@ -188,16 +188,16 @@ def create_faiss_index() -> faiss.Index:
     
     # Process in smaller batches to avoid overwhelming the API
     batch_size = 50
-    total_batches = (len(df) + batch_size - 1) // batch_size
+    total_batches = (len(question_store) + batch_size - 1) // batch_size
     
     for batch_num in range(total_batches):
         start_idx = batch_num * batch_size
-        end_idx = min((batch_num + 1) * batch_size, len(df))
+        end_idx = min((batch_num + 1) * batch_size, len(question_store))
         
         print(f"Processing batch {batch_num + 1}/{total_batches} (rows {start_idx}-{end_idx})")
         
         for idx in range(start_idx, end_idx):
-            row = df.iloc[idx]
+            row = question_store.row(idx, ("question", "concept", "difficulty"))
             question_text = f"{row['question']} {row['concept']} {row['difficulty']}"
             
             embedding = get_embedding(question_text)
@@ -221,18 +221,17 @@ def create_faiss_index() -> faiss.Index:
     
     print(f"Generated {len(embeddings)} embeddings (failed: {failed_count})")
     
-    # Create Faiss index
+    # Create Faiss index (IVF by default so the server can memory-map it; FAISS_INDEX_KIND=flat/ivf_pq/hnsw)
     embeddings_array = np.array(embeddings, dtype=np.float32)
-    dimension = embeddings_array.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings_array)
+    index_kind = os.getenv("FAISS_INDEX_KIND", "ivf_flat")
+    index = build_index(embeddings_array, index_kind)
     
     # Save index and mapping
     index_path = "jee_questions_open.index"
     mapping_path = "index_mapping_open.json"
     
     try:
-        faiss.write_index(index, index_path)
+        save_index(index, index_path, index_kind)
         with open(mapping_path, "w") as f:
             json.dump(valid_indices, f)
         
@@ -246,7 +245,7 @@ def create_faiss_index() -> faiss.Index:
         alt_index_path = f"jee_questions_open_{int(time.time())}.index"
         alt_mapping_path = f"index_mapping_open_{int(time.time())}.json"
         
-        faiss.write_index(index, alt_index_path)
+        save_index(index, alt_index_path, index_kind)
         with open(alt_mapping_path, "w") as f:
             json.dump(valid_indices, f)
         
@@ -276,14 +275,14 @@ for mapping_file in mapping_files:
 
 if index_mapping is None:
     print("No mapping file found. Using sequential mapping.")
-    index_mapping = list(range(len(df)))
+    index_mapping = list(range(len(question_store)))
 
-def search_questions_for_concept(concept: str, num_questions: int = 3) -> pd.DataFrame:
+def search_questions_for_concept(concept: str, num_questions: int = 3) -> list[dict]:
     """Search for questions based on a concept string"""
     query_embedding = get_embedding(concept)
     if query_embedding is None:
         print(f"❌ Failed to get embedding for concept: {concept}")
-        return pd.DataFrame()
+        return []
 
     query_embedding = np.array([query_embedding], dtype=np.float32)
     
@@ -297,15 +296,15 @@ def search_questions_for_concept(concept: str, num_questions: int = 3) -> pd.Dat
                 df_indices.append(index_mapping[faiss_idx])
         
         if df_indices:
-            result_df = df.iloc[df_indices]
-            print(f"✅ Found {len(result_df)} questions for concept: {concept}")
-            return result_df
+            result_rows = question_store.rows_for(df_indices)
+            print(f"✅ Found {len(result_rows)} questions for concept: {concept}")
+            return result_rows
         else:
-            return pd.DataFrame()
+            return []
             
     except Exception as e:
         print(f"❌ Search error: {e}")
-        return pd.DataFrame()
+        return []
 
 @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
 def generate_similar_question(original_question_text: str, difficulty: str, concept: str) -> Dict[str, Any]:
@@ -357,11 +356,11 @@ if __name__ == '__main__':
         
         # Test search
         results = search_questions_for_concept("kinematics", 1)
-        if not results.empty:
+        if results:
             print("✅ Search test passed")
             
             # Test question generation
-            original_question = results.iloc
+            original_question = results[0]
             try:
                 new_question_data = generate_similar_question(
                     original_question_text=original_question['question'],
@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+# tool refuses to import without a provider key; no request leaves the process in these tests
+os.environ.setdefault("OPENROUTER_API_KEY_2", "test-key")
+
+import agent  # noqa: E402
+import tool  # noqa: E402
+from providers import FakeProvider, ProviderRouter  # noqa: E402
+
+TEMPLATES = [{"question": f"Original {i}", "difficulty": "Easy", "concept": "Kinematics"} for i in range(3)]
+
+
+def _question(i: int) -> dict:
+    return {
+        "question_text": f"New question {i}",
+        "options": {"A": "1", "B": "2", "C": "3", "D": "4"},
+        "correct_answer": "B",
+        "explanation": "",
+    }
+
+
+@pytest.fixture
+def respond_with(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_MODE", "off")
+
+    def install(text: str) -> FakeProvider:
+        provider = FakeProvider("fake", latency=0, responder=lambda request: text)
+        monkeypatch.setattr(tool, "get_router", lambda: ProviderRouter([provider]))
+        return provider
+
+    return install
+
+
+def test_batch_reads_the_wrapped_questions_array(respond_with):
+    provider = respond_with(json.dumps({"questions": [_question(i) for i in range(3)]}))
+    assert tool.generate_similar_questions(TEMPLATES) == [_question(i) for i in range(3)]
+    assert provider.calls == 1
+
+
+def test_batch_accepts_a_bare_array_with_text_around_it(respond_with):
+    respond_with("Here are the questions:\n```json\n" + json.dumps([_question(i) for i in range(3)]) + "\n```")
+    assert tool.generate_similar_questions(TEMPLATES) == [_question(i) for i in range(3)]
+
+
+def test_short_batch_is_padded_with_none(respond_with):
+    respond_with(json.dumps({"questions": [_question(0)]}))
+    assert tool.generate_similar_questions(TEMPLATES) == [_question(0), None, None]
+
+
+def test_only_missing_or_broken_items_are_regenerated(monkeypatch):
+    answered_by_text = dict(_question(0), correct_answer="2")
+    broken = dict(_question(1), correct_answer="E")
+    monkeypatch.setattr(agent, "generate_similar_questions", lambda templates: [answered_by_text, broken])
+    regenerated = []
+
+    def single(original_question_text, difficulty, concept, avoid=None):
+        regenerated.append(original_question_text)
+        return _question(len(regenerated) + 10)
+
+    monkeypatch.setattr(agent, "generate_similar_question", single)
+
+    rows = [{"question": t["question"], "difficulty": t["difficulty"]} for t in TEMPLATES]
+    parts = agent._generate_batch_parts([("Kinematics", row) for row in rows])
+    assert regenerated == ["Original 1", "Original 2"]
+    assert [p["question_text"] for p in parts] == ["New question 0", "New question 11", "New question 12"]
+    assert parts[0]["correct_answer"] == "B"
+
+
+def test_failed_batch_falls_back_to_single_prompts(monkeypatch):
+    def failing(templates):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(agent, "generate_similar_questions", failing)
+    monkeypatch.setattr(agent, "generate_similar_question",
+                        lambda original_question_text, difficulty, concept, avoid=None: "not json")
+
+    rows = [{"question": t["question"], "difficulty": t["difficulty"]} for t in TEMPLATES[:2]]
+    assert agent._generate_batch_parts([("Kinematics", row) for row in rows]) == [None, None]
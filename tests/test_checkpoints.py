@@ -0,0 +1,73 @@
+import sqlite3
+import time
+
+from checkpoints import GenerationJournal, LockedSqliteSaver
+
+QUESTION = {"question_text": "q", "options": {"A": "1", "B": "2", "C": "3", "D": "4"}, "correct_answer": "A"}
+
+
+def _journal_with_saver(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    journal = GenerationJournal(path)
+    LockedSqliteSaver.from_path(path).setup()
+    with sqlite3.connect(path) as conn:
+        # Newer SqliteSaver releases keep pending writes in their own table
+        conn.execute("CREATE TABLE IF NOT EXISTS writes (thread_id TEXT NOT NULL, thread_ts TEXT NOT NULL, "
+                     "task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, value BLOB)")
+    return path, journal
+
+
+def _start_run(path, journal, thread_id, age):
+    journal.start(thread_id)
+    journal.record(thread_id, "Physics", 0, QUESTION)
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE paper_threads SET created_at = ? WHERE thread_id = ?", (time.time() - age, thread_id))
+        conn.execute("INSERT INTO checkpoints (thread_id, thread_ts) VALUES (?, '1')", (thread_id,))
+        conn.execute("INSERT INTO writes (thread_id, thread_ts, task_id, idx, channel) VALUES (?, '1', 't', 0, 'c')",
+                     (thread_id,))
+
+
+def _threads(path, table):
+    with sqlite3.connect(path) as conn:
+        return sorted(row[0] for row in conn.execute(f"SELECT DISTINCT thread_id FROM {table}"))
+
+
+def test_prune_drops_every_trace_of_expired_runs(tmp_path):
+    path, journal = _journal_with_saver(tmp_path)
+    _start_run(path, journal, "u:old", age=3600)
+    _start_run(path, journal, "u:new", age=0)
+
+    assert journal.prune(max_age=1800) == 1
+    for table in ("paper_threads", "generation_journal", "checkpoints", "writes"):
+        assert _threads(path, table) == ["u:new"], table
+    assert journal.completed("u:new", "Physics") == {0: QUESTION}
+
+
+def test_prune_drops_journal_rows_of_runs_that_were_never_started(tmp_path):
+    path, journal = _journal_with_saver(tmp_path)
+    journal.record("u:unchecked", "Physics", 0, QUESTION)
+    journal.start("u:kept")
+    journal.record("u:kept", "Physics", 0, QUESTION)
+
+    assert journal.prune() == 0
+    assert _threads(path, "generation_journal") == ["u:kept"]
+
+
+def test_prune_works_without_saver_tables(tmp_path):
+    journal = GenerationJournal(str(tmp_path / "journal.sqlite3"))
+    journal.start("u:old")
+    assert journal.prune(max_age=-1) == 1
+    assert journal.saved_paper("u:old") is None
+
+
+def test_start_prunes_at_most_once_per_interval(tmp_path):
+    path, journal = _journal_with_saver(tmp_path)
+    journal.prune_interval = 0
+    _start_run(path, journal, "u:old", age=10 ** 6)
+    journal.start("u:next")
+    assert _threads(path, "paper_threads") == ["u:next"]
+
+    journal.prune_interval = 3600
+    _start_run(path, journal, "u:old", age=10 ** 6)
+    journal.start("u:later")
+    assert "u:old" in _threads(path, "paper_threads")
@@ -0,0 +1,79 @@
+import pytest
+
+from data_access import INDEXED_FIELDS, SLIM_PAPER_FIELDS, DataAccess, FakeRealtimeDB
+
+
+def _data():
+    return {
+        "papers": {
+            "p1": {"paper_id": "p1", "created_by_uid": "u1", "created_by": "Ann", "question_text": ["q"]},
+            "p2": {"paper_id": "p2", "created_by_uid": "u2", "created_by": "Bob", "question_text": ["q"]},
+            "p3": {"paper_id": "p3", "created_by": "Ann", "question_text": ["q"]},
+        },
+        "test_results": {
+            "r1": {"user_uid": "u1", "user_name": "Ann", "paper_id": "p1"},
+            "r2": {"user_uid": "u2", "user_name": "Bob", "paper_id": "p2"},
+        },
+        "users": {
+            "u1": {"name": "Ann", "email": "ann@example.com",
+                   "papers": {"p1": {"title": "Paper p1"}}, "test_results": {"r1": {"score": 1}}},
+            "u2": {"name": "Bob", "email": "bob@example.com"},
+        },
+    }
+
+
+def test_indexed_query_reads_only_matching_records():
+    fake = FakeRealtimeDB(_data(), indexes=INDEXED_FIELDS)
+    access = DataAccess(fake.database)
+
+    assert access._find("test_results", "user_uid", "u1") == [("r1", _data()["test_results"]["r1"])]
+    assert fake.requests == 1
+
+
+def test_unindexed_query_falls_back_to_the_reference_nodes():
+    fake = FakeRealtimeDB(_data(), indexes={})
+    access = DataAccess(fake.database)
+
+    found = access._find("papers", "created_by_uid", "u1", uid="u1")
+    assert [key for key, _ in found] == ["p1"]
+    # Rejected query, shallow read of users/u1/papers, then one read per referenced paper
+    assert fake.requests == 3
+
+
+def test_unindexed_query_without_uid_scans_the_collection():
+    fake = FakeRealtimeDB(_data(), indexes={})
+    access = DataAccess(fake.database)
+
+    found = access._find("papers", "created_by", "Ann")
+    assert sorted(key for key, _ in found) == ["p1", "p3"]
+    assert fake.requests == 2
+
+
+def test_papers_for_user_merges_uid_and_name_matches():
+    access = DataAccess(FakeRealtimeDB(_data(), indexes=INDEXED_FIELDS).database)
+
+    papers = access.papers_for_user("u1", "Ann")
+    assert sorted(p["paper_id"] for p in papers) == ["p1", "p3"]
+
+
+@pytest.mark.parametrize("indexes", [INDEXED_FIELDS, {}])
+def test_find_user(indexes):
+    access = DataAccess(FakeRealtimeDB(_data(), indexes=indexes).database)
+
+    uid, user = access.find_user("email", "bob@example.com")
+    assert uid == "u2" and user["name"] == "Bob"
+    assert access.find_user("email", "nobody@example.com") == (None, None)
+
+
+def test_get_slim_papers_backfills_missing_slim_copies():
+    data = _data()
+    data["papers"]["p1"].update({field: ["x"] for field in SLIM_PAPER_FIELDS})
+    fake = FakeRealtimeDB(data, indexes=INDEXED_FIELDS)
+    access = DataAccess(fake.database)
+
+    assert set(access.get_slim_papers(["p1", "p1", "missing"])["p1"]) == set(SLIM_PAPER_FIELDS)
+    assert set(fake.data["papers_slim"]["p1"]) == set(SLIM_PAPER_FIELDS)
+
+    fake.requests = 0
+    access.get_slim_papers(["p1"])
+    assert fake.requests == 1
@@ -0,0 +1,120 @@
+import random
+import sqlite3
+
+import pytest
+
+from dedup import QuestionHistory, SimHashIndex, _to_signed, simhash
+
+BALL = "A ball is thrown vertically upward with a speed of 20 m/s. Find the maximum height reached by the ball."
+BALL_REWORDED = "Find the maximum height attained by a ball projected vertically upwards with an initial velocity of 20 m/s."
+STONE = "A stone is dropped from a tower of height 80 m. Find the time taken to reach the ground."
+
+
+def _flip(fingerprint: int, bits: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), bits):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def _fake_embed(vectors):
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [vectors.get(text) for text in texts]
+
+    embed.calls = calls
+    return embed
+
+
+def test_simhash_ignores_case_and_punctuation():
+    assert simhash(BALL) == simhash(BALL.upper().replace(".", " !"))
+    assert simhash("") == 0
+    assert (simhash(BALL) ^ simhash(STONE)).bit_count() > 6
+
+
+def test_banding_finds_everything_within_max_distance():
+    rng = random.Random(0)
+    for _ in range(200):
+        index = SimHashIndex(max_distance=6)
+        stored = rng.getrandbits(64)
+        index.add(stored)
+        assert index.contains_near(_flip(stored, rng.randint(0, 6), rng))
+        assert not index.contains_near(_flip(stored, 7, rng))
+
+
+def test_add_if_new_rejects_near_duplicates():
+    index = SimHashIndex(max_distance=3)
+    assert index.add_if_new(0b1111)
+    assert not index.add_if_new(0b0001)
+    assert index.add_if_new(0b1111 << 40)
+    assert len(index) == 2
+
+
+def test_near_misses_are_outside_the_duplicate_radius_closest_first():
+    index = SimHashIndex(max_distance=2)
+    for bits, ref in ((1, "dup"), (5, "five"), (3, "three"), (20, "far"), (4, None)):
+        index.add((1 << bits) - 1, ref)
+    assert index.near_misses(0, max_distance=10, limit=5) == ["three", "five"]
+    assert index.near_misses(0, max_distance=10, limit=1) == ["three"]
+
+
+def test_history_rejects_repeats_within_a_paper_and_across_papers(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    history = QuestionHistory(path)
+    assert history.claim("user-1", "user-1", BALL)
+    assert not history.claim("user-1", "user-1", BALL.lower())
+    assert history.claim("user-1", "user-1", STONE)
+
+    # Another worker (fresh process) loads the persisted history
+    other = QuestionHistory(path)
+    assert not other.claim("user-1", "user-1", BALL)
+    assert other.claim("user-2", "user-2", BALL)
+
+
+def test_anonymous_papers_are_not_persisted(tmp_path):
+    history = QuestionHistory(str(tmp_path / "history.sqlite3"))
+    assert history.claim("run:1", None, BALL)
+    assert not history.claim("run:1", None, BALL)
+    history.release("run:1")
+    assert history.claim("run:1", None, BALL)
+
+
+def test_rewordings_are_caught_by_embedding_cosine(tmp_path):
+    embed = _fake_embed({BALL: [1.0, 0.0], BALL_REWORDED: [0.96, 0.28], STONE: [0.6, 0.8]})
+    history = QuestionHistory(str(tmp_path / "history.sqlite3"), embed=embed)
+    assert (simhash(BALL) ^ simhash(BALL_REWORDED)).bit_count() > history.max_distance
+
+    assert history.claim("user-1", "user-1", BALL)
+    assert not history.claim("user-1", "user-1", BALL_REWORDED)
+    assert history.claim("user-1", "user-1", STONE)
+    assert embed.calls[0] == [BALL_REWORDED, BALL]
+
+    # The check also runs against history loaded from disk (texts are read by row id)
+    reloaded = QuestionHistory(str(tmp_path / "history.sqlite3"), embed=embed)
+    assert not reloaded.claim("user-1", "user-1", BALL_REWORDED)
+
+
+@pytest.mark.parametrize("embed", [
+    _fake_embed({}),
+    lambda texts: (_ for _ in ()).throw(RuntimeError("embedding service down")),
+])
+def test_missing_embeddings_fall_back_to_simhash(tmp_path, embed):
+    history = QuestionHistory(str(tmp_path / "history.sqlite3"), embed=embed)
+    assert history.claim("user-1", "user-1", BALL)
+    assert history.claim("user-1", "user-1", BALL_REWORDED)
+    assert not history.claim("user-1", "user-1", BALL)
+
+
+def test_old_history_table_gains_the_text_column(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE question_history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                     "fingerprint INTEGER NOT NULL, created_at REAL NOT NULL)")
+        conn.execute("INSERT INTO question_history (user_id, fingerprint, created_at) VALUES (?, ?, 0)",
+                     ("user-1", _to_signed(simhash(BALL))))
+
+    history = QuestionHistory(path, embed=_fake_embed({BALL_REWORDED: [1.0, 0.0]}))
+    assert not history.claim("user-1", "user-1", BALL)
+    # No stored text to compare against, so only SimHash applies to the old row
+    assert history.claim("user-1", "user-1", BALL_REWORDED)
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+import embedding_cache
+from embedding_cache import EmbeddingCache, embedding_key
+
+
+def _key(text: str) -> bytes:
+    return embedding_key("model", "task", text)
+
+
+def _vector(seed: float) -> np.ndarray:
+    return np.full(4, seed, dtype=np.float32)
+
+
+def test_flush_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put(_key("a"), _vector(1))
+    cache.flush()
+
+    reloaded = EmbeddingCache(str(tmp_path))
+    assert len(reloaded) == 1
+    np.testing.assert_array_equal(reloaded.get(_key("a")), _vector(1))
+    assert reloaded.get(_key("b")) is None
+
+
+def test_interleaved_flushes_keep_both_workers_entries(tmp_path, monkeypatch):
+    # Two workers on the same directory, each flushing its own vectors. np.save is slowed
+    # down so that, without the flush lock, both would read the same table and the second
+    # pointer swap would drop the first worker's rows.
+    workers = [EmbeddingCache(str(tmp_path)) for _ in range(2)]
+    for i, cache in enumerate(workers):
+        for j in range(5):
+            cache.put(_key(f"{i}-{j}"), _vector(10 * i + j))
+
+    real_save = np.save
+
+    def slow_save(*args, **kwargs):
+        time.sleep(0.05)
+        return real_save(*args, **kwargs)
+
+    monkeypatch.setattr(embedding_cache.np, "save", slow_save)
+    start = threading.Barrier(2)
+
+    def flush(cache):
+        start.wait()
+        cache.flush()
+
+    threads = [threading.Thread(target=flush, args=(cache,)) for cache in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    merged = EmbeddingCache(str(tmp_path))
+    assert len(merged) == 10
+    for i in range(2):
+        for j in range(5):
+            np.testing.assert_array_equal(merged.get(_key(f"{i}-{j}")), _vector(10 * i + j))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_reader_keeps_its_mapped_table_across_flushes(tmp_path):
+    writer = EmbeddingCache(str(tmp_path))
+    writer.put(_key("a"), _vector(1))
+    writer.flush()
+    reader = EmbeddingCache(str(tmp_path))
+
+    for text in ("b", "c", "d"):
+        writer.put(_key(text), _vector(2))
+        writer.flush()
+
+    np.testing.assert_array_equal(reader.get(_key("a")), _vector(1))
+    # Only the live version and the one it replaced stay on disk
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("vectors-")]) == 2
+    assert len(EmbeddingCache(str(tmp_path))) == 4
+
+
+def test_legacy_table_is_merged_into_the_first_version(tmp_path):
+    np.save(tmp_path / "keys.npy", np.array([_key("old")], dtype=embedding_cache.KEY_DTYPE))
+    np.save(tmp_path / "vectors.npy", np.stack([_vector(7)]))
+
+    cache = EmbeddingCache(str(tmp_path))
+    assert len(cache) == 1
+    cache.put(_key("new"), _vector(8))
+    cache.flush()
+
+    reloaded = EmbeddingCache(str(tmp_path))
+    np.testing.assert_array_equal(reloaded.get(_key("old")), _vector(7))
+    np.testing.assert_array_equal(reloaded.get(_key("new")), _vector(8))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from data_access import INDEXED_FIELDS, DataAccess, FakeRealtimeDB
+from mastery import MASTERY_BOOST, MASTERY_PRIOR, MasteryEngine, concept_mastery, focus_weights
+
+CONCEPTS = ["Kinematics", "Optics"]
+OPTIONS = {"A": "1", "B": "2", "C": "3", "D": "4"}
+
+
+def _paper(concepts):
+    return {"concept": list(concepts), "options": [OPTIONS] * len(concepts), "correct_answer": ["B"] * len(concepts)}
+
+
+def _answers(*correct):
+    return {str(i): "2" if ok else "3" for i, ok in enumerate(correct)}
+
+
+def test_untested_concepts_stay_at_the_prior():
+    assert np.allclose(concept_mastery([], CONCEPTS), MASTERY_PRIOR)
+
+
+def test_accuracy_is_shrunk_towards_the_prior():
+    mastery = concept_mastery([(_paper(["Kinematics", "Kinematics"]), _answers(True, True))], CONCEPTS, half_life=5)
+    assert mastery[0] == pytest.approx((2 + 0.5 * 2) / (2 + 2))
+    assert mastery[1] == MASTERY_PRIOR
+
+
+def test_older_tests_count_less():
+    tests = [(_paper(["Kinematics"]), _answers(False)), (_paper(["Kinematics"]), _answers(True))]
+    # The older (wrong) answer has half the weight of the newer (right) one
+    assert concept_mastery(tests, CONCEPTS, half_life=1)[0] == pytest.approx((1 + 1) / (1.5 + 2))
+    assert concept_mastery(tests[::-1], CONCEPTS, half_life=1)[0] == pytest.approx((0.5 + 1) / (1.5 + 2))
+
+
+def test_unknown_concepts_and_unanswered_questions():
+    paper = _paper(["Kinematics", "Thermodynamics", "Optics"])
+    mastery = concept_mastery([(paper, {"1": "2"})], CONCEPTS, half_life=5)
+    assert mastery[0] == pytest.approx(1 / 3) and mastery[1] == pytest.approx(1 / 3)
+
+
+def test_focus_weights_boost_weak_concepts():
+    weights = focus_weights(np.array([0.0, 1.0, 0.5]), ["weak", "strong", "middling"])
+    assert weights == {"weak": MASTERY_BOOST, "strong": 1.0, "middling": pytest.approx(1 + (MASTERY_BOOST - 1) / 2)}
+
+
+def _engine(results, papers):
+    fake = FakeRealtimeDB({"test_results": results, "papers": papers}, indexes=INDEXED_FIELDS)
+    return fake, MasteryEngine(DataAccess(fake.database), CONCEPTS, ttl=3600)
+
+
+def test_engine_reads_history_oldest_first_and_caches_weights():
+    papers = {"p1": _paper(["Optics"]), "p2": _paper(["Optics"])}
+    results = {
+        "r2": {"user_uid": "u1", "paper_id": "p2", "answers": _answers(True), "created_at": "2025-02-01"},
+        "r1": {"user_uid": "u1", "paper_id": "p1", "answers": _answers(False), "created_at": "2025-01-01"},
+        "r3": {"user_uid": "u1", "paper_id": "missing", "answers": _answers(False), "created_at": "2025-03-01"},
+        "r4": {"user_uid": "u2", "paper_id": "p1", "answers": _answers(False), "created_at": "2025-01-01"},
+    }
+    fake, engine = _engine(results, papers)
+    expected = focus_weights(concept_mastery([(papers["p1"], _answers(False)), (papers["p2"], _answers(True))],
+                                             CONCEPTS), CONCEPTS)
+
+    assert engine.weights_for("u1") == expected
+    requests = fake.requests
+    assert engine.weights_for("u1") == expected
+    assert fake.requests == requests
+
+    engine.invalidate("u1")
+    engine.weights_for("u1")
+    assert fake.requests > requests
+
+
+def test_engine_evicts_least_recently_used_users():
+    fake, engine = _engine({}, {})
+    engine.cached_users = 2
+    for uid in ("u1", "u2", "u1", "u3"):
+        engine.weights_for(uid)
+    assert list(engine._cache) == ["u1", "u3"]
@@ -0,0 +1,132 @@
+import json
+import random
+import time
+
+import pytest
+
+from providers import FakeProvider, ProviderRouter
+from rate_limit import RATE_LIMIT_MAX_PAUSE_SECONDS
+
+REQUEST = {"messages": [{"role": "user", "content": "Generate one question."}]}
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("429 Too Many Requests")
+        self.headers = {"retry-after": str(retry_after)}
+
+
+def _warm(provider: FakeProvider, seconds: float, samples: int = 20) -> None:
+    for _ in range(samples):
+        provider.stats.record(seconds)
+
+
+def test_router_favours_fast_providers():
+    fast, slow = FakeProvider("fast", latency=0), FakeProvider("slow", latency=0)
+    _warm(fast, 0.1)
+    _warm(slow, 1.0)
+    router = ProviderRouter([fast, slow])
+    assert router._weight(fast) == pytest.approx(10 * router._weight(slow))
+
+    random.seed(0)
+    picks = [router.pick().name for _ in range(2000)]
+    assert 0.85 < picks.count("fast") / len(picks) < 0.95
+
+
+def test_router_backs_off_failing_providers():
+    flaky, healthy = FakeProvider("flaky", latency=0, failure_rate=1.0), FakeProvider("healthy", latency=0)
+    _warm(flaky, 0.1)
+    _warm(healthy, 0.1)
+    router = ProviderRouter([flaky, healthy])
+    with pytest.raises(RuntimeError):
+        flaky.complete(REQUEST)
+    assert flaky.stats.consecutive_failures == 1
+    assert router._weight(flaky) == pytest.approx(router._weight(healthy) / 5)
+
+
+def test_unmeasured_provider_looks_as_fast_as_the_best():
+    measured, new = FakeProvider("measured", latency=0), FakeProvider("new", latency=0)
+    _warm(measured, 0.2)
+    router = ProviderRouter([measured, new])
+    assert router._weight(new) == pytest.approx(router._weight(measured))
+
+
+def test_slow_request_is_hedged_to_a_second_provider():
+    slow, fast = FakeProvider("slow", latency=1.0), FakeProvider("fast", latency=0.01)
+    _warm(slow, 0.05)
+    router = ProviderRouter([slow, fast], hedging=True, hedge_min_samples=10)
+    router.pick = lambda exclude=(): fast if slow in exclude else slow
+
+    start = time.perf_counter()
+    response = router.complete(REQUEST)
+    assert response.provider == "fast"
+    assert time.perf_counter() - start < 0.5
+    assert slow.calls == fast.calls == 1
+
+
+def test_no_hedging_before_enough_samples():
+    slow, fast = FakeProvider("slow", latency=0.2), FakeProvider("fast", latency=0.01)
+    router = ProviderRouter([slow, fast], hedging=True, hedge_min_samples=10)
+    router.pick = lambda exclude=(): fast if slow in exclude else slow
+    assert router.complete(REQUEST).provider == "slow"
+    assert fast.calls == 0
+
+
+def test_latency_includes_the_rate_limiter_wait():
+    provider = FakeProvider("queued", latency=0.01)
+    provider.limiter.pause(0.3)
+    response = provider.complete(REQUEST)
+    assert response.latency >= 0.25
+    assert provider.stats.ewma == pytest.approx(response.latency)
+
+
+def test_request_stalled_in_its_own_bucket_is_hedged():
+    stalled, fast = FakeProvider("stalled", latency=0.01), FakeProvider("fast", latency=0.01)
+    _warm(stalled, 0.05)
+    stalled.limiter.pause(1.0)
+    router = ProviderRouter([stalled, fast], hedging=True, hedge_min_samples=10)
+    router.pick = lambda exclude=(): fast if stalled in exclude else stalled
+
+    start = time.perf_counter()
+    assert router.complete(REQUEST).provider == "fast"
+    assert time.perf_counter() - start < 0.5
+
+
+def test_retry_after_pauses_the_provider():
+    def rate_limited(request):
+        raise RateLimited(retry_after=0.3)
+
+    limited = FakeProvider("limited", latency=0, responder=rate_limited)
+    other = FakeProvider("other", latency=0)
+    _warm(limited, 0.1)
+    _warm(other, 0.1)
+    router = ProviderRouter([limited, other])
+
+    with pytest.raises(RateLimited):
+        limited.complete(REQUEST)
+    assert limited.headroom() == 0.0
+    assert router._weight(limited) < router._weight(other) / 50
+
+    # The limiter holds the next request back until Retry-After has passed
+    limited.responder = lambda request: json.dumps({"ok": True})
+    start = time.perf_counter()
+    limited.complete(REQUEST)
+    assert time.perf_counter() - start >= 0.25
+    assert limited.headroom() == 1.0
+
+
+def test_epoch_reset_header_pauses_for_a_bounded_time():
+    provider = FakeProvider("openrouter", latency=0)
+    reset_ms = int((time.time() + 1e9) * 1000)
+    provider._observe_headers({"X-RateLimit-Limit": "20", "X-RateLimit-Remaining": "0",
+                               "X-RateLimit-Reset": str(reset_ms)})
+    assert provider.headroom() == 0.0
+    assert provider._paused_until <= time.time() + RATE_LIMIT_MAX_PAUSE_SECONDS
+
+
+def test_fake_provider_answers_batched_prompts():
+    provider = FakeProvider(latency=0)
+    request = {"messages": [{"role": "user", "content": 'an array of exactly 3 objects'}]}
+    questions = json.loads(provider.complete(request).text)["questions"]
+    assert len(questions) == 3
+    assert all(q["correct_answer"] in q["options"] for q in questions)
@@ -0,0 +1,74 @@
+from question_pool import PoolReplenisher, QuestionPool
+
+
+def _question(text: str, difficulty: str) -> dict:
+    return {
+        "question_text": text,
+        "options": {"A": "1", "B": "2", "C": "3", "D": "4"},
+        "correct_answer": "A",
+        "explanation": "",
+        "difficulty": difficulty,
+    }
+
+
+def _pool(tmp_path, **kwargs) -> QuestionPool:
+    return QuestionPool(str(tmp_path / "pool.sqlite3"), **kwargs)
+
+
+def _texts(candidates) -> list:
+    return [question["question_text"] for _, question in candidates]
+
+
+def test_candidates_filter_by_difficulty(tmp_path):
+    pool = _pool(tmp_path)
+    for i, difficulty in enumerate(["Easy", "Hard", "Easy", "Medium"]):
+        pool.add("Physics", "Kinematics", _question(f"q{i}", difficulty))
+
+    assert _texts(pool.candidates("u1", "Physics", "Kinematics", 5, difficulty="Easy")) == ["q0", "q2"]
+    assert pool.candidates("u1", "Physics", "Kinematics", 5, difficulty="Olympiad") == []
+
+
+def test_candidates_mix_difficulties_when_none_is_asked_for(tmp_path):
+    pool = _pool(tmp_path)
+    for i, difficulty in enumerate(["Easy", "Easy", "Easy", "Hard", "Medium"]):
+        pool.add("Physics", "Kinematics", _question(f"q{i}", difficulty))
+
+    picked = pool.candidates("u1", "Physics", "Kinematics", 3)
+    assert sorted(q["difficulty"] for _, q in picked) == ["Easy", "Hard", "Medium"]
+
+
+def test_served_questions_are_not_offered_again(tmp_path):
+    pool = _pool(tmp_path, max_serves=2)
+    ids = [pool.add("Physics", "Kinematics", _question(f"q{i}", "Easy")) for i in range(2)]
+
+    pool.mark_served("u1", ids[:1])
+    pool.mark_served("u1", ids[:1])  # the same user counts once
+    assert _texts(pool.candidates("u1", "Physics", "Kinematics", 5)) == ["q1"]
+    assert _texts(pool.candidates("u2", "Physics", "Kinematics", 5)) == ["q1", "q0"]
+
+    pool.mark_served("u2", ids[:1])  # retired after max_serves users
+    assert _texts(pool.candidates("u3", "Physics", "Kinematics", 5)) == ["q1"]
+    assert pool.available("Physics", "Kinematics") == 1
+
+
+def test_invalid_questions_are_not_pooled(tmp_path):
+    pool = _pool(tmp_path)
+    broken = dict(_question("q", "Easy"), correct_answer="E")
+    assert pool.add("Physics", "Kinematics", broken) is None
+    assert pool.available("Physics", "Kinematics") == 0
+
+
+def test_replenisher_tops_up_low_concepts(tmp_path):
+    pool = _pool(tmp_path)
+    blueprint = {"Physics": {"concepts": {"Kinematics": 1, "Optics": 1}}}
+    pool.add("Physics", "Optics", _question("o1", "Easy"))
+    calls = []
+
+    def generate(subject, concept, n):
+        calls.append((concept, n))
+        return [_question(f"{concept}-{i}", "Medium") for i in range(n)]
+
+    replenisher = PoolReplenisher(pool, blueprint, generate, low_water=2, batch=5)
+    assert replenisher.run_once() == 3
+    assert calls == [("Kinematics", 2), ("Optics", 1)]
+    assert replenisher.run_once() == 0
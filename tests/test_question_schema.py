@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from question_schema import SchemaError, extract_json, is_valid_question, normalize_question
+
+QUESTION = {
+    "question_text": "A body starts from rest with acceleration 2 m/s^2. How far does it travel in 3 s?",
+    "options": {"A": "6 m", "B": "9 m", "C": "12 m", "D": "18 m"},
+    "correct_answer": "B",
+    "explanation": "s = (1/2)at^2 = 9 m.",
+}
+
+
+@pytest.mark.parametrize("text, expected", [
+    (json.dumps({"questions": [QUESTION, QUESTION]}), {"questions": [QUESTION, QUESTION]}),
+    (json.dumps([QUESTION, QUESTION]), [QUESTION, QUESTION]),
+    ("Here is the question:\n```json\n" + json.dumps(QUESTION) + "\n```\nGood luck!", QUESTION),
+    ("Note {not json}: " + json.dumps(QUESTION) + " trailing {", QUESTION),
+])
+def test_extract_json_finds_the_first_value(text, expected):
+    assert extract_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["no json here", "{broken", None])
+def test_extract_json_rejects_text_without_json(text):
+    with pytest.raises(SchemaError):
+        extract_json(text)
+
+
+def test_normalize_question_accepts_json_text_and_single_item_lists():
+    assert normalize_question(json.dumps(QUESTION)) == QUESTION
+    assert normalize_question("Sure! " + json.dumps([QUESTION])) == QUESTION
+
+
+def test_answer_given_as_option_text_becomes_its_key():
+    assert normalize_question(dict(QUESTION, correct_answer="9 M"))["correct_answer"] == "B"
+
+
+def test_decorated_keys_and_option_lists_are_repaired():
+    question = dict(QUESTION, options={"(a)": "6 m", "b)": "9 m", "Option C": "12 m", "[d]": "18 m"},
+                    correct_answer="(b)")
+    assert normalize_question(question) == QUESTION
+    listed = dict(QUESTION, options=["6 m", "9 m", "12 m", "18 m"], correct_answer="b")
+    assert normalize_question(listed) == QUESTION
+
+
+def test_alternative_field_names():
+    raw = {"text": QUESTION["question_text"], "options": QUESTION["options"], "answer": "B",
+           "rationale": QUESTION["explanation"]}
+    assert normalize_question(raw) == QUESTION
+
+
+@pytest.mark.parametrize("change, problem", [
+    ({"question_text": ""}, "question_text is empty"),
+    ({"options": {"A": "1", "B": "2", "C": "3"}}, "exactly the keys A-D"),
+    ({"options": {"A": "1", "B": "1", "C": "3", "D": "4"}}, "distinct"),
+    ({"options": {"A": "1", "B": "", "C": "3", "D": "4"}}, "non-empty"),
+    ({"correct_answer": "E"}, "not one of the option keys"),
+])
+def test_invalid_questions_name_the_problem(change, problem):
+    with pytest.raises(SchemaError, match=problem):
+        normalize_question(dict(QUESTION, **change))
+    assert not is_valid_question(dict(QUESTION, **change))
+
+
+def test_every_problem_is_reported():
+    with pytest.raises(SchemaError) as error:
+        normalize_question({"question_text": "", "options": "A-D", "correct_answer": "A"})
+    assert "question_text is empty" in str(error.value) and "options must be an object" in str(error.value)
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from question_store import TEXT_COLUMNS, QuestionStore, open_question_store
+
+
+def _write_csv(path, questions):
+    rows = [{col: "" for col in TEXT_COLUMNS} for _ in questions]
+    for row, question in zip(rows, questions):
+        row.update(question=question, difficulty="Easy", concept="Kinematics")
+    pd.DataFrame(rows, columns=TEXT_COLUMNS).to_csv(path, index=False)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "questions.csv"), str(tmp_path / "store")
+
+
+def test_store_is_converted_on_first_use(paths):
+    csv_path, store_dir = paths
+    _write_csv(csv_path, ["q0", "q1", "q2"])
+    store = open_question_store(store_dir, csv_path)
+    assert len(store) == 3
+    assert store.row(1, ["question", "difficulty"]) == {"question": "q1", "difficulty": "Easy"}
+
+
+def test_changed_csv_is_converted_again(paths):
+    csv_path, store_dir = paths
+    _write_csv(csv_path, ["q0", "q1"])
+    open_question_store(store_dir, csv_path)
+
+    _write_csv(csv_path, ["q0", "q1", "new"])
+    store = open_question_store(store_dir, csv_path)
+    assert len(store) == 3
+    assert store.value("question", 2) == "new"
+    assert not [name for name in os.listdir(os.path.dirname(store_dir)) if ".old-" in name or ".tmp-" in name]
+
+
+def test_same_content_with_new_mtime_is_not_converted_again(paths, monkeypatch):
+    csv_path, store_dir = paths
+    _write_csv(csv_path, ["q0", "q1"])
+    open_question_store(store_dir, csv_path)
+    os.utime(csv_path, (1, 1))
+
+    monkeypatch.setattr("question_store.convert_csv", lambda *args, **kwargs: pytest.fail("reconverted"))
+    assert len(open_question_store(store_dir, csv_path)) == 2
+
+
+def test_store_without_fingerprint_is_rebuilt(paths):
+    csv_path, store_dir = paths
+    _write_csv(csv_path, ["q0", "q1"])
+    open_question_store(store_dir, csv_path)
+    meta_path = os.path.join(store_dir, "meta.json")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    del meta["source_fingerprint"]
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+    open_question_store(store_dir, csv_path)
+    with open(meta_path) as f:
+        assert json.load(f)["source_fingerprint"]["size"] == os.path.getsize(csv_path)
+
+
+def test_store_shipped_without_csv_is_used_as_is(paths):
+    csv_path, store_dir = paths
+    _write_csv(csv_path, ["q0", "q1"])
+    open_question_store(store_dir, csv_path)
+    os.remove(csv_path)
+    assert isinstance(open_question_store(store_dir, csv_path), QuestionStore)
@@ -0,0 +1,130 @@
+import json
+import time
+from email.utils import formatdate
+
+import pytest
+
+import rate_limit
+from rate_limit import (RATE_LIMIT_MAX_PAUSE_SECONDS, AdaptiveRateLimiter, SharedTokenBucket, TokenBucket,
+                        parse_duration, parse_rate_limit_headers, parse_retry_after)
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = ManualClock()
+    monkeypatch.setattr(TokenBucket, "_clock", staticmethod(clock))
+    return clock
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("12", 12.0), ("1.5", 1.5), ("20ms", 0.02), ("6m0s", 360.0), ("1h2m3s", 3723.0), (7, 7.0),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", [None, "", "soon"])
+def test_parse_duration_rejects_garbage(value):
+    assert parse_duration(value) is None
+
+
+@pytest.mark.parametrize("scale", [1, 1000])
+def test_parse_duration_turns_epochs_into_time_left(scale):
+    assert parse_duration(str((time.time() + 30) * scale)) == pytest.approx(30, abs=1)
+    assert parse_duration(str((time.time() - 30) * scale)) == 0.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after(formatdate(time.time() + 20, usegmt=True)) == pytest.approx(20, abs=2)
+    assert parse_retry_after(formatdate(time.time() - 20, usegmt=True)) == 0.0
+    assert parse_retry_after("not a date") is None
+    assert parse_retry_after(None) is None
+
+
+def test_parse_openai_style_headers():
+    info = parse_rate_limit_headers({
+        "x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "59",
+        "x-ratelimit-reset-requests": "1s", "x-ratelimit-limit-tokens": "90000",
+        "x-ratelimit-remaining-tokens": "89000", "x-ratelimit-reset-tokens": "6m0s",
+        "retry-after": "2",
+    })
+    assert info == {
+        "limit_requests": 60.0, "remaining_requests": 59.0, "reset_requests": 1.0,
+        "limit_tokens": 90000.0, "remaining_tokens": 89000.0, "reset_tokens": 360.0,
+        "retry_after": 2.0,
+    }
+
+
+def test_parse_openrouter_style_headers():
+    reset_ms = int((time.time() + 40) * 1000)
+    info = parse_rate_limit_headers({
+        "X-RateLimit-Limit": "20", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset_ms),
+    })
+    assert info["limit_requests"] == 20.0
+    assert info["remaining_requests"] == 0.0
+    assert info["reset_requests"] == pytest.approx(40, abs=1)
+    assert info["retry_after"] is None
+
+
+def test_headers_drain_the_bucket_until_reset(clock):
+    limiter = AdaptiveRateLimiter(TokenBucket(rate=1.0, capacity=5), TokenBucket(rate=1000.0, capacity=1000))
+    limiter.update_from_headers({"x-ratelimit-limit": "120", "x-ratelimit-remaining": "0",
+                                 "x-ratelimit-reset": "10s"})
+    assert limiter.requests.rate == pytest.approx(2.0)
+
+    clock.now += 9.9
+    limiter.requests.debit(0)
+    with limiter.requests._transaction() as state:
+        assert state["tokens"] <= 0
+    clock.now += 1.1
+    limiter.requests.debit(0)
+    with limiter.requests._transaction() as state:
+        assert state["tokens"] == pytest.approx(2.0)
+
+
+def test_absolute_reset_drains_only_until_then(clock):
+    limiter = AdaptiveRateLimiter(TokenBucket(rate=1.0), TokenBucket(rate=1000.0, capacity=1000))
+    limiter.update_from_headers({"X-RateLimit-Limit": "20", "X-RateLimit-Remaining": "0",
+                                 "X-RateLimit-Reset": str(int((time.time() + 15) * 1000))})
+    with limiter.requests._transaction() as state:
+        assert state["updated"] - clock.now == pytest.approx(15, abs=1)
+
+
+def test_drain_is_capped(clock):
+    bucket = TokenBucket(rate=1.0)
+    bucket.drain(1.7e12)
+    with bucket._transaction() as state:
+        assert state["updated"] - clock.now == pytest.approx(RATE_LIMIT_MAX_PAUSE_SECONDS)
+
+
+def test_retry_after_pauses_callers(clock):
+    limiter = AdaptiveRateLimiter(TokenBucket(rate=10.0, capacity=10), TokenBucket(rate=1000.0, capacity=1000))
+    limiter.update_from_headers({"retry-after": "3"})
+    with limiter.requests._transaction() as state:
+        assert state["tokens"] <= 0 and state["updated"] - clock.now == pytest.approx(3)
+
+
+def test_shared_bucket_recovers_from_a_persisted_runaway_pause(tmp_path):
+    path = tmp_path / "requests.json"
+    path.write_text(json.dumps({"rate": 1.0, "capacity": 1.0, "tokens": 0.0, "updated": time.time() + 1.7e12}))
+    bucket = SharedTokenBucket(str(path), rate=1.0)
+    bucket.debit(0)
+    state = json.loads(path.read_text())
+    assert state["updated"] <= time.time() + rate_limit.RATE_LIMIT_MAX_PAUSE_SECONDS
+
+
+def test_acquire_waits_for_a_short_drain():
+    bucket = TokenBucket(rate=100.0)
+    bucket.drain(0.2)
+    start = time.perf_counter()
+    bucket.acquire()
+    assert 0.15 <= time.perf_counter() - start < 1.0
@@ -0,0 +1,179 @@
+import datetime
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+
+import token_cache
+from token_cache import (FIREBASE_ISSUER_PREFIX, FirebaseTokenVerifier, GooglePublicKeys, KeysUnavailable,
+                         ProfileCache, TokenError, project_id_from_config)
+
+PROJECT = "jee-test"
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+    pem_key = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+    return crypt.RSASigner.from_string(pem_key, key_id="kid-1"), cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class StaticKeys:
+    def __init__(self, certs):
+        self._certs = certs
+
+    def certs(self, kid=None):
+        return self._certs
+
+
+def _token(signer, **overrides):
+    now = int(time.time())
+    claims = {"iss": FIREBASE_ISSUER_PREFIX + PROJECT, "aud": PROJECT, "sub": "uid-1",
+              "iat": now, "exp": now + 3600, "auth_time": now}
+    claims.update(overrides)
+    return jwt.encode(signer, {k: v for k, v in claims.items() if v is not None}).decode()
+
+
+@pytest.fixture
+def verifier(signing_key):
+    return FirebaseTokenVerifier(PROJECT, keys=StaticKeys({"kid-1": signing_key[1]}))
+
+
+def test_valid_token_returns_its_claims(signing_key, verifier):
+    claims = verifier.verify(_token(signing_key[0]))
+    assert claims["sub"] == "uid-1" and claims["aud"] == PROJECT
+
+
+@pytest.mark.parametrize("overrides", [
+    {"exp": int(time.time()) - 3600, "iat": int(time.time()) - 7200},
+    {"aud": "another-project"},
+    {"iss": FIREBASE_ISSUER_PREFIX + "another-project"},
+    {"sub": None},
+    {"auth_time": int(time.time()) + 3600},
+])
+def test_invalid_claims_are_rejected(signing_key, verifier, overrides):
+    with pytest.raises(TokenError):
+        verifier.verify(_token(signing_key[0], **overrides))
+
+
+def test_unknown_key_and_malformed_tokens_are_rejected(signing_key):
+    verifier = FirebaseTokenVerifier(PROJECT, keys=StaticKeys({"other-kid": signing_key[1]}))
+    with pytest.raises(TokenError, match="unknown key"):
+        verifier.verify(_token(signing_key[0]))
+    with pytest.raises(TokenError, match="Malformed"):
+        verifier.verify("not-a-jwt")
+
+
+class FakeResponse:
+    def __init__(self, certs, cache_control=""):
+        self._certs = certs
+        self.headers = {"cache-control": cache_control}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._certs
+
+
+class FakeClient:
+    def __init__(self):
+        self.responses = []
+        self.calls = 0
+
+    def get(self, url):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(token_cache, "get_http_client", lambda url: client)
+    return client
+
+
+def test_certificates_are_cached_for_max_age(client, monkeypatch):
+    client.responses = [FakeResponse({"k1": "cert"}, "public, max-age=100"), FakeResponse({"k2": "cert"})]
+    keys = GooglePublicKeys("https://certs.example")
+    assert keys.certs("k1") == {"k1": "cert"}
+    assert keys.certs("k1") == {"k1": "cert"}
+    assert client.calls == 1
+
+    now = time.time()
+    monkeypatch.setattr(token_cache.time, "time", lambda: now + 101)
+    assert keys.certs() == {"k2": "cert"}
+    assert client.calls == 2
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval(client, monkeypatch):
+    client.responses = [FakeResponse({"k1": "cert"}, "max-age=3600"), FakeResponse({"k2": "cert"}, "max-age=3600")]
+    keys = GooglePublicKeys("https://certs.example")
+    keys.certs("k1")
+    keys.certs("k2")
+    assert client.calls == 1
+
+    now = time.time()
+    monkeypatch.setattr(token_cache.time, "time", lambda: now + token_cache.CERTS_MIN_REFRESH_SECONDS)
+    assert keys.certs("k2") == {"k2": "cert"}
+    assert client.calls == 2
+
+
+def test_failed_refresh_keeps_the_cached_keys(client, monkeypatch):
+    client.responses = [FakeResponse({"k1": "cert"}, "max-age=1"), RuntimeError("offline")]
+    keys = GooglePublicKeys("https://certs.example")
+    keys.certs()
+    now = time.time()
+    monkeypatch.setattr(token_cache.time, "time", lambda: now + 2)
+    assert keys.certs() == {"k1": "cert"}
+
+
+def test_no_keys_at_all_is_an_error(client):
+    client.responses = [RuntimeError("offline")]
+    with pytest.raises(KeysUnavailable):
+        GooglePublicKeys("https://certs.example").certs()
+
+
+def test_profile_expires_with_the_token(monkeypatch):
+    cache = ProfileCache(ttl=300)
+    now = time.time()
+    cache.put("u1", {"name": "Ann"}, token_expires_at=now + 10)
+    cache.put("u2", {"name": "Bob"})
+    assert cache.get("u1") == {"name": "Ann"}
+
+    monkeypatch.setattr(token_cache.time, "time", lambda: now + 11)
+    assert cache.get("u1") is None
+    assert cache.get("u2") == {"name": "Bob"}
+    cache.invalidate("u2")
+    assert cache.get("u2") is None
+
+
+def test_profile_cache_evicts_least_recently_used():
+    cache = ProfileCache(ttl=300, max_entries=2)
+    cache.put("u1", {})
+    cache.put("u2", {})
+    cache.get("u1")
+    cache.put("u3", {})
+    assert cache.get("u2") is None and cache.get("u1") == {} and cache.get("u3") == {}
+
+
+def test_project_id_from_config(monkeypatch):
+    monkeypatch.delenv("FIREBASE_PROJECT_ID", raising=False)
+    assert project_id_from_config({"projectId": "p1", "authDomain": "p2.firebaseapp.com"}) == "p1"
+    assert project_id_from_config({"authDomain": "p2.firebaseapp.com"}) == "p2"
+    assert project_id_from_config({}) is None
+    monkeypatch.setenv("FIREBASE_PROJECT_ID", "p3")
+    assert project_id_from_config({"projectId": "p1"}) == "p3"
@@ -0,0 +1,165 @@
+# token_cache.py
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from google.auth import exceptions as google_auth_exceptions
+from google.auth import jwt
+
+from http_client import get_http_client
+
+# Firebase ID tokens are RS256 JWTs signed with these rotating keys (x509 certificates by kid)
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+FIREBASE_ISSUER_PREFIX = "https://securetoken.google.com/"
+# Used when the certificate response has no Cache-Control max-age
+CERTS_DEFAULT_MAX_AGE_SECONDS = 3600
+# A token with an unknown kid triggers at most one certificate refetch per interval
+CERTS_MIN_REFRESH_SECONDS = 60
+TOKEN_CLOCK_SKEW_SECONDS = int(os.environ.get("TOKEN_CLOCK_SKEW_SECONDS", "10"))
+
+PROFILE_CACHE_SECONDS = float(os.environ.get("PROFILE_CACHE_SECONDS", "300"))
+PROFILE_CACHE_ENTRIES = int(os.environ.get("PROFILE_CACHE_ENTRIES", "4096"))
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class TokenError(ValueError):
+    """The token is malformed, expired, or not issued for this project."""
+
+
+class KeysUnavailable(RuntimeError):
+    """Google's signing certificates could not be fetched."""
+
+
+class GooglePublicKeys:
+    """Google's token signing certificates, cached for as long as Cache-Control allows."""
+
+    def __init__(self, url: str = FIREBASE_CERTS_URL):
+        self.url = url
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self) -> None:
+        try:
+            response = get_http_client(self.url).get(self.url)
+            response.raise_for_status()
+            certs = response.json()
+        except Exception as e:
+            raise KeysUnavailable(f"Could not fetch token signing keys: {e}") from e
+        match = _MAX_AGE.search(response.headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else CERTS_DEFAULT_MAX_AGE_SECONDS
+        now = time.time()
+        self._certs, self._fetched_at, self._expires_at = certs, now, now + max_age
+
+    def certs(self, kid: Optional[str] = None) -> Dict[str, str]:
+        """
+        The current certificates by key id. Refetches once they expire, or
+        early (rate-limited) when `kid` is not among them after a key rotation.
+        """
+        with self._lock:
+            now = time.time()
+            stale = now >= self._expires_at
+            rotated = kid is not None and kid not in self._certs and now - self._fetched_at >= CERTS_MIN_REFRESH_SECONDS
+            if stale or rotated:
+                try:
+                    self._fetch()
+                except KeysUnavailable:
+                    if not self._certs:
+                        raise
+                    # Keep verifying with the keys we have; Google overlaps key rotations
+                    print("Token signing keys refresh failed; using the cached keys.")
+            return self._certs
+
+
+def project_id_from_config(config: Dict[str, Any]) -> Optional[str]:
+    """Firebase project id from the web config (projectId, or the authDomain prefix)."""
+    if os.environ.get("FIREBASE_PROJECT_ID"):
+        return os.environ["FIREBASE_PROJECT_ID"]
+    if config.get("projectId"):
+        return config["projectId"]
+    auth_domain = config.get("authDomain") or ""
+    return auth_domain.split(".", 1)[0] or None
+
+
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens locally (signature, expiry, audience, issuer),
+    replacing a get_account_info round-trip per request. Like the Admin SDK's
+    default, it does not check for revoked sessions.
+    """
+
+    def __init__(self, project_id: str, keys: Optional[GooglePublicKeys] = None,
+                 clock_skew: int = TOKEN_CLOCK_SKEW_SECONDS):
+        self.project_id = project_id
+        self.keys = keys or GooglePublicKeys()
+        self.clock_skew = clock_skew
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Returns the token's claims; raises TokenError if invalid, KeysUnavailable if it cannot tell."""
+        try:
+            header = jwt.decode_header(token)
+        except Exception as e:
+            raise TokenError(f"Malformed token: {e}") from e
+        if header.get("alg") != "RS256" or not header.get("kid"):
+            raise TokenError("Token is not an RS256 token with a key id")
+
+        certs = self.keys.certs(header["kid"])
+        if header["kid"] not in certs:
+            raise TokenError("Token signed with an unknown key")
+        try:
+            claims = jwt.decode(token, certs={header["kid"]: certs[header["kid"]]}, audience=self.project_id,
+                                clock_skew_in_seconds=self.clock_skew)
+        except (ValueError, google_auth_exceptions.GoogleAuthError) as e:
+            raise TokenError(str(e)) from e
+
+        if claims.get("iss") != FIREBASE_ISSUER_PREFIX + self.project_id:
+            raise TokenError("Token has the wrong issuer")
+        if not claims.get("sub") or not isinstance(claims["sub"], str):
+            raise TokenError("Token has no subject")
+        if claims.get("auth_time", 0) > time.time() + self.clock_skew:
+            raise TokenError("Token auth_time is in the future")
+        return claims
+
+
+class ProfileCache:
+    """
+    uid -> profile (e.g. the user's name) with LRU eviction. Each entry lives
+    for PROFILE_CACHE_SECONDS but never past the expiry of the token that
+    loaded it, so a profile is re-read at least once per token lifetime.
+    """
+
+    def __init__(self, ttl: float = PROFILE_CACHE_SECONDS, max_entries: int = PROFILE_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return None
+            if time.time() >= entry[0]:
+                del self._entries[uid]
+                return None
+            self._entries.move_to_end(uid)
+            return entry[1]
+
+    def put(self, uid: str, profile: Dict[str, Any], token_expires_at: Optional[float] = None) -> None:
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._entries[uid] = (expires_at, profile)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, uid: str) -> None:
+        with self._lock:
+            self._entries.pop(uid, None)
@@ -1,16 +1,18 @@
-import pandas as pd
 import numpy as np
-import faiss
-import openai  # Changed from google.generativeai
 from dotenv import load_dotenv
 import os
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 import json
 from typing import Dict, Any
-import requests
-import google.generativeai as genai
-import time
-import threading
+from providers import ProviderRouter, providers_from_env
+from embedding_cache import EmbeddingCache, embedding_key
+from concept_index import ConceptCandidateIndex, CONCEPT_INDEX_PATH
+from question_store import open_question_store, QUESTION_STORE_DIR
+from resources import lazy_resource
+from http_client import get_http_client
+from question_schema import extract_json, normalize_question, is_valid_question
+from llm_cache import open_llm_cache, request_key, cache_mode
+from typing import Callable, List, Optional
 
 # --- Configuration ---
 load_dotenv(dotenv_path=".env")
@@ -18,7 +20,6 @@ load_dotenv(dotenv_path=".env")
 # Use the OpenAI library, but point it to the Together API endpoint
 # The key should be for Together.
 api_key = os.getenv("gemini_key")
-genai.configure(api_key=api_key)
 
 openrouter_api_key = os.getenv("OPENROUTER_API_KEY_2")
 
@@ -27,131 +28,256 @@ togeter_api_key = os.getenv("together_api_key")
 if not openrouter_api_key:
     raise ValueError("OPENROUTER_API_KEY not found in .env file")
 
-client = openai.OpenAI(
-    base_url="https://api.together.xyz/v1",
-    api_key=togeter_api_key,
-)
-
-# --- Global rate limit for Together free model: 0.3 QPM => 1 request per ~200s ---
-REQUEST_INTERVAL_SECONDS = 10.0  # adjust if your per-model limit changes
-_last_request_time = 0.0
-_rate_lock = threading.Lock()
-
-def wait_for_rate_limit():
-    global _last_request_time
-    now = time.time()
-    with _rate_lock:
-        wait = (_last_request_time + REQUEST_INTERVAL_SECONDS) - now
-        if wait > 0:
-            time.sleep(wait)
-        _last_request_time = time.time()
-
-def apply_retry_after(headers):
-    # Respect Retry-After header if provided by server (seconds expected)
-    try:
-        ra = headers.get("retry-after") or headers.get("Retry-After")
-        if ra:
-            secs = float(ra)
-            if secs > 0:
-                time.sleep(secs)
-    except Exception:
-        pass
+# Heavy SDKs, data files and the index are loaded on first use (or by the server's
+# background warm-up) so importing this module stays cheap.
+def _load_router():
+    # Together by default; GENERATION_PROVIDERS adds more providers (see providers.py)
+    return ProviderRouter(providers_from_env())
+
+_router = lazy_resource("llm_router", _load_router)
+# Content-addressed cache of provider responses; LLM_CACHE_MODE=reuse serves repeats from it
+_llm_cache = lazy_resource("llm_cache", open_llm_cache)
+
+def get_router() -> ProviderRouter:
+    return _router.get()
+
+def get_llm_cache():
+    return _llm_cache.get()
 
 # --- Load Data and Index ---
-df = pd.read_csv("question_difficulty_concept.csv")
-# Handle NaNs as in your original script
-text_columns = ['question', 'option1', 'option2', 'option3', 'option4', 'solution', 'explanation', 'difficulty', 'difficulty_prob', 'concept']
-for col in text_columns:
-    df[col] = df[col].fillna('')
+# The question table and the FAISS index are memory-mapped so every gunicorn worker shares
+# one copy through the page cache. The store is converted from the CSV on first start; the
+# index is only mapped when it is an IVF index (see index_builder.MMAP_KINDS).
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+
+def _load_question_store():
+    return open_question_store(os.getenv("QUESTION_STORE_DIR", QUESTION_STORE_DIR),
+                               "question_difficulty_concept.csv")
+
+def _load_index():
+    from index_builder import load_index
+    # The metadata sidecar tells the loader which index type this is (flat, IVF, PQ or HNSW)
+    index = load_index(os.getenv("FAISS_INDEX_PATH", "jee_questions.index"), mmap=FAISS_MMAP)
+    # Search results are row ids into the question store, so both must come from the same CSV
+    rows = len(get_question_store())
+    if index.ntotal != rows:
+        raise RuntimeError(f"FAISS index has {index.ntotal} vectors but the question store has {rows} rows; "
+                           "the index must be rebuilt from the current question CSV.")
+    return index
+
+def _load_concept_candidates():
+    # Precomputed top-N templates per known concept (built by concept_index.py). Ignored if
+    # it was built against a different index.
+    candidates = ConceptCandidateIndex.load(os.getenv("CONCEPT_INDEX_PATH", CONCEPT_INDEX_PATH))
+    if candidates is not None and candidates.index_ntotal != get_index().ntotal:
+        print("Warning: concept candidate index is stale (index size changed); using live search.")
+        return None
+    return candidates
+
+# Concept embeddings never change between papers, so they are served from a persistent
+# memory-mapped table loaded once; misses are embedded in one batched call.
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_TASK_TYPE = "RETRIEVAL_DOCUMENT"
+
+def _load_embedding_cache():
+    return EmbeddingCache(os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache"))
 
-index = faiss.read_index("jee_questions.index")
+_question_store = lazy_resource("question_store", _load_question_store)
+_index = lazy_resource("faiss_index", _load_index)
+_concept_candidates = lazy_resource("concept_candidates", _load_concept_candidates)
+_embedding_cache = lazy_resource("embedding_cache", _load_embedding_cache)
+
+def get_question_store():
+    return _question_store.get()
+
+def get_index():
+    return _index.get()
+
+def get_concept_candidates() -> Optional[ConceptCandidateIndex]:
+    return _concept_candidates.get()
+
+def get_embedding_cache() -> EmbeddingCache:
+    return _embedding_cache.get()
+
+# Embeddings go straight to the Gemini REST API over the shared keep-alive client instead of
+# through the google.generativeai SDK; batchEmbedContents takes up to 100 texts per call.
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+EMBEDDING_BATCH_LIMIT = 100
+
+def _embed_texts(texts: List[str]) -> List[List[float]]:
+    client = get_http_client(GEMINI_API_BASE)
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_LIMIT):
+        chunk = texts[start:start + EMBEDDING_BATCH_LIMIT]
+        response = client.post(
+            f"{GEMINI_API_BASE}/{EMBEDDING_MODEL}:batchEmbedContents",
+            headers={"x-goog-api-key": api_key or ""},
+            json={"requests": [
+                {"model": EMBEDDING_MODEL, "content": {"parts": [{"text": t}]}, "taskType": EMBEDDING_TASK_TYPE}
+                for t in chunk
+            ]},
+        )
+        response.raise_for_status()
+        vectors.extend(e["values"] for e in response.json()["embeddings"])
+    return vectors
 
 # --- Core Functions (Updated for OpenAI/OpenRouter) ---
-def get_embedding(text):
-    """Generates an embedding for a given text."""
+def get_embeddings(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Returns one embedding per text (None where embedding failed). Cached texts
+    cost nothing; all misses go to the provider in a single batched request.
+    """
+    keys = [embedding_key(EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, t) for t in texts]
+    embedding_cache = get_embedding_cache()
+    results = [None if v is None else v.tolist() for v in embedding_cache.get_many(keys)]
+
+    missing = {}
+    for i, (key, vec) in enumerate(zip(keys, results)):
+        if vec is None:
+            missing.setdefault(key, []).append(i)
+    if not missing:
+        return results
+
+    miss_texts = [texts[positions[0]] for positions in missing.values()]
     try:
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text,
-            task_type="RETRIEVAL_DOCUMENT"
-        )
-        return result['embedding']
+        embeddings = _embed_texts(miss_texts)
     except Exception as e:
-        print(f"An error occurred while generating embedding: {e}")
-        return None
+        print(f"An error occurred while generating embeddings: {e}")
+        return results
 
-def search_questions_for_concept(concept: str, num_questions: int = 3) -> pd.DataFrame:
-    """Searches for questions based on a concept string."""
-    query_embedding = get_embedding(concept)
-    if query_embedding is None:
-        return pd.DataFrame()
+    for (key, positions), embedding in zip(missing.items(), embeddings):
+        embedding_cache.put(key, embedding)
+        for i in positions:
+            results[i] = embedding
+    embedding_cache.flush()
+    return results
 
-    query_embedding = np.array([query_embedding]).astype('float32')
-    distances, indices = index.search(query_embedding, num_questions)
+def get_embedding(text):
+    """Generates an embedding for a given text."""
+    return get_embeddings([text])[0]
 
-    return df.iloc[indices[0]]
+def prefetch_embeddings(texts: List[str]) -> None:
+    """Warms the embedding cache for a whole paper's concepts in one batched call."""
+    get_embeddings(list(dict.fromkeys(texts)))
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
-def generate_similar_question(original_question_text: str, difficulty: str, concept: str) -> Dict[str, Any]:
+def search_questions_for_concepts(concepts: Dict[str, int]) -> Dict[str, np.ndarray]:
     """
-    Generates a similar question using Together via OpenAI client, including options, answer,
-    and explanation, and returns it as a structured dictionary. Enforces ~1 request per 200s.
+    Finds template row ids for many concepts at once. `concepts` maps a concept to
+    the number of templates wanted. Known concepts are sampled from the precomputed
+    candidates; the rest are embedded in one batch and searched with a single
+    multi-query FAISS call using the largest k. Concepts that could not be
+    embedded map to an empty array.
     """
-    print(f"--- Generating new structured question for: {concept} (Difficulty: {difficulty}) ---")
+    concept_candidates = get_concept_candidates()
+    results: Dict[str, np.ndarray] = {}
+    live = []
+    for concept, k in concepts.items():
+        if k <= 0:
+            results[concept] = np.empty(0, dtype=np.int64)
+            continue
+        sampled_ids = concept_candidates.sample(concept, k) if concept_candidates is not None else None
+        if sampled_ids is not None:
+            results[concept] = sampled_ids
+        else:
+            live.append(concept)
 
-    prompt = f"""
-    Based on the following original JEE question, generate a *new*, *similar* JEE question.
-    Ensure the new question tests the same core concept and maintains a similar difficulty level.
-    Do not just rephrase the original question; create a genuinely new problem.
+    if not live:
+        return results
 
-    Original Question:
-    "{original_question_text}"
+    embeddings = get_embeddings(live)
+    queries = [(c, e) for c, e in zip(live, embeddings) if e is not None]
+    for c, e in zip(live, embeddings):
+        if e is None:
+            results[c] = np.empty(0, dtype=np.int64)
+    if not queries:
+        return results
 
-    Concept: {concept}
-    Difficulty: {difficulty}
+    index = get_index()
+    query_matrix = np.array([e for _, e in queries], dtype=np.float32)
+    max_k = min(max(concepts[c] for c, _ in queries), index.ntotal)
+    distances, indices = index.search(query_matrix, max_k)
 
-    Your response MUST be a single, valid JSON object. Do not include any text or markdown formatting before or after the JSON.
-    The JSON object must have these exact keys:
+    for (concept, _), row_ids in zip(queries, indices):
+        row_ids = row_ids[row_ids >= 0]
+        results[concept] = row_ids[:concepts[concept]]
+    return results
+
+def search_questions_for_concept(concept: str, num_questions: int = 3) -> List[Dict[str, str]]:
+    """Searches for questions based on a concept string and returns them as row dicts."""
+    row_ids = search_questions_for_concepts({concept: num_questions})[concept]
+    return get_question_store().rows_for(row_ids)
+
+def get_template(row_id: int) -> Dict[str, Any]:
+    """Returns the fields of a template row needed for generation."""
+    return get_question_store().row(row_id, ("question", "difficulty", "concept"))
+
+# Rough output size of one generated question, used to reserve token budget up front
+EXPECTED_TOKENS_PER_QUESTION = 500
+
+# Shared by the single and the batched prompt
+QUESTION_KEYS_SPEC = """
     - "question_text": The text of the new question.
     - "options": A dictionary with four keys ("A", "B", "C", "D") and their string values.
     - "correct_answer": A string of the correct option key (e.g., "C").
-    - "explanation": A brief explanation for the solution.
+    - "explanation": A brief explanation for the solution."""
 
-    Example Response:
-    {{
+EXAMPLE_QUESTION_JSON = """{
       "question_text": "A particle of mass 'm' is executing uniform circular motion on a path of radius 'r'. If its speed is 'v' and kinetic energy is 'E', what is its angular momentum?",
-      "options": {{
+      "options": {
         "A": "E*r / (2*v)",
         "B": "2*E*r / v",
         "C": "2*E*v / r",
         "D": "E*v / (2*r)"
-      }},
+      },
       "correct_answer": "B",
       "explanation": "Kinetic energy E = (1/2)mv^2. Angular momentum L = mvr. From the energy equation, m = 2E/v^2. Substituting into L gives L = (2E/v^2) * v * r = 2Er/v."
-    }}
+    }"""
+
+def _complete_json(prompt: str, timeout: float = 120, expected_questions: int = 1,
+                   validate: Optional[Callable[[Any], Any]] = None,
+                   cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Sends one JSON-mode chat completion through the provider router (which
+    applies each provider's rate limits) and returns the parsed response,
+    consulting the response cache first. `validate` turns the parsed JSON into
+    the result (raising if it is unusable) and `cache_if` decides whether the
+    response is good enough to cache. Raises on any failure so the caller's
+    tenacity policy can retry.
     """
+    import openai
+
+    completion_request = dict(
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},  # Enforce JSON output
+        temperature=0.7,
+    )
+    router = get_router()
+    mode = cache_mode()
+    cache_key = request_key({**completion_request, "models": router.models()})
+    if mode == "reuse":
+        cached = get_llm_cache().get(cache_key)
+        if cached is not None:
+            print("    Served from the LLM response cache.")
+            parsed = extract_json(cached)
+            return validate(parsed) if validate else parsed
+
+    # ~4 characters per token for the prompt, plus the expected completion
+    estimated_tokens = len(prompt) / 4 + EXPECTED_TOKENS_PER_QUESTION * expected_questions
     try:
-        # Enforce the model's 0.3 QPM rate limit
-        wait_for_rate_limit()
-
-        response = client.chat.completions.create(
-            model="lgai/exaone-3-5-32b-instruct",  # Specify model
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},  # Enforce JSON output
-            temperature=0.7,
-            timeout=120
-        )
+        # The chosen provider waits for a request slot and enough token budget
+        response = router.complete(completion_request, timeout=timeout, estimated_tokens=estimated_tokens)
 
-        json_response_text = response.choices[0].message.content
-        return json.loads(json_response_text)
+        json_response_text = response.text
+        result = extract_json(json_response_text)
+        if validate:
+            result = validate(result)
+        # Only valid responses are cached, so a retry after a bad answer asks the provider again
+        if mode != "off" and (cache_if is None or cache_if(result)):
+            get_llm_cache().put(cache_key, json_response_text)
+        return result
 
     except openai.RateLimitError as e:
-        # If headers are available, respect Retry-After; then re-raise to let tenacity retry
-        try:
-            headers = getattr(e, "headers", {}) or {}
-            apply_retry_after(headers)
-        except Exception:
-            pass
+        # The provider has already taken Retry-After into its budget; re-raise to let tenacity retry
         print(f"Rate limited (429). Will retry: {e}")
         raise
 
@@ -159,14 +285,92 @@ def generate_similar_question(original_question_text: str, difficulty: str, conc
         print(f"An error occurred during structured question generation with OpenRouter/Together: {e}. Retrying...")
         raise  # Re-raise to trigger tenacity's retry mechanism
 
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
+def generate_similar_question(original_question_text: str, difficulty: str, concept: str,
+                              avoid: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Generates a similar question through the provider router, including options, answer,
+    and explanation, and returns it as a validated dictionary (see question_schema).
+    An answer that fails the schema is retried on its own; it is never returned.
+    `avoid` is an earlier question the new one must differ from; it is part of the
+    prompt, so regenerations never hit the cached answer they are replacing.
+    """
+    print(f"--- Generating new structured question for: {concept} (Difficulty: {difficulty}) ---")
+
+    avoid_hint = f"""
+    The new question must also be clearly different from this earlier one (do not reuse its setup or numbers):
+    "{avoid}"
+""" if avoid else ""
+
+    prompt = f"""
+    Based on the following original JEE question, generate a *new*, *similar* JEE question.
+    Ensure the new question tests the same core concept and maintains a similar difficulty level.
+    Do not just rephrase the original question; create a genuinely new problem.
+
+    Original Question:
+    "{original_question_text}"
+
+    Concept: {concept}
+    Difficulty: {difficulty}
+{avoid_hint}
+    Your response MUST be a single, valid JSON object. Do not include any text or markdown formatting before or after the JSON.
+    The JSON object must have these exact keys:{QUESTION_KEYS_SPEC}
+
+    Example Response:
+    {EXAMPLE_QUESTION_JSON}
+    """
+    return _complete_json(prompt, validate=normalize_question)
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(3))
+def generate_similar_questions(templates: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Batched variant of generate_similar_question: one request for several
+    templates, so the instruction block and the example are sent once.
+    `templates` are dicts with "question", "difficulty" and "concept". Returns
+    one raw item per template (None where the model returned fewer items);
+    callers validate each item and regenerate only the ones that fail. The
+    response is cached only when every item is valid.
+    """
+    print(f"--- Generating {len(templates)} new structured questions in one request ---")
+
+    originals = "\n".join(
+        f'    {i + 1}. Concept: {t.get("concept", "")} | Difficulty: {t.get("difficulty", "")}\n'
+        f'       "{t.get("question", "")}"'
+        for i, t in enumerate(templates)
+    )
+    prompt = f"""
+    Based on each of the following {len(templates)} original JEE questions, generate a *new*, *similar* JEE question.
+    Every new question must test the same core concept as its original and keep its difficulty level.
+    Do not just rephrase the originals; create genuinely new problems, all different from each other.
+
+    Original Questions:
+{originals}
+
+    Your response MUST be a single, valid JSON object. Do not include any text or markdown formatting before or after the JSON.
+    The JSON object must have one key, "questions": an array of exactly {len(templates)} objects, in the same order
+    as the original questions. Each object must have these exact keys:{QUESTION_KEYS_SPEC}
+
+    Example of one array item:
+    {EXAMPLE_QUESTION_JSON}
+    """
+    def split_items(response):
+        # JSON mode only allows an object at the top level, so the array is wrapped in "questions"
+        items = response.get("questions") if isinstance(response, dict) else response
+        if not isinstance(items, list):
+            raise ValueError("Batched response has no 'questions' array")
+        return [items[i] if i < len(items) else None for i in range(len(templates))]
+
+    return _complete_json(prompt, timeout=120 + 30 * len(templates), expected_questions=len(templates),
+                          validate=split_items, cache_if=lambda items: all(map(is_valid_question, items)))
+
 # --- Example Usage (remains the same) ---
 if __name__ == '__main__':
     # Find some questions related to "Kinematics"
     retrieved_questions = search_questions_for_concept("Kinematics", num_questions=1)
 
-    if not retrieved_questions.empty:
+    if retrieved_questions:
         # Select the first retrieved question as a base
-        original_question = retrieved_questions.iloc[0]
+        original_question = retrieved_questions[0]
 
         # Generate a new, similar question
         new_question_data = generate_similar_question(